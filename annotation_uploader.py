@@ -0,0 +1,168 @@
+import json
+import time
+import random
+import logging
+import threading
+
+import dtlpy as dl
+
+from media_uploader import NON_RETRYABLE_EXCEPTIONS
+from run_report import StageExecutor, sdk_call, add_bytes
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+def annotation_size(annotation) -> int:
+    """
+    Approximate request body bytes of an annotation, a json dict or a `dl.Annotation`.
+    """
+    if isinstance(annotation, dict):
+        return len(json.dumps(annotation, default=str))
+    definition = annotation.annotation_definition
+    payload = {"label": definition.label, "attributes": definition.attributes,
+               "coordinates": definition.to_coordinates(color=None), "metadata": annotation.metadata}
+    # Video annotations carry their coordinates in every frame of the track
+    return len(json.dumps(payload, default=str)) * max(1, len(getattr(annotation, 'frames', None) or dict()))
+
+
+class AnnotationBatch:
+    def __init__(self, index: int, annotations: list, num_bytes: int):
+        self.index = index
+        self.annotations = annotations
+        self.num_bytes = num_bytes
+        self.attempts = 0
+
+
+class AnnotationUploader:
+    """
+    Uploads the annotations of an item in batches bounded by size and count, on a worker pool, with retries.
+
+    With a `SyncManifest`, every uploaded batch is checkpointed under "<key>/batch/<index>". A re-run of the
+    same annotations after a failure uploads the missing batches only, instead of replacing everything.
+    The batching only depends on the annotations order and the limits, so the batches of a re-run match.
+
+    :param max_batch_bytes: approximate request body bytes of a batch, a larger single annotation is sent alone
+    :param max_batch_annotations: annotations of a batch
+    :param num_workers: concurrent upload calls
+    :param max_retries: retries of a failed batch, with an exponential backoff of `backoff_factor` seconds
+    """
+
+    def __init__(self,
+                 max_batch_bytes: int = 4 * 1024 * 1024,
+                 max_batch_annotations: int = 1000,
+                 num_workers: int = 4,
+                 max_retries: int = 3,
+                 backoff_factor: float = 1.0):
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_annotations = max(1, max_batch_annotations)
+        self.num_workers = max(1, num_workers)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.uploaded_batches = 0
+        self.skipped_batches = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self) -> str:
+        return f"batches:{self.max_batch_bytes}:{self.max_batch_annotations}"
+
+    def batches(self, annotations: list) -> list:
+        """
+        Split the annotations in order. Json dicts and `dl.Annotation` entities are never mixed in a batch.
+        """
+        batches = list()
+        current, current_bytes = list(), 0
+        for annotation in annotations:
+            num_bytes = annotation_size(annotation=annotation)
+            if len(current) > 0 and (len(current) >= self.max_batch_annotations or
+                                     current_bytes + num_bytes > self.max_batch_bytes or
+                                     isinstance(annotation, dict) != isinstance(current[0], dict)):
+                batches.append(AnnotationBatch(index=len(batches), annotations=current, num_bytes=current_bytes))
+                current, current_bytes = list(), 0
+            current.append(annotation)
+            current_bytes += num_bytes
+        if len(current) > 0:
+            batches.append(AnnotationBatch(index=len(batches), annotations=current, num_bytes=current_bytes))
+        return batches
+
+    def _upload_batch(self, item: dl.Item, batch: AnnotationBatch):
+        for attempt in range(self.max_retries + 1):
+            batch.attempts += 1
+            try:
+                with sdk_call(name="annotations.upload"):
+                    item.annotations.upload(batch.annotations)
+            except NON_RETRYABLE_EXCEPTIONS:
+                raise
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                delay = self.backoff_factor * (2 ** attempt) * (1 + random.random())
+                logger.warning(msg=f"Upload of annotations batch {batch.index} ({len(batch.annotations)} annotations) "
+                                   f"failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            add_bytes(num_bytes=batch.num_bytes)
+            with self._lock:
+                self.uploaded_batches += 1
+            return
+
+    def upload(self, item: dl.Item, annotations: list, manifest=None, key: str = None, digest: str = None,
+               batches: list = None):
+        """
+        Upload `annotations` to `item`. With a `manifest`, `key` and `digest` identify the annotations: the
+        checkpointed batches of the same digest are skipped, otherwise the existing annotations of the item
+        are replaced.
+
+        :param batches: the `batches` of `annotations`, if already split
+        """
+        batches = batches if batches is not None else self.batches(annotations=annotations)
+        pending = batches
+        if manifest is not None:
+            batch_digest = f"{digest}|{self.signature}"
+            pending = [batch for batch in batches
+                       if not manifest.skip(key=f"{key}/batch/{batch.index}", digest=batch_digest)]
+            self.skipped_batches += len(batches) - len(pending)
+            if len(pending) == len(batches):
+                # Nothing of these annotations was uploaded, replace the annotations of the previous import
+                manifest.discard(prefix=f"{key}/batch/")
+                filters = dl.Filters(resource=dl.FiltersResource.ANNOTATION, use_defaults=False)
+                with sdk_call(name="annotations.delete"):
+                    item.annotations.delete(filters=filters)
+            else:
+                logger.info(msg=f"Resuming annotations upload of '{key}': "
+                                f"{len(batches) - len(pending)}/{len(batches)} batches already uploaded")
+
+        def _upload(batch: AnnotationBatch):
+            self._upload_batch(item=item, batch=batch)
+            if manifest is not None:
+                manifest.record(key=f"{key}/batch/{batch.index}", digest=batch_digest, num_bytes=batch.num_bytes)
+                manifest.checkpoint()
+
+        errors = list()
+        with StageExecutor(max_workers=self.num_workers) as executor:
+            futures = {executor.submit(_upload, batch): batch for batch in pending}
+            for future, batch in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append((batch, e))
+        if len(errors) > 0:
+            raise dl.exceptions.PlatformException(
+                error="400",
+                message=f"Failed to upload {len(errors)}/{len(batches)} annotation batches of item {item.id}, "
+                        f"first error: {errors[0][1]}"
+            )
+        if manifest is not None:
+            manifest.discard(prefix=f"{key}/batch/")
+        logger.info(msg=f"Uploaded {len(annotations)} annotations in {len(pending)} batches "
+                        f"({len(batches) - len(pending)} already uploaded)")
+
+    def report(self) -> dict:
+        return {
+            "uploaded_batches": self.uploaded_batches,
+            "skipped_batches": self.skipped_batches,
+            "retries": self.retries
+        }
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend, FakeAnnotations
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+from benchmarks.bench_parser import BenchParser
+
+
+class FailingAnnotations:
+    """
+    Makes the annotation upload calls after the first `fail_after` ones fail, while `failing` is set.
+    """
+
+    def __init__(self, fail_after: int):
+        self.fail_after = fail_after
+        self.failing = True
+        self.uploads = 0
+        self._lock = threading.Lock()
+        self._upload = FakeAnnotations.upload
+
+    def __enter__(self):
+        failing_annotations = self
+
+        def upload(annotations_repository, annotations):
+            with failing_annotations._lock:
+                failing_annotations.uploads += 1
+                uploads = failing_annotations.uploads
+            if failing_annotations.failing and uploads > failing_annotations.fail_after:
+                raise ConnectionError("Connection reset")
+            return failing_annotations._upload(annotations_repository, annotations)
+
+        FakeAnnotations.upload = upload
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        FakeAnnotations.upload = self._upload
+
+
+def run_import(zip_filepath: str, dataset: FakeDataset, annotation_options: dict) -> (float, dict):
+    dataset.backend.calls.clear()
+    lidar_parser = BenchParser(enable_ir_cameras="false", enable_rgb_cameras="false", enable_rgb_highres_cameras="true",
+                               extraction_mode="stream", remote_root="/sequence", annotation_options=annotation_options)
+    lidar_parser.scene_provider.enable_cache = False
+    error = None
+    try:
+        lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)[:80]}"
+    stage = next(stage for stage in lidar_parser.run_report.to_dict()['stages'] if stage['name'] == 'lidar_annotations')
+    frames_item = dataset.items.by_filepath['/sequence/frames.json']
+    return stage['wall_time'], dict(annotation_calls=stage['calls'].get('annotations.upload', dict()).get('count', 0),
+                                    annotation_bytes=stage['bytes'],
+                                    annotations=len(frames_item.annotations.uploaded),
+                                    error=error,
+                                    **lidar_parser.annotation_uploader.report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-call vs. batched concurrent lidar annotations upload")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--polylines', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per SDK call")
+    parser.add_argument('--bandwidth', type=float, default=2 * 2 ** 20, help="request bytes per second per call")
+    parser.add_argument('--max-request-bytes', type=int, default=4 * 2 ** 20,
+                        help="larger requests time out, like the platform gateway")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=20, num_polylines=args.polylines,
+                               polyline_points=50)
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      default_file_size=1024)
+        single_call = {"max_batch_bytes": 2 ** 40, "max_batch_annotations": 10 ** 9, "num_workers": 1,
+                       "max_retries": 0}
+        batched = {"max_batch_bytes": 1024 * 1024, "max_batch_annotations": 500, "num_workers": 4,
+                   "max_retries": 0}
+
+        def _backend(max_request_bytes: int = None):
+            return FakeBackend(latency=args.latency, bandwidth=args.bandwidth, max_request_bytes=max_request_bytes)
+
+        for name, options in [("single call", single_call), ("batched", batched)]:
+            duration, report = run_import(zip_filepath=zip_filepath, dataset=FakeDataset(backend=_backend()),
+                                          annotation_options=options)
+            print(f"{name}: {duration:.2f}s, {report}")
+            expected_annotations = report['annotations']
+
+        duration, report = run_import(zip_filepath=zip_filepath,
+                                      dataset=FakeDataset(backend=_backend(max_request_bytes=args.max_request_bytes)),
+                                      annotation_options=single_call)
+        print(f"single call, {args.max_request_bytes} bytes request limit: {duration:.2f}s, {report}")
+
+        # Connection lost half way through the batches, the re-run only sends the missing ones
+        dataset = FakeDataset(backend=_backend())
+        with FailingAnnotations(fail_after=3) as failing_annotations:
+            duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset,
+                                          annotation_options=dict(batched, num_workers=1))
+            print(f"batched, interrupted: {duration:.2f}s, {report}")
+            failing_annotations.failing = False
+            duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset,
+                                          annotation_options=dict(batched, num_workers=1))
+            print(f"batched, resumed: {duration:.2f}s, {report}")
+        assert report['error'] is None, report['error']
+        assert report['annotations'] == expected_annotations, (report['annotations'], expected_annotations)
+        duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset, annotation_options=batched)
+        print(f"batched, re-run unchanged: {duration:.2f}s, {report}")
+        assert report['annotation_calls'] == 0 and report['annotations'] == expected_annotations
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
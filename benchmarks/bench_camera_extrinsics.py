@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_converter import FixTransformation
+from benchmarks.synthetic_scene import generate_scene
+
+
+def fix_camera_transformation_uncached(quaternion: np.ndarray, position: np.ndarray):
+    # The previous implementation: rebuild the fix matrix and round-trip through scipy on every call
+    rotation_matrix = np.identity(4)
+    rotation_matrix[0:3, 0:3] = Rotation.from_quat(quaternion).as_matrix()
+    rotation_fix = FixTransformation.rotate_system(theta_y=90, theta_z=-90, radians=False)
+    rotation_matrix = rotation_matrix @ rotation_fix
+    translation_matrix = np.identity(4)
+    translation_matrix[0:3, 3] = position.tolist()
+    extrinsic_matrix = translation_matrix @ rotation_matrix
+    return extrinsic_matrix[0:3, 3], Rotation.as_quat(Rotation.from_matrix(extrinsic_matrix[0:3, 0:3]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Camera extrinsics fix: per call vs. memoized vs. batched")
+    parser.add_argument('--frames', type=int, default=1000)
+    args = parser.parse_args()
+
+    scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=0)
+    extrinsics = [sensor_reference.sensor.extrinsics
+                  for frame in scene.frames.values()
+                  for sensor_uid, sensor_reference in frame.sensors.items() if sensor_uid != 'lidar']
+    quaternions = np.array([[e.quat.x, e.quat.y, e.quat.z, e.quat.w] for e in extrinsics])
+    positions = np.array([[e.pos.x, e.pos.y, e.pos.z] for e in extrinsics])
+
+    start = time.perf_counter()
+    expected = [fix_camera_transformation_uncached(quaternion=q, position=p) for q, p in zip(quaternions, positions)]
+    uncached_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    memoized = [FixTransformation.fix_camera_transformation(quaternion=q, position=p)
+                for q, p in zip(quaternions, positions)]
+    memoized_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    translations, rotations = FixTransformation.fix_camera_transformations(quaternions=quaternions,
+                                                                           positions=positions)
+    batched_time = time.perf_counter() - start
+
+    identical = all(
+        np.array_equal(t, list(mt.values())) and np.array_equal(r, list(mr.values()))
+        for (t, r), (mt, mr) in zip(expected, memoized)
+    ) and np.array_equal(np.array([t for t, _ in expected]), translations) and \
+        np.array_equal(np.array([r for _, r in expected]), rotations)
+    print(f"{len(extrinsics)} camera extrinsics: per call {uncached_time * 1e3:.1f}ms, "
+          f"memoized {memoized_time * 1e3:.1f}ms, batched {batched_time * 1e3:.1f}ms, identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
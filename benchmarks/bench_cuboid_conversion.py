@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import argparse
+import dtlpy as dl
+import raillabel
+from scipy.spatial.transform import Rotation
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_converter import LidarCustomParser
+from benchmarks.synthetic_scene import generate_scene
+
+
+def convert_per_object(cuboids: list) -> list:
+    # The previous conversion: one `Rotation` and one `as_euler` call per cuboid
+    annotation_definitions = list()
+    for annotation, label, attributes in cuboids:
+        rotation = Rotation.from_quat([annotation.quat.x, annotation.quat.y, annotation.quat.z, annotation.quat.w])
+        annotation_definitions.append(dl.Cube3d(
+            label=label,
+            position=[annotation.pos.x, annotation.pos.y, annotation.pos.z],
+            scale=[annotation.size.x, annotation.size.y, annotation.size.z],
+            rotation=rotation.as_euler(seq="xyz", degrees=False),
+            attributes=attributes
+        ))
+    return annotation_definitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-object vs. batched cuboid conversion")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--tracks', type=int, default=500)
+    args = parser.parse_args()
+
+    scene = generate_scene(num_frames=args.frames, cameras=[], num_cuboid_tracks=args.tracks)
+    cuboids = [(annotation, annotation.object.type, dict())
+               for frame in scene.frames.values() for annotation in frame.annotations.values()
+               if isinstance(annotation, raillabel.format.Cuboid)]
+
+    start = time.process_time()
+    per_object = convert_per_object(cuboids=cuboids)
+    per_object_time = time.process_time() - start
+
+    start = time.process_time()
+    batched = LidarCustomParser.convert_cuboids(cuboids=cuboids)
+    batched_time = time.process_time() - start
+
+    identical = all(a.to_coordinates() == b.to_coordinates() and a.label == b.label
+                    for a, b in zip(per_object, batched))
+    print(f"{len(cuboids)} cuboids: per-object {per_object_time:.2f}s CPU, batched {batched_time:.2f}s CPU "
+          f"({per_object_time / batched_time:.1f}x), identical output: {identical}")
+
+
+if __name__ == '__main__':
+    main()
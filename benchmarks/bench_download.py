@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import ArchiveCache, RangedDownloader, file_sha256
+from benchmarks.range_http_server import RangeHTTPServer
+
+
+def bench_single_connection(url: str, filepath: str) -> float:
+    # The previous `_download_zip`: one connection, 8 KiB chunks
+    start = time.perf_counter()
+    with requests.get(url, stream=True) as r:
+        r.raise_for_status()
+        with open(filepath, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                f.write(chunk)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single connection vs. ranged, cached and resumed downloads")
+    parser.add_argument('--size', type=int, default=256 * 2 ** 20, help="archive size in bytes")
+    parser.add_argument('--bandwidth', type=float, default=64 * 2 ** 20, help="bytes per second per connection")
+    parser.add_argument('--connections', type=int, default=8)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        serve_dir = os.path.join(work_dir, 'serve')
+        os.makedirs(serve_dir)
+        archive_filepath = os.path.join(serve_dir, 'data.zip')
+        with open(archive_filepath, 'wb') as f:
+            f.write(os.urandom(args.size))
+        expected_sha256 = file_sha256(filepath=archive_filepath)
+
+        with RangeHTTPServer(directory=serve_dir, bandwidth=args.bandwidth) as server:
+            url = f"{server.url}/data.zip"
+            duration = bench_single_connection(url=url, filepath=os.path.join(work_dir, 'single.zip'))
+            print(f"single connection: {duration:.2f}s ({args.size / duration / 2 ** 20:.1f} MiB/s)")
+
+            cache = ArchiveCache(cache_dir=os.path.join(work_dir, 'cache'))
+            downloader = RangedDownloader(cache=cache, num_connections=args.connections,
+                                          segment_size=args.size // (2 * args.connections))
+            start = time.perf_counter()
+            downloader.download(url=url, expected_sha256=expected_sha256)
+            duration = time.perf_counter() - start
+            print(f"ranged ({args.connections} connections): {duration:.2f}s "
+                  f"({args.size / duration / 2 ** 20:.1f} MiB/s)")
+
+            start = time.perf_counter()
+            downloader.download(url=url)
+            print(f"cache hit: {time.perf_counter() - start:.3f}s")
+
+        # Every connection of the first attempt is dropped half way through its segment
+        segment_size = args.size // (2 * args.connections)
+        with RangeHTTPServer(directory=serve_dir, bandwidth=args.bandwidth,
+                             drop_after_bytes=segment_size // 2, drops=args.connections) as server:
+            url = f"{server.url}/data.zip"
+            cache = ArchiveCache(cache_dir=os.path.join(work_dir, 'cache_resume'))
+            downloader = RangedDownloader(cache=cache, num_connections=args.connections,
+                                          segment_size=segment_size, backoff_factor=0.1)
+            start = time.perf_counter()
+            filepath = downloader.download(url=url, expected_sha256=expected_sha256)
+            duration = time.perf_counter() - start
+            resumed = sum(1 for _, start, _ in server.requests if start % segment_size != 0)
+            print(f"with {args.connections} dropped connections: {duration:.2f}s, "
+                  f"{resumed} segments resumed mid-way, "
+                  f"checksum ok: {file_sha256(filepath=filepath) == expected_sha256}")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
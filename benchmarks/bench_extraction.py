@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from zipfile import ZipFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_archive import SceneArchive
+from scene_provider import SceneProvider
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+ALL_CAMERAS = ['ir_center', 'ir_left', 'ir_right',
+               'rgb_center', 'rgb_left', 'rgb_right',
+               'rgb_highres_center', 'rgb_highres_left', 'rgb_highres_right']
+
+
+def bench_full(zip_filepath: str, path: str) -> float:
+    start = time.perf_counter()
+    with ZipFile(zip_filepath, 'r') as zip_object:
+        zip_object.extractall(path=path)
+    return time.perf_counter() - start
+
+
+def bench_selective(zip_filepath: str, path: str, sensors: list, stream: bool) -> (float, dict):
+    start = time.perf_counter()
+    with SceneArchive(zip_filepath=zip_filepath) as archive:
+        archive.extract(members=archive.scene_members(), path=path)
+        scene = SceneProvider(enable_cache=False).get_scene(data_path=path)
+        members = archive.sensor_members(scene=scene, sensors=sensors)
+        if stream:
+            for member in members:
+                archive.read_member(member=member)
+        else:
+            archive.extract(members=members, path=path)
+        report = archive.report()
+    return time.perf_counter() - start, report
+
+
+def disk_usage(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs. selective vs. streaming zip extraction")
+    parser.add_argument('--frames', type=int, default=20)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, cameras=ALL_CAMERAS, num_cuboid_tracks=10)
+        sizes = {camera: 3 * 2 ** 20 if 'highres' in camera else 512 * 1024 for camera in ALL_CAMERAS}
+        sizes['lidar'] = 4 * 2 ** 20
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'data.zip'),
+                                      sensor_file_sizes=sizes)
+        sensors = ['lidar', 'rgb_highres_center', 'rgb_highres_left', 'rgb_highres_right']
+
+        path = os.path.join(work_dir, 'full')
+        duration = bench_full(zip_filepath=zip_filepath, path=path)
+        print(f"full: {duration:.2f}s, scratch disk: {disk_usage(path) / 2 ** 20:.1f} MiB")
+
+        for stream in [False, True]:
+            path = os.path.join(work_dir, f'stream_{stream}')
+            duration, report = bench_selective(zip_filepath=zip_filepath, path=path, sensors=sensors, stream=stream)
+            print(f"{'stream' if stream else 'selective'}: {duration:.2f}s, "
+                  f"scratch disk: {disk_usage(path) / 2 ** 20:.1f} MiB, "
+                  f"skipped: {report['skipped_bytes'] / 2 ** 20:.1f} MiB ({100 * report['skipped_ratio']:.1f}%)")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
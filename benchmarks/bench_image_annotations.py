@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_converter import LidarCustomParser
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene
+
+
+def create_frames_item(dataset: FakeDataset, num_frames: int, num_cameras: int):
+    frames = list()
+    for frame in range(num_frames):
+        images = list()
+        for idx in range(num_cameras):
+            buffer = BytesIO(b'\x89PNG')
+            buffer.name = f"{idx}.png"
+            image_item = dataset.items.upload(local_path=buffer, remote_path=f"/frames/{frame}",
+                                              remote_name=f"{idx}.png")
+            images.append({"image_id": image_item.id})
+        frames.append({"images": images})
+    buffer = BytesIO(json.dumps({"frames": frames}).encode())
+    buffer.name = "frames.json"
+    return dataset.items.upload(local_path=buffer, remote_name="frames.json")
+
+
+def run_stage(data_path: str, num_frames: int, latency: float, workers: int, bulk_lookup: bool) -> (float, dict):
+    dataset = FakeDataset(backend=FakeBackend(latency=0))
+    frames_item = create_frames_item(dataset=dataset, num_frames=num_frames, num_cameras=3)
+    dataset.backend.latency = latency
+    dataset.backend.calls.clear()
+
+    parser = LidarCustomParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                               enable_rgb_highres_cameras="true", annotation_workers=workers)
+    parser.scene_provider.enable_cache = False
+    parser.attributes_id_mapping_dict = dict()
+    if not bulk_lookup:
+        # The previous lookup: one `items.get` call per image
+        parser.get_items_by_ids = lambda dataset, item_ids: {
+            item_id: dataset.items.get(item_id=item_id) for item_id in item_ids
+        }
+    start = time.perf_counter()
+    parser.upload_pre_annotation_images(frames_item=frames_item, data_path=data_path)
+    return time.perf_counter() - start, dict(dataset.backend.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs. bulk and concurrent image annotation upload")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per SDK call")
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        data_path = os.path.join(work_dir, 'data')
+        save_scene(scene=generate_scene(num_frames=args.frames, num_cuboid_tracks=0, num_bboxes=5),
+                   data_path=data_path)
+        for name, workers, bulk_lookup in [("serial, per-image get", 1, False),
+                                           (f"bulk lookup, {args.workers} workers", args.workers, True)]:
+            duration, calls = run_stage(data_path=data_path, num_frames=args.frames, latency=args.latency,
+                                        workers=workers, bulk_lookup=bulk_lookup)
+            print(f"{name}: {duration:.2f}s, calls: {calls}")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raillabel
+from PIL import Image
+from custom_converter import LidarCustomParser
+from scene_archive import SceneArchive
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+OPTIONS = [
+    ("original png", None),
+    ("jpeg q90", {"image_format": "jpeg", "quality": 90}),
+    ("jpeg q85, 2048 px", {"image_format": "jpeg", "quality": 85, "max_size": 2048}),
+    ("webp q80, 2048 px", {"image_format": "webp", "quality": 80, "max_size": 2048}),
+]
+
+
+def check_scaling(lidar_parser: LidarCustomParser, scene, uploaded: dict):
+    # The uploaded images have the size the annotations and the intrinsics are scaled to
+    for lidar_frame, frame in enumerate(scene.frames.values()):
+        for idx, camera in enumerate(lidar_parser.camera_list):
+            sensor = frame.sensors[camera].sensor
+            ext = lidar_parser.image_extension(uri=frame.sensors[camera].uri)
+            with Image.open(BytesIO(uploaded[f"/frames/{lidar_frame}/{idx}{ext}"])) as image:
+                scale_x, scale_y = lidar_parser.image_scale(sensor=sensor)
+                assert image.size == (round(sensor.intrinsics.width_px * scale_x),
+                                      round(sensor.intrinsics.height_px * scale_y))
+        for annotation in frame.annotations.values():
+            if isinstance(annotation, raillabel.format.Bbox):
+                scale_x, scale_y = lidar_parser.image_scale(sensor=annotation.sensor)
+                right = (annotation.pos.x + annotation.size.x / 2) * scale_x
+                assert right <= annotation.sensor.intrinsics.width_px * scale_x + 1e-6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Original vs. transcoded camera images upload")
+    parser.add_argument('--frames', type=int, default=6)
+    parser.add_argument('--bandwidth', type=float, default=20 * 2 ** 20, help="upload link bytes per second")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=0, num_bboxes=3)
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      default_file_size=1024, images=True)
+        for name, options in OPTIONS:
+            if options is not None:
+                options = dict(options, num_workers=args.workers)
+            # A single shared link: the upload calls are served one at a time
+            dataset = FakeDataset(backend=FakeBackend(latency=0.005, bandwidth=args.bandwidth, max_concurrency=1))
+            lidar_parser = LidarCustomParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                                             enable_rgb_highres_cameras="true", extraction_mode="stream",
+                                             incremental=False, image_options=options)
+            lidar_parser.scene_provider.enable_cache = False
+            with SceneArchive(zip_filepath=zip_filepath) as archive:
+                data_path = lidar_parser.extract_zip_file(zip_filepath=zip_filepath, archive=archive,
+                                                          members=archive.scene_members())
+                try:
+                    start = time.perf_counter()
+                    lidar_parser.upload_pcds_and_images(data_path=data_path, dataset=dataset, archive=archive)
+                    duration = time.perf_counter() - start
+                finally:
+                    shutil.rmtree(path=data_path, ignore_errors=True)
+            uploaded = dataset.items.uploaded
+            check_scaling(lidar_parser=lidar_parser, scene=scene, uploaded=uploaded)
+            image_bytes = sum(len(data) for path, data in uploaded.items() if path.startswith('/frames'))
+            line = f"{name}: {image_bytes / 2 ** 20:.1f} MiB of images uploaded in {duration:.2f}s"
+            if lidar_parser.image_transcoder is not None:
+                report = lidar_parser.image_transcoder.report()
+                line += (f", {report['saved_bytes'] / 2 ** 20:.1f} MiB saved, "
+                         f"{report['images_per_sec']:.2f} images/s")
+            print(line)
+        print(f"{os.cpu_count()} cores, image sizes and box scaling verified")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the service must not import before its first import call
+DEFERRED_MODULES = ["custom_converter", "dtlpylidar", "raillabel", "scipy.spatial", "numba", "pcd_preprocessor"]
+
+WARMUP_SCRIPT = """
+import sys, time
+import numpy as np
+from pcd_preprocessor import PcdPreprocessor
+from benchmarks.synthetic_scene import generate_pcd
+
+data = generate_pcd(num_points=20000)
+preprocessor = PcdPreprocessor(data_format="binary_compressed", voxel_size=0.05)
+start = time.perf_counter()
+if sys.argv[1] == "background":
+    preprocessor.warmup(background=True)
+# The archive download
+time.sleep(float(sys.argv[2]))
+process_start = time.perf_counter()
+preprocessor.process(data=data)
+print(time.perf_counter() - start, time.perf_counter() - process_start)
+"""
+
+
+def _run(args: list, env: dict = None) -> subprocess.CompletedProcess:
+    env = dict(os.environ, **(env or dict()))
+    env['PYTHONPATH'] = os.pathsep.join([REPO_DIR] + [path for path in [env.get('PYTHONPATH')] if path])
+    return subprocess.run([sys.executable] + args, cwd=tempfile.gettempdir(), env=env, capture_output=True, text=True,
+                          check=True)
+
+
+def import_times(module: str) -> dict:
+    """
+    `-X importtime` of a fresh interpreter importing `module`.
+
+    :return: dict of module name to (self, cumulative) seconds
+    """
+    result = _run(args=['-X', 'importtime', '-c', f'import {module}'])
+    times = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the service module and the PCD kernels warm up")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--download-time', type=float, default=10.0, help="seconds of the simulated download")
+    parser.add_argument('--max-overhead', type=float, default=0.15,
+                        help="seconds of `import dataset_loader` over `import dtlpy`, fails above it")
+    args = parser.parse_args()
+
+    runs = [import_times(module='dataset_loader') for _ in range(args.repeats)]
+    total = statistics.median(run['dataset_loader'][1] for run in runs)
+    dtlpy = statistics.median(run['dtlpy'][1] for run in runs)
+    print(f"import dataset_loader: {total:.3f}s, dtlpy: {dtlpy:.3f}s, overhead: {total - dtlpy:.3f}s "
+          f"(median of {args.repeats})")
+    print(f"  {'module':<40}{'cumulative s':>14}")
+    slowest = sorted(runs[0].items(), key=lambda item: item[1][1], reverse=True)
+    for name, (_, cumulative) in [item for item in slowest if '.' not in item[0]][:args.top]:
+        print(f"  {name:<40}{cumulative:>14.3f}")
+
+    failures = list()
+    imported = [name for name in DEFERRED_MODULES if any(module == name or module.startswith(name + '.')
+                                                         for module in runs[0])]
+    if len(imported) > 0:
+        failures.append(f"imported at the service start: {imported}")
+    if total - dtlpy > args.max_overhead:
+        failures.append(f"import overhead {total - dtlpy:.3f}s > {args.max_overhead}s")
+
+    start = time.perf_counter()
+    _run(args=['-c', 'import dataset_loader; dataset_loader.DatasetLidarOSDAR()._lidar_parser()'])
+    print(f"fresh interpreter to the first parser: {time.perf_counter() - start:.2f}s")
+
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for name, mode, cache in [("cold cache, no warm up", "none", "cold"),
+                                  ("cold cache, background warm up", "background", "cold"),
+                                  ("warm cache, no warm up", "none", "warm")]:
+            if cache == "cold":
+                shutil.rmtree(path=cache_dir, ignore_errors=True)
+            result = _run(args=['-c', WARMUP_SCRIPT, mode, str(args.download_time)],
+                          env={'NUMBA_CACHE_DIR': cache_dir})
+            total_time, first_file = map(float, result.stdout.split())
+            print(f"{name}: first PCD after the download {first_file:.2f}s, "
+                  f"download + first PCD {total_time:.2f}s")
+    finally:
+        shutil.rmtree(path=cache_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
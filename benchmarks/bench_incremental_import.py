@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raillabel
+from benchmarks.bench_parser import BenchParser
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+
+class FailingItems:
+    """
+    Wraps the fake items repository, the `failures` upload calls after the first `fail_after` ones fail.
+    """
+
+    def __init__(self, items, fail_after: int, failures: int):
+        self.items = items
+        self.fail_after = fail_after
+        self.failures = failures
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def upload(self, *args, **kwargs):
+        with self._lock:
+            self.uploads += 1
+            uploads = self.uploads
+        if self.fail_after < uploads <= self.fail_after + self.failures:
+            raise ConnectionError("Connection reset")
+        return self.items.upload(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.items, name)
+
+
+def run_import(zip_filepath: str, dataset: FakeDataset, incremental: bool = True) -> (float, dict):
+    dataset.backend.calls.clear()
+    parser = BenchParser(enable_ir_cameras="false", enable_rgb_cameras="false", enable_rgb_highres_cameras="true",
+                         extraction_mode="stream", remote_root="/sequence", incremental=incremental,
+                         upload_options={"max_retries": 0})
+    parser.scene_provider.enable_cache = False
+    start = time.perf_counter()
+    try:
+        parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+    except Exception as e:
+        print(f"  import interrupted: {type(e).__name__}")
+    duration = time.perf_counter() - start
+    report = parser.manifest.report() if parser.manifest is not None else dict()
+    return duration, dict(calls=dataset.backend.total_calls, **report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full re-import vs. manifest based incremental re-import")
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds per SDK call")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=10, num_bboxes=3)
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      default_file_size=256 * 1024)
+        dataset = FakeDataset(backend=FakeBackend(latency=args.latency))
+
+        for name, incremental in [("first import", True), ("re-import, no manifest", False),
+                                  ("re-import, unchanged", True)]:
+            duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset, incremental=incremental)
+            print(f"{name}: {duration:.2f}s, {report}")
+
+        # A label fix in a single frame
+        frame = list(scene.frames.values())[args.frames // 2]
+        bbox = next(annotation for annotation in frame.annotations.values()
+                    if isinstance(annotation, raillabel.format.Bbox))
+        bbox.size.x += 10
+        save_scene_zip(scene=scene, zip_filepath=zip_filepath, default_file_size=256 * 1024)
+        duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset)
+        print(f"re-import, one box fixed: {duration:.2f}s, {report}")
+
+        # Media files deleted from the dataset since the last import
+        deleted = [filepath for filepath in dataset.items.by_filepath if filepath.endswith(".pcd")][:5]
+        for filepath in deleted:
+            del dataset.items.by_id[dataset.items.by_filepath.pop(filepath).id]
+        duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset)
+        restored = all(filepath in dataset.items.by_filepath for filepath in deleted)
+        print(f"re-import, {len(deleted)} files deleted: {duration:.2f}s, {report}, restored: {restored}")
+
+        # An import interrupted half way through the media, then resumed
+        dataset = FakeDataset(backend=FakeBackend(latency=args.latency))
+        dataset.items = FailingItems(items=dataset.items, fail_after=args.frames // 2, failures=8)
+        duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset)
+        print(f"interrupted import: {duration:.2f}s, {report}")
+        duration, report = run_import(zip_filepath=zip_filepath, dataset=dataset)
+        print(f"resumed import: {duration:.2f}s, {report}")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
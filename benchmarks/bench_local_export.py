@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import functools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_export import EXPORT_ID_PATTERN, ExportDataset, bulk_upload
+from sequence_scheduler import SequenceScheduler, sequence_name
+from benchmarks.bench_parser import BenchParser
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+PARSER_OPTIONS = dict(enable_ir_cameras="false", enable_rgb_cameras="false", enable_rgb_highres_cameras="true",
+                      extraction_mode="stream")
+
+
+def convert(source: str, dataset, incremental: bool = True):
+    parser = BenchParser(remote_root=f"/{sequence_name(source=source)}", incremental=incremental, **PARSER_OPTIONS)
+    parser.scene_provider.enable_cache = False
+    return parser.custom_parse_data(zip_filepath=source, lidar_dataset=dataset)
+
+
+def export_sequence(source: str, limits, progress, export_dir: str) -> str:
+    # `dataset_loader.export_sequence` with the `parse_data` stand-in
+    from dataset_loader import load_ontology
+
+    dataset = ExportDataset(path=export_dir, name=sequence_name(source=source),
+                            ontology=load_ontology(filename="osdar_ontology.json"))
+    try:
+        return convert(source=source, dataset=dataset).filename
+    finally:
+        dataset.save()
+
+
+def contents(dataset: FakeDataset) -> dict:
+    """
+    :return: the annotations count of every item of the dataset, by filepath, but the sync manifests
+    """
+    return {filepath: len(item.annotations.uploaded) for filepath, item in dataset.items.by_filepath.items()
+            if "/.dataloop/sync/" not in filepath}
+
+
+def check_references(dataset: FakeDataset):
+    """
+    Every id of the uploaded items and annotations is an id of the dataset.
+    """
+    ids = set(dataset.items.by_id) | {dataset.id}
+    for item in dataset.items.by_id.values():
+        texts = [json.dumps(annotation, default=str) for annotation in item.annotations.uploaded]
+        if item.filename.endswith(".json"):
+            texts.append(item.data.decode())
+        for text in texts:
+            unknown = set(EXPORT_ID_PATTERN.findall(text)) - ids
+            assert len(unknown) == 0, f"'{item.filename}' references unknown ids: {sorted(unknown)[:3]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live import vs. a local export and a bulk upload of the export")
+    parser.add_argument('--sequences', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--upload-workers', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per SDK call")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        sources = list()
+        for i in range(args.sequences):
+            scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=10, num_bboxes=3, num_seg3d=2,
+                                   num_polylines=2, seed=i)
+            sources.append(save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, f"{i}_sequence.zip"),
+                                          default_file_size=256 * 1024))
+        num_frames = args.sequences * args.frames
+
+        live = FakeDataset(backend=FakeBackend(latency=args.latency))
+        start = time.perf_counter()
+        for source in sources:
+            convert(source=source, dataset=live)
+        live_time = time.perf_counter() - start
+        print(f"live import, one sequence at a time: {live_time:.2f}s ({num_frames / live_time:.1f} frames/s), "
+              f"{live.backend.total_calls} calls")
+
+        export_dir = os.path.join(work_dir, "export")
+        start = time.perf_counter()
+        SequenceScheduler(num_workers=args.workers).run(
+            sources=sources, target=functools.partial(export_sequence, export_dir=export_dir))
+        export_time = time.perf_counter() - start
+        export_bytes = sum(os.path.getsize(os.path.join(root, filename))
+                           for root, _, filenames in os.walk(export_dir) for filename in filenames)
+        print(f"export, {args.workers} processes: {export_time:.2f}s ({num_frames / export_time:.1f} frames/s), "
+              f"{export_bytes / 2 ** 20:.1f} MiB, no calls")
+
+        uploaded = FakeDataset(backend=FakeBackend(latency=args.latency))
+        report = bulk_upload(path=export_dir, dataset=uploaded, num_workers=args.upload_workers)
+        print(f"bulk upload, {args.upload_workers} workers: {report['seconds']:.2f}s "
+              f"({num_frames / report['seconds']:.1f} frames/s), {uploaded.backend.total_calls} calls, "
+              f"{report['items']} items ({report['rewritten_items']} rewritten), {report['annotations']} annotations")
+
+        assert contents(dataset=uploaded) == contents(dataset=live), "bulk upload differs from the live import"
+        check_references(dataset=uploaded)
+        print("bulk upload matches the live import, every reference resolved")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pcd_preprocessor import PcdPreprocessor
+from pcd_tiling import LodTiler
+from benchmarks.synthetic_scene import generate_pcd
+
+
+def check_tiles(original: bytes, outputs: list):
+    """
+    The tiles of a frame are a partition of its points, and the levels up to `l` have at most a point per cell
+    of the level `l` grid.
+    """
+    _, points = PcdPreprocessor.read(data=original)
+    index = json.loads(outputs[-1][1])
+    tiles = {path: PcdPreprocessor.read(data=data)[1] for path, data in outputs[:-1]}
+    assert index['points'] == len(points) == sum(len(tile) for tile in tiles.values())
+    key = ['timestamp', 'x', 'y', 'z']
+    assert np.array_equal(np.sort(np.concatenate(list(tiles.values())), order=key), np.sort(points, order=key))
+    low = np.array(index['min'])
+    preview = list()
+    for level in index['levels'][:-1]:
+        preview += [tiles[tile['path']] for tile in level['tiles']]
+        xyz = np.concatenate([np.stack([tile[axis] for axis in 'xyz'], axis=1) for tile in preview])
+        cells = np.floor((xyz - low) / level['spacing']).astype(np.int64)
+        assert len(np.unique(cells, axis=0)) == len(cells), f"level {level['level']} repeats a cell"
+        for tile in level['tiles']:
+            tile_xyz = np.stack([tiles[tile['path']][axis] for axis in 'xyz'], axis=1)
+            assert np.allclose(tile_xyz.min(axis=0), tile['min']) and np.allclose(tile_xyz.max(axis=0), tile['max'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Level-of-detail tiling of the lidar frames")
+    parser.add_argument('--frames', type=int, default=16)
+    parser.add_argument('--points', type=int, default=400000)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--tile-depth', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    # The uploaded clouds, after a binary_compressed preprocessing
+    frames = [PcdPreprocessor.write(points=PcdPreprocessor.read(data=generate_pcd(num_points=args.points,
+                                                                                  seed=seed))[1],
+                                    data_format="binary_compressed")
+              for seed in range(args.frames)]
+    tiler = LodTiler(levels=args.levels, tile_depth=args.tile_depth, num_workers=args.workers)
+    # Compile the PCD kernels outside of the measurements
+    tiler.process(data=frames[0], path="lidar/0.pcd")
+    check_tiles(original=frames[0], outputs=tiler.process(data=frames[0], path="lidar/0.pcd"))
+    print("tiles partition the cloud: ok")
+
+    _, points = PcdPreprocessor.read(data=frames[0])
+    xyz = np.stack([points[axis] for axis in 'xyz'], axis=1)
+    durations = list()
+    for _ in range(5):
+        start = time.perf_counter()
+        tiler.build(xyz=xyz)
+        durations.append(time.perf_counter() - start)
+    print(f"index build: {args.points / min(durations) / 1e6:.1f}M points/s ({1000 * min(durations):.1f} ms per frame)")
+
+    tiler = LodTiler(levels=args.levels, tile_depth=args.tile_depth, num_workers=args.workers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=tiler.num_workers) as executor:
+        outputs = list(executor.map(lambda item: tiler.process(data=item[1], path=f"lidar/{item[0]}.pcd"),
+                                    enumerate(frames)))
+    duration = time.perf_counter() - start
+    report = tiler.report()
+    print(f"{args.frames} frames x {args.points} points, {tiler.num_workers} workers: {duration:.2f}s, "
+          f"{report['points'] / duration / 1e6:.1f}M points/s with the tile encoding, "
+          f"{report['tiles'] / args.frames:.1f} tiles per frame")
+
+    full_bytes = sum(len(frame) for frame in frames) / args.frames
+    index = json.loads(outputs[0][-1][1])
+    sizes = {path: len(data) for path, data in outputs[0]}
+    loaded = sizes[LodTiler.index_path(path="lidar/0.pcd")]
+    for level in index['levels']:
+        loaded += sum(sizes[tile['path']] for tile in level['tiles'])
+        print(f"  levels <= {level['level']}: {loaded / 2 ** 10:8.1f} KiB "
+              f"({100 * loaded / full_bytes:5.1f}% of the PCD), {level['spacing']:.2f} m spacing")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from unittest import mock
+
+from mapping_format import write_mapping, expand_mapping
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import OSDAR_CAMERAS, generate_scene, save_scene_zip
+
+# What `LidarFileMappingParser.parse_data` reads of a mapping.json, by frame and by image
+FRAME_FIELDS = ["path", "timestamp", "position", "heading", "images"]
+IMAGE_FIELDS = {"image_path": None, "timestamp": None, "intrinsics": ["fx", "fy", "cx", "cy"],
+                "extrinsics": ["translation", "rotation"], "distortion": ["k1", "k2", "k3", "p1", "p2"]}
+
+
+def calibrations(cameras: list, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    return {camera: {
+        "intrinsics": {"fx": rnd.uniform(1000, 5000), "fy": rnd.uniform(1000, 5000),
+                       "cx": rnd.uniform(500, 2000), "cy": rnd.uniform(500, 1500)},
+        "extrinsics": {"translation": {axis: rnd.uniform(-3, 3) for axis in "xyz"},
+                       "rotation": {axis: rnd.uniform(-1, 1) for axis in "xyzw"}},
+        "distortion": {name: rnd.uniform(-0.1, 0.1) for name in ["k1", "k2", "k3", "p1", "p2"]}
+    } for camera in cameras}
+
+
+def frames(num_frames: int, cameras: list, table: dict, shared: bool):
+    """
+    Yield the mapping frames of `create_mapping_json`.
+    """
+    for lidar_frame in range(num_frames):
+        timestamp = 1631441453.0 + lidar_frame / 10
+        frame = {
+            "metadata": {"frame": lidar_frame, "sensor_uri": f"/lidar/{lidar_frame:03d}_{timestamp:.6f}.pcd"},
+            "path": f"lidar/{lidar_frame}.pcd",
+            "timestamp": timestamp,
+            "position": {"x": 0.0, "y": 0.0, "z": 0.0},
+            "heading": {"x": 0.0, "y": 0.0, "z": 0.0, "w": 1.0},
+            "images": dict()
+        }
+        for idx, camera in enumerate(cameras):
+            image = {
+                "metadata": {"frame": lidar_frame, "image_uri": f"/{camera}/{lidar_frame:03d}_{timestamp:.6f}.png"},
+                "image_path": f"frames/{lidar_frame}/{idx}.png",
+                "timestamp": timestamp + 0.001 * idx
+            }
+            if shared:
+                image["calibration"] = camera
+            else:
+                image.update(table[camera])
+            frame["images"][str(idx)] = image
+        yield frame
+
+
+def previous(filepath: str, num_frames: int, cameras: list, table: dict):
+    # The previous `create_mapping_json`: the whole mapping in memory, then dumped with an indent
+    mapping_data = {"frames": {str(lidar_frame): frame for lidar_frame, frame in
+                               enumerate(frames(num_frames=num_frames, cameras=cameras, table=table, shared=False))}}
+    with open(filepath, "w") as f:
+        json.dump(obj=mapping_data, fp=f, indent=4)
+
+
+def streamed(filepath: str, num_frames: int, cameras: list, table: dict, shared: bool):
+    with open(filepath, "wb") as f:
+        write_mapping(fp=f, frames=frames(num_frames=num_frames, cameras=cameras, table=table, shared=shared),
+                      calibrations=table if shared else None)
+
+
+def measure(write, filepath: str) -> (float, int, float, dict):
+    """
+    :return: seconds and peak traced memory of the write, seconds to read the mapping as `parse_data` does,
+    and the read mapping
+    """
+    start = time.perf_counter()
+    write(filepath)
+    write_time = time.perf_counter() - start
+    # Again for the memory, tracing slows the write down
+    tracemalloc.start()
+    write(filepath)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    with open(filepath) as f:
+        mapping = expand_mapping(mapping=json.load(f))
+    return write_time, peak, time.perf_counter() - start, mapping
+
+
+def read_as_parse_data(mapping_item) -> dict:
+    """
+    Stand-in for the dtlpylidar `parse_data`, narrowed to its calls on the mapping item: `download` to memory
+    and the frame and image fields of the mapping.
+    """
+    mapping = json.loads(mapping_item.download(save_locally=False).getvalue())
+    assert mapping_item.dataset is not None and mapping_item.filename.endswith("mapping.json")
+    for frame in mapping["frames"].values():
+        assert all(field in frame for field in FRAME_FIELDS), sorted(frame)
+        for image in frame["images"].values():
+            for field, keys in IMAGE_FIELDS.items():
+                assert field in image and all(key in image[field] for key in keys or list()), (field, sorted(image))
+    return mapping
+
+
+def check_parse_data_contract(work_dir: str):
+    """
+    The mapping `parse_data` reads from a "shared" mapping.json is the one of a "frames" mapping.json.
+    """
+    import custom_converter
+    from scene_archive import SceneArchive
+
+    scene = generate_scene(num_frames=5, num_cuboid_tracks=0, num_bboxes=1)
+    zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, "sequence.zip"),
+                                  default_file_size=1024)
+    read = dict()
+    for mapping_format in ["frames", "shared"]:
+        lidar_parser = custom_converter.LidarCustomParser(
+            enable_ir_cameras="false", enable_rgb_cameras="false", enable_rgb_highres_cameras="true",
+            extraction_mode="stream", incremental=False, mapping_format=mapping_format)
+        lidar_parser.scene_provider.enable_cache = False
+        dataset = FakeDataset(backend=FakeBackend(latency=0))
+        with SceneArchive(zip_filepath=zip_filepath) as archive:
+            data_path = lidar_parser.extract_zip_file(zip_filepath=zip_filepath, archive=archive,
+                                                      members=archive.scene_members())
+            try:
+                mapping_item = lidar_parser.create_mapping_json(data_path=data_path, dataset=dataset)
+            finally:
+                shutil.rmtree(path=data_path, ignore_errors=True)
+        with mock.patch.object(custom_converter.LidarFileMappingParser, "parse_data",
+                               lambda self, mapping_item: read_as_parse_data(mapping_item=mapping_item)):
+            read[mapping_format] = lidar_parser.parse_data(mapping_item=mapping_item)
+        # Also saved locally, like a `download()` without arguments
+        if mapping_format == "shared":
+            with open(custom_converter.ExpandedMappingItem(item=mapping_item).download(
+                    local_path=os.path.join(work_dir, "mapping.json"))) as f:
+                assert json.load(f) == read["frames"]
+    assert read["shared"] == read["frames"], "parse_data reads a different mapping from the shared format"
+    num_images = sum(len(frame["images"]) for frame in read["frames"]["frames"].values())
+    print(f"parse_data contract: {len(read['frames']['frames'])} frames, {num_images} images, shared == frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mapping.json size, write and read time by format")
+    parser.add_argument('--frames', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--cameras', type=int, default=len(OSDAR_CAMERAS))
+    args = parser.parse_args()
+
+    cameras = OSDAR_CAMERAS[:args.cameras]
+    table = calibrations(cameras=cameras)
+    work_dir = tempfile.mkdtemp()
+    try:
+        check_parse_data_contract(work_dir=work_dir)
+        for num_frames in args.frames:
+            print(f"{num_frames} frames x {len(cameras)} cameras:")
+            expected = None
+            for name, write in [
+                ("previous, indent=4", lambda path: previous(path, num_frames, cameras, table)),
+                ("frames, streamed", lambda path: streamed(path, num_frames, cameras, table, shared=False)),
+                ("shared, streamed", lambda path: streamed(path, num_frames, cameras, table, shared=True))
+            ]:
+                filepath = os.path.join(work_dir, "mapping.json")
+                write_time, peak, read_time, mapping = measure(write=write, filepath=filepath)
+                if expected is None:
+                    expected = mapping
+                assert mapping == expected, f"{name} mapping differs"
+                print(f"  {name:<20}: {os.path.getsize(filepath) / 2 ** 20:7.2f} MiB, write {write_time:6.3f}s "
+                      f"(peak {peak / 2 ** 20:6.1f} MiB), read {read_time:6.3f}s")
+        print("expanded mappings match")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
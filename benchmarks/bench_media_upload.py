@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from media_uploader import MediaUploader
+from benchmarks.fake_dataloop import FakeItems
+
+
+def create_files(work_dir: str, num_frames: int, num_cameras: int, pcd_size: int, image_size: int) -> list:
+    files = list()
+    for frame in range(num_frames):
+        pcd_filepath = os.path.join(work_dir, f"{frame}.pcd")
+        with open(pcd_filepath, 'wb') as f:
+            f.write(os.urandom(pcd_size))
+        files.append((pcd_filepath, "/lidar", f"{frame}.pcd"))
+        for idx in range(num_cameras):
+            image_filepath = os.path.join(work_dir, f"{frame}_{idx}.png")
+            with open(image_filepath, 'wb') as f:
+                f.write(os.urandom(image_size))
+            files.append((image_filepath, f"/frames/{frame}", f"{idx}.png"))
+    return files
+
+
+def bench_serial(files: list, items: FakeItems) -> float:
+    start = time.perf_counter()
+    for local_path, remote_path, remote_name in files:
+        items.upload(local_path=local_path, remote_path=remote_path, remote_name=remote_name, overwrite=True)
+    return time.perf_counter() - start
+
+
+def bench_engine(files: list, items: FakeItems, num_workers: int, batch_size: int) -> dict:
+    uploader = MediaUploader(items_repository=items, num_workers=num_workers, batch_size=batch_size)
+    for local_path, remote_path, remote_name in files:
+        uploader.submit(local_path=local_path, remote_path=remote_path, remote_name=remote_name)
+    return uploader.wait().to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial uploads vs. the concurrent media upload engine")
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--cameras', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per upload call")
+    parser.add_argument('--bandwidth', type=float, default=200 * 2 ** 20, help="bytes per second per call")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=4)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        files = create_files(work_dir=work_dir, num_frames=args.frames, num_cameras=args.cameras,
+                             pcd_size=2 * 2 ** 20, image_size=2 * 2 ** 20)
+        serial = bench_serial(files=files, items=FakeItems(latency=args.latency, bandwidth=args.bandwidth))
+        print(f"serial: {len(files)} files in {serial:.2f}s ({len(files) / serial:.1f} files/s)")
+        for batch_size in sorted({1, args.batch_size}):
+            items = FakeItems(latency=args.latency, bandwidth=args.bandwidth)
+            report = bench_engine(files=files, items=items, num_workers=args.workers, batch_size=batch_size)
+            print(f"engine (workers={args.workers}, batch={batch_size}): {report['files']} files "
+                  f"in {report['wall_time']:.2f}s ({report['files_per_sec']:.1f} files/s, "
+                  f"{report['bytes_per_sec'] / 2 ** 20:.1f} MiB/s, {report['calls']} calls)")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import functools
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sequence_scheduler import SequenceScheduler, sequence_name
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+
+class NoLimits:
+    @contextlib.contextmanager
+    def network(self):
+        yield
+
+    @contextlib.contextmanager
+    def disk(self, num_bytes: int):
+        yield
+
+
+class PrintProgress:
+    def update(self, progress: int = None, message: str = None, **kwargs):
+        print(f"  progress: {progress}% {message}")
+
+
+def ingest_sequence(source: str, limits, progress, latency: float) -> dict:
+    # The parser stages that run without a platform: scene loading, media upload and cuboid conversion
+    import raillabel
+    from custom_converter import LidarCustomParser
+    from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+
+    dataset = FakeDataset(backend=FakeBackend(latency=latency))
+    parser = LidarCustomParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                               enable_rgb_highres_cameras="true", extraction_mode="stream",
+                               remote_root=f"/{sequence_name(source=source)}")
+    parser.scene_provider.enable_cache = False
+    data_path = parser.extract_zip_file(zip_filepath=source)
+    try:
+        with limits.disk(num_bytes=os.path.getsize(source)):
+            parser.upload_pcds_and_images(data_path=data_path, dataset=dataset, progress=progress)
+            scene = parser.scene_provider.get_scene(data_path=data_path)
+            cuboids = [(annotation, 'person', dict())
+                       for frame in scene.frames.values() for annotation in frame.annotations.values()
+                       if isinstance(annotation, raillabel.format.Cuboid)]
+            parser.convert_cuboids(cuboids=cuboids)
+    finally:
+        shutil.rmtree(path=data_path, ignore_errors=True)
+    return {"items": len(dataset.items.by_id), "folders": sorted({os.path.dirname(os.path.dirname(path))
+                                                                   for path in dataset.items.by_filepath})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One sequence at a time vs. the process pool scheduler")
+    parser.add_argument('--sequences', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per SDK call")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        sources = list()
+        for i in range(args.sequences):
+            scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=20, seed=i)
+            sources.append(save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, f"{i}_sequence.zip"),
+                                          default_file_size=256 * 1024))
+        target = functools.partial(ingest_sequence, latency=args.latency)
+
+        start = time.perf_counter()
+        for source in sources:
+            target(source, NoLimits(), None)
+        print(f"one sequence at a time: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        results = SequenceScheduler(num_workers=args.workers).run(sources=sources, target=target,
+                                                                 progress=PrintProgress())
+        print(f"scheduler ({args.workers} processes, {os.cpu_count()} cores): {time.perf_counter() - start:.2f}s")
+        for name, result in sorted(results.items()):
+            print(f"  {name}: {result}")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import json
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_converter import LidarCustomParser
+
+
+class BenchParser(LidarCustomParser):
+    """
+    `parse_data` comes from dtlpylidar, the stand-in writes the frames.json the image annotations need.
+    """
+
+    def parse_data(self, mapping_item):
+        mapping = json.load(mapping_item.download(save_locally=False))
+        frames = list()
+        for frame in mapping['frames'].values():
+            images = list()
+            for image in frame['images'].values():
+                image_item = mapping_item.dataset.items.get(filepath=f"{self.remote_root}/{image['image_path']}")
+                images.append({"image_id": image_item.id})
+            frames.append({"images": images})
+        buffer = BytesIO(json.dumps({"frames": frames}).encode())
+        buffer.name = "frames.json"
+        frames_item = mapping_item.dataset.items.upload(local_path=buffer, remote_path=self.remote_root or "/",
+                                                        overwrite=True)
+        frames_item.fps = 1
+        return frames_item
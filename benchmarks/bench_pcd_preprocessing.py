@@ -0,0 +1,227 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import raillabel
+import dtlpy as dl
+from custom_converter import LidarCustomParser
+from pcd_preprocessor import PcdPreprocessor, parse_ascii, _parse_ascii, _lzf_compress, _lzf_decompress
+from scene_archive import SceneArchive
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+
+OPTIONS = [
+    ("original ascii", None),
+    ("binary", {"data_format": "binary"}),
+    ("binary_compressed", {"data_format": "binary_compressed"}),
+    ("binary_compressed, x y z intensity", {"data_format": "binary_compressed",
+                                            "keep_fields": ["x", "y", "z", "intensity"]}),
+    ("binary_compressed, x y z intensity, 10 cm voxels", {"data_format": "binary_compressed",
+                                                          "keep_fields": ["x", "y", "z", "intensity"],
+                                                          "voxel_size": 0.1}),
+]
+
+
+def lzf_reference_decompress(data: bytes) -> bytes:
+    # Straight port of liblzf's lzf_decompress, to check the compressed stream against the format itself
+    out = bytearray()
+    ip = 0
+    while ip < len(data):
+        ctrl = data[ip]
+        ip += 1
+        if ctrl < 32:
+            out += data[ip:ip + ctrl + 1]
+            ip += ctrl + 1
+            continue
+        length = ctrl >> 5
+        if length == 7:
+            length += data[ip]
+            ip += 1
+        ref = len(out) - ((ctrl & 0x1f) << 8) - data[ip] - 1
+        ip += 1
+        assert ref >= 0, "back-reference before the output start"
+        for k in range(length + 2):
+            out.append(out[ref + k])
+    return bytes(out)
+
+
+def check_round_trip(rng: np.random.Generator):
+    buffers = [b"", b"a", b"ab", b"abc", b"a" * 1000, bytes(range(256)) * 40, rng.bytes(10000),
+               np.repeat(rng.integers(0, 4, 3000, dtype=np.uint8), rng.integers(1, 300, 3000)).tobytes()]
+    for raw in buffers:
+        compressed = _lzf_compress(np.frombuffer(raw, dtype=np.uint8)).tobytes()
+        assert lzf_reference_decompress(compressed) == raw, f"LZF stream of {len(raw)} bytes"
+        assert _lzf_decompress(np.frombuffer(compressed, dtype=np.uint8), len(raw)).tobytes() == raw
+
+    points = np.zeros(1000, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4'),
+                                   ('timestamp', '<f8'), ('ring', '<u2'), ('normal', '<f4', (3,))])
+    for name in ['x', 'y', 'z', 'intensity', 'normal']:
+        points[name] = rng.normal(0, 50, points[name].shape)
+    points['timestamp'] = 1631441453.123456 + np.arange(len(points)) * 1e-6
+    points['ring'] = rng.integers(0, 128, len(points))
+    points['x'][:3] = [np.nan, np.inf, -np.inf]
+    for data_format in ["ascii", "binary", "binary_compressed"]:
+        for cloud in [points, points[:0], points[:1]]:
+            _, decoded = PcdPreprocessor.read(data=PcdPreprocessor.write(points=cloud, data_format=data_format))
+            for name in cloud.dtype.names:
+                assert np.array_equal(decoded[name], cloud[name], equal_nan=True), f"{data_format} {name}"
+
+    # Leading zeros are not significant digits, and a token of more significant digits than the fast path keeps
+    # is parsed by strtod: every value matches `float`
+    tokens = [b"0.000000000000000000012", b"0.00000000000000000123", b"-0.00000000000000000001", b"0", b"-0",
+              b"000000000000000000000012.5", b"0.1234567890123456789", b"1234567890123456789012",
+              b"0.30000000000000004441", b"1.0000000000000000000000", b"9007199254740993", b"+.5", b"5."]
+    scaled = rng.normal(0, 1, 1000) * 10.0 ** rng.integers(-30, 30, 1000)
+    tokens += [repr(value).encode() for value in scaled.tolist()]
+    tokens += [f"{value:.25f}".encode() for value in rng.normal(0, 1e-3, 1000).tolist()]
+    values = parse_ascii(body=np.frombuffer(b" ".join(tokens), dtype=np.uint8), num_values=len(tokens))
+    for token, value in zip(tokens, values.tolist()):
+        assert value == float(token) and np.signbit(value) == np.signbit(float(token)), f"{token} parsed as {value}"
+    # Short tokens, leading zeros or an exponent aside, never need strtod
+    fast = [b"0.000000000000000000012", b"-0.00000000000000000001", b"000012.5", b"1.5e-3", b"-2E+5", b"0", b".5"]
+    _, fallback, _, _ = _parse_ascii(np.frombuffer(b" ".join(fast), dtype=np.uint8), len(fast))
+    assert len(fallback) == 0, f"{[fast[index] for index in fallback]} parsed by strtod"
+
+
+def check_malformed(rng: np.random.Generator):
+    def rejected(data: bytes) -> bool:
+        try:
+            PcdPreprocessor.read(data=data)
+        except dl.exceptions.BadRequest:
+            return True
+        return False
+
+    points = np.zeros(200, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+    points['x'] = rng.normal(0, 50, len(points))
+    for data_format in ["ascii", "binary", "binary_compressed"]:
+        data = PcdPreprocessor.write(points=points, data_format=data_format)
+        body = data.index(f"DATA {data_format}\n".encode()) + len(data_format) + 6
+        for cut in range(body, len(data) - 1, 7):
+            assert rejected(data=data[:cut]), f"{data_format} truncated at {cut}/{len(data)}"
+        for cut in range(0, body, 5):
+            assert rejected(data=data[:cut]), f"{data_format} header truncated at {cut}"
+
+    # Corrupt LZF streams: flipped bytes decode to other points or are rejected, never out of bounds
+    compressed = PcdPreprocessor.write(points=points, data_format="binary_compressed")
+    body = compressed.index(b"DATA binary_compressed\n") + 23
+    for _ in range(2000):
+        corrupted = bytearray(compressed)
+        for position in rng.integers(body + 8, len(compressed), 3):
+            corrupted[position] = rng.integers(0, 256)
+        rejected(data=bytes(corrupted))
+    for _ in range(2000):
+        garbage = rng.integers(0, 256, rng.integers(0, 64), dtype=np.uint8)
+        decoded = _lzf_decompress(garbage, np.int64(rng.integers(0, 512)))
+        assert len(decoded) <= 512
+
+    header = compressed[:body]
+    sizes = [(len(compressed) - body - 8 + 1, len(points) * 12),    # compressed size past the end
+             (len(compressed) - body - 8, len(points) * 12 + 4),    # raw size of other points
+             (4, 2 ** 31)]                                          # raw size out of the LZF ratio
+    for compressed_size, size in sizes:
+        assert rejected(data=header + np.array([compressed_size, size], dtype='<u4').tobytes() +
+                        compressed[body + 8:])
+
+    ascii_header = PcdPreprocessor.write(points=points[:0], data_format="ascii").replace(b"POINTS 0", b"POINTS 2") \
+        .replace(b"WIDTH 0", b"WIDTH 2")
+    _, decoded = PcdPreprocessor.read(data=ascii_header + b"nan inf -inf\n1e400 -0 +1.5e-3\n")
+    assert np.isnan(decoded['x'][0]) and decoded['y'][0] == np.inf and decoded['z'][0] == -np.inf
+    assert decoded['x'][1] == np.inf and decoded['y'][1] == 0 and decoded['z'][1] == np.float32(1.5e-3)
+    _, decoded = PcdPreprocessor.read(data=ascii_header + b"1 2 abc\n4 5 6\n")
+    assert np.isnan(decoded['z'][0]) and decoded['z'][1] == 6
+    assert rejected(data=ascii_header + b"1 2 3\n4 5\n")
+    for bad_header in [ascii_header.replace(b"FIELDS x y z", b"FIELDS x y"),
+                       ascii_header.replace(b"TYPE F F F", b"TYPE F F X"),
+                       ascii_header.replace(b"SIZE 4 4 4", b"SIZE 4 4 a"),
+                       ascii_header.replace(b"COUNT 1 1 1", b"COUNT 1 1 0"),
+                       ascii_header.replace(b"POINTS 2", b"POINTS -2"),
+                       ascii_header.replace(b"DATA ascii", b"")]:
+        assert rejected(data=bad_header + b"1 2 3\n4 5 6\n"), bad_header
+
+
+def check_frame(original: bytes, uploaded: bytes, point_map, voxel_size: float, segments: list):
+    _, original_points = PcdPreprocessor.read(data=original)
+    _, points = PcdPreprocessor.read(data=uploaded)
+    if point_map is None:
+        for name in points.dtype.names:
+            assert np.array_equal(points[name], original_points[name]), name
+        return
+    # Every original point maps to a kept point of the same voxel
+    voxel = np.floor(np.stack([original_points[axis] for axis in 'xyz'], axis=1).astype(np.float64) / voxel_size)
+    kept_voxel = np.floor(np.stack([points[axis] for axis in 'xyz'], axis=1).astype(np.float64) / voxel_size)
+    assert np.array_equal(voxel, kept_voxel[point_map])
+    for point_ids in segments:
+        assert max(point_ids) < len(points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PCD re-encoding and downsampling before upload")
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--bandwidth', type=float, default=20 * 2 ** 20, help="upload link bytes per second")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(seed=0)
+    check_round_trip(rng=rng)
+    check_malformed(rng=rng)
+    print("round trips and malformed inputs checked")
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, cameras=[], num_cuboid_tracks=0, num_seg3d=5,
+                               num_lidar_points=args.points)
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      pcd_points=args.points)
+        # Compile the numba kernels outside of the measurements
+        PcdPreprocessor(voxel_size=1.0).process(data=PcdPreprocessor.write(
+            points=np.zeros(10, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4')]), data_format="ascii"))
+
+        for name, options in OPTIONS:
+            # A single shared link: the upload calls are served one at a time
+            dataset = FakeDataset(backend=FakeBackend(latency=0.005, bandwidth=args.bandwidth, max_concurrency=1))
+            lidar_parser = LidarCustomParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                                             enable_rgb_highres_cameras="false", extraction_mode="stream",
+                                             incremental=False, pcd_options=options)
+            lidar_parser.scene_provider.enable_cache = False
+            with SceneArchive(zip_filepath=zip_filepath) as archive:
+                data_path = lidar_parser.extract_zip_file(zip_filepath=zip_filepath, archive=archive,
+                                                          members=archive.scene_members())
+                try:
+                    start = time.perf_counter()
+                    lidar_parser.upload_pcds_and_images(data_path=data_path, dataset=dataset, archive=archive)
+                    duration = time.perf_counter() - start
+                    uploaded = dataset.items.uploaded
+                    for lidar_frame, frame in enumerate(scene.frames.values()):
+                        member = SceneArchive.member_name(uri=frame.sensors['lidar'].uri)
+                        segments = [lidar_parser.point_maps[lidar_frame][annotation.point_ids]
+                                    for annotation in frame.annotations.values()
+                                    if isinstance(annotation, raillabel.format.Seg3d)] \
+                            if lidar_frame in lidar_parser.point_maps else list()
+                        check_frame(original=archive._zip_object.read(member),
+                                    uploaded=uploaded[f"/lidar/{lidar_frame}.pcd"],
+                                    point_map=lidar_parser.point_maps.get(lidar_frame, None),
+                                    voxel_size=(options or dict()).get('voxel_size'),
+                                    segments=segments)
+                finally:
+                    shutil.rmtree(path=data_path, ignore_errors=True)
+            total_bytes = sum(len(data) for data in uploaded.values())
+            line = f"{name}: {total_bytes / 2 ** 20:.1f} MiB uploaded in {duration:.2f}s"
+            if lidar_parser.pcd_preprocessor is not None:
+                report = lidar_parser.pcd_preprocessor.report()
+                line += (f", {100 * report['size_ratio']:.1f}% of the original size, "
+                         f"{report['output_points'] / report['input_points'] * 100:.1f}% of the points, "
+                         f"{1000 * report['seconds_per_file']:.1f} ms per frame")
+            print(line)
+        print(f"{os.cpu_count()} cores, round trips verified")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from point_ids_codec import ENCODINGS, encode_ref_item, decode_ref_item, encode_point_ids, decode_point_ids
+
+
+def synthetic_point_ids(rng: np.random.Generator, num_points: int, cloud_size: int, run_length: int) -> list:
+    # Segments of a scan-ordered cloud come as runs of neighbouring ids
+    num_runs = max(1, num_points // run_length)
+    starts = np.sort(rng.choice(cloud_size - run_length, size=num_runs, replace=False))
+    ids = (starts[:, None] + np.arange(run_length)[None, :]).ravel()
+    return np.unique(ids)[:num_points].tolist()
+
+
+def check_round_trip(rng: np.random.Generator):
+    cases = [[], [0], [5, 5, 5], [3, 1, 2], list(range(1000)), rng.integers(0, 2 ** 31 - 1, 5000).tolist()]
+    for point_ids in cases:
+        for encoding in ENCODINGS:
+            decoded = decode_point_ids(data=encode_point_ids(point_ids=point_ids, encoding=encoding),
+                                       encoding=encoding)
+            expected = {"json": point_ids, "delta": sorted(point_ids), "ranges": sorted(set(point_ids))}[encoding]
+            assert decoded.tolist() == expected, f"round trip failed for '{encoding}': {point_ids[:10]}"
+    ref_item = {"type": "index", "frames": {"0": [4, 5, 6, 10], "1": []}}
+    for encoding in ENCODINGS:
+        assert decode_ref_item(json.loads(json.dumps(encode_ref_item(ref_item, encoding=encoding)))) == ref_item
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic reference item size and encode time per encoding")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--points', type=int, default=100000, help="segmented points per frame")
+    parser.add_argument('--cloud-size', type=int, default=2 ** 20, help="points per lidar frame")
+    parser.add_argument('--run-length', type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    check_round_trip(rng=rng)
+    print("round trip: ok")
+
+    ref_item = {"type": "index", "frames": {
+        str(frame): synthetic_point_ids(rng=rng, num_points=args.points, cloud_size=args.cloud_size,
+                                        run_length=args.run_length)
+        for frame in range(args.frames)
+    }}
+    baseline = None
+    for encoding in ENCODINGS:
+        start = time.perf_counter()
+        payload = json.dumps(encode_ref_item(ref_item_json=ref_item, encoding=encoding)).encode()
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        decode_ref_item(ref_item_json=json.loads(payload))
+        decode_time = time.perf_counter() - start
+        baseline = baseline or len(payload)
+        print(f"{encoding:>6}: {len(payload) / 2 ** 20:8.2f} MiB ({len(payload) / baseline:6.1%}), "
+              f"encode {encode_time:.2f}s, decode {decode_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import math
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scipy.spatial.transform import Rotation
+
+from camera_projection import CameraCalibration, ProjectionQA, cuboid_corners
+
+# `FixTransformation.camera_rotation_fix`: RailLabel camera axes (x forward, y left, z up) to x right, y down,
+# z forward
+CAMERA_AXES = np.array([[0, 0, 1], [-1, 0, 0], [0, -1, 0]], dtype=np.float64)
+
+
+def forward_cameras(num_cameras: int, width: int = 4112, height: int = 2504) -> CameraCalibration:
+    """
+    Cameras on the train front, looking ahead with a small yaw each, like the OSDaR23 camera rig.
+    """
+    yaws = np.linspace(-0.4, 0.4, num_cameras)
+    return CameraCalibration(
+        names=[f"camera_{i}" for i in range(num_cameras)],
+        rotations=[Rotation.from_euler('z', yaw).as_matrix() @ CAMERA_AXES for yaw in yaws],
+        translations=[[0.0, 0.2 * i, 3.0] for i in range(num_cameras)],
+        intrinsics=[[4600.0, 4600.0, width / 2, height / 2]] * num_cameras,
+        distortion=[[-0.08, 0.12, 0.0, 0.001, -0.001]] * num_cameras,
+        sizes=[[width, height]] * num_cameras
+    )
+
+
+def synthetic_cuboids(num_frames: int, num_objects: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    num_cuboids = num_frames * num_objects
+    return {
+        "frames": np.repeat(np.arange(num_frames), num_objects),
+        "object_uids": np.tile([f"object_{i:04d}" for i in range(num_objects)], num_frames),
+        "positions": np.stack([rng.uniform(5, 80, num_cuboids), rng.uniform(-10, 10, num_cuboids),
+                               rng.uniform(-1, 1, num_cuboids)], axis=1),
+        "sizes": np.stack([rng.uniform(0.4, 1, num_cuboids), rng.uniform(0.4, 1, num_cuboids),
+                           rng.uniform(1.5, 2, num_cuboids)], axis=1),
+        "quaternions": Rotation.from_euler('z', rng.uniform(-math.pi, math.pi, (num_cuboids, 1))).as_quat()
+    }
+
+
+def project_point(calibration: CameraCalibration, camera: int, point) -> (float, float, float):
+    # Scalar reference of the projection, one point at a time
+    x, y, z = calibration.rotations[camera].T @ (np.asarray(point) - calibration.translations[camera])
+    fx, fy, cx, cy = calibration.intrinsics[camera]
+    k1, k2, k3, p1, p2 = calibration.distortion[camera]
+    x, y = x / z, y / z
+    r2 = min(x * x + y * y, calibration.max_r2[camera])
+    radial = 1 + k1 * r2 + k2 * r2 ** 2 + k3 * r2 ** 3
+    r2 = x * x + y * y
+    x_distorted = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    y_distorted = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    return fx * x_distorted + cx, fy * y_distorted + cy, z
+
+
+def loop_extents(calibration: CameraCalibration, corners: np.ndarray) -> np.ndarray:
+    extents = np.zeros((len(calibration), len(corners), 4))
+    for camera in range(len(calibration)):
+        width, height = calibration.sizes[camera]
+        for i, cuboid_corners_ in enumerate(corners):
+            projected = [project_point(calibration=calibration, camera=camera, point=corner)
+                         for corner in cuboid_corners_]
+            if min(depth for _, _, depth in projected) < 0.5:
+                continue
+            us, vs = [u for u, _, _ in projected], [v for _, v, _ in projected]
+            extents[camera, i] = [min(max(min(us), 0), width), min(max(min(vs), 0), height),
+                                  min(max(max(us), 0), width), min(max(max(vs), 0), height)]
+    return extents
+
+
+def labelled_boxes(qa: ProjectionQA, cuboids: dict, rng: np.random.Generator, drop: float, shift: float) -> dict:
+    """
+    2D boxes of the visible cuboids as a labeller would draw them: a pixel of noise, a `drop` fraction left out and
+    a `shift` fraction misplaced by a box width.
+    """
+    corners = cuboid_corners(positions=cuboids['positions'], sizes=cuboids['sizes'],
+                             quaternions=cuboids['quaternions'])
+    extents, visible = qa.extents(corners=corners)
+    cameras, indices = np.nonzero(visible)
+    keep = rng.uniform(size=len(indices)) >= drop
+    cameras, indices = cameras[keep], indices[keep]
+    boxes = extents[cameras, indices] + rng.normal(scale=1.0, size=(len(indices), 4))
+    shifted = rng.uniform(size=len(indices)) < shift
+    boxes[shifted, 0::2] += (boxes[shifted, 2] - boxes[shifted, 0])[:, None]
+    return {"frames": cuboids['frames'][indices], "cameras": cameras,
+            "object_uids": cuboids['object_uids'][indices], "boxes": boxes}, int(shifted.sum()), int((~keep).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched cuboid to camera projection and 2D box consistency check")
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--objects', type=int, default=50, help="cuboids per frame")
+    parser.add_argument('--cameras', type=int, default=9)
+    parser.add_argument('--loop-cuboids', type=int, default=200, help="cuboids of the scalar reference")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    calibration = forward_cameras(num_cameras=args.cameras)
+    qa = ProjectionQA(calibration=calibration)
+    cuboids = synthetic_cuboids(num_frames=args.frames, num_objects=args.objects)
+
+    corners = cuboid_corners(positions=cuboids['positions'][:args.loop_cuboids],
+                             sizes=cuboids['sizes'][:args.loop_cuboids],
+                             quaternions=cuboids['quaternions'][:args.loop_cuboids])
+    start = time.perf_counter()
+    expected = loop_extents(calibration=calibration, corners=corners)
+    loop_time = (time.perf_counter() - start) / len(corners)
+    extents, _ = qa.extents(corners=corners)
+    assert np.allclose(extents, expected, atol=1e-6), "batched extents differ from the scalar reference"
+    print("scalar reference: ok")
+
+    bboxes, num_shifted, num_dropped = labelled_boxes(qa=qa, cuboids=cuboids, rng=rng, drop=0.05, shift=0.02)
+    report = qa.run(cuboids=cuboids, bboxes=bboxes)
+    num_cuboids = len(cuboids['frames'])
+    print(f"{args.frames} frames x {args.objects} cuboids x {args.cameras} cameras: {report['seconds']:.2f}s "
+          f"({num_cuboids * args.cameras / report['seconds'] / 1e6:.2f}M cuboid projections/s), "
+          f"scalar loop: {loop_time * num_cuboids * args.cameras:.0f}s estimated")
+    print(f"{report['bboxes']} 2D boxes, {report['matched']} matched, mean IoU {report['mean_iou']:.3f}, "
+          f"{report['inconsistent']} inconsistent ({num_shifted} shifted), "
+          f"{report['missing_bboxes']} missing ({num_dropped} dropped)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import ArchiveCache, RangedDownloader
+from scene_archive import SceneArchive
+from remote_archive import RemoteSceneArchive
+from scene_provider import SceneProvider
+from benchmarks.range_http_server import RangeHTTPServer
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip, OSDAR_CAMERAS
+
+# Sensors of the partial imports
+IMPORTS = {
+    "lidar + highres cameras": ['lidar', 'rgb_highres_center', 'rgb_highres_left', 'rgb_highres_right'],
+    "lidar + rgb cameras": ['lidar', 'rgb_center', 'rgb_left', 'rgb_right']
+}
+
+
+def read_sequence(archive: SceneArchive, path: str, sensors: list) -> (float, dict):
+    """
+    Read the scene json and the sensor files of every frame, like the "stream" extraction mode.
+
+    :return: seconds to the first sensor file and the sha1 of every read member
+    """
+    start = time.perf_counter()
+    archive.extract(members=archive.scene_members(), path=path)
+    scene = SceneProvider(enable_cache=False).get_scene(data_path=path)
+    members = archive.sensor_members(scene=scene, sensors=sensors)
+    archive.prefetch(members=members)
+    first_member = None
+    contents = dict()
+    for member in members:
+        buffer = archive.read_member(member=member)
+        if first_member is None:
+            first_member = time.perf_counter() - start
+        contents[member] = hashlib.sha1(buffer.getvalue()).hexdigest()
+    return first_member, contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full download vs. remote zip reading of a partial import")
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--bandwidth', type=float, default=32 * 2 ** 20, help="bytes per second per connection")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per request")
+    parser.add_argument('--connections', type=int, default=8)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        serve_dir = os.path.join(work_dir, 'serve')
+        os.makedirs(serve_dir)
+        scene = generate_scene(num_frames=args.frames, cameras=OSDAR_CAMERAS, num_cuboid_tracks=10)
+        sizes = {camera: 3 * 2 ** 20 if 'highres' in camera else 512 * 1024 for camera in OSDAR_CAMERAS}
+        sizes['lidar'] = 4 * 2 ** 20
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(serve_dir, 'data.zip'),
+                                      sensor_file_sizes=sizes)
+        archive_size = os.path.getsize(zip_filepath)
+        print(f"archive: {archive_size / 2 ** 20:.1f} MiB, {args.frames} frames")
+
+        with RangeHTTPServer(directory=serve_dir, bandwidth=args.bandwidth, latency=args.latency) as server:
+            url = f"{server.url}/data.zip"
+            start = time.perf_counter()
+            downloader = RangedDownloader(cache=ArchiveCache(cache_dir=os.path.join(work_dir, 'cache')),
+                                          num_connections=args.connections)
+            filepath = downloader.download(url=url)
+            download_time = time.perf_counter() - start
+            print(f"download: {download_time:.2f}s, {archive_size / 2 ** 20:.1f} MiB transferred, "
+                  f"{len(server.requests)} requests")
+
+            for name, sensors in IMPORTS.items():
+                start = time.perf_counter()
+                with SceneArchive(zip_filepath=filepath) as archive:
+                    local_first_member, expected = read_sequence(archive=archive, path=os.path.join(work_dir, 'local'),
+                                                                 sensors=sensors)
+                local_time = time.perf_counter() - start
+                shutil.rmtree(path=os.path.join(work_dir, 'local'), ignore_errors=True)
+
+                start = time.perf_counter()
+                with RemoteSceneArchive(url=url, num_connections=args.connections) as archive:
+                    first_member, contents = read_sequence(archive=archive, path=os.path.join(work_dir, 'remote'),
+                                                           sensors=sensors)
+                    report = archive.report()
+                remote_time = time.perf_counter() - start
+                shutil.rmtree(path=os.path.join(work_dir, 'remote'), ignore_errors=True)
+                print(f"{name}:")
+                print(f"  download + stream: {download_time + local_time:.2f}s, "
+                      f"first member after {download_time + local_first_member:.2f}s")
+                print(f"  remote zip: {remote_time:.2f}s, first member after {first_member:.2f}s, "
+                      f"{report['downloaded_bytes'] / 2 ** 20:.1f} MiB transferred "
+                      f"({100 * report['downloaded_bytes'] / archive_size:.1f}%), {report['requests']} requests, "
+                      f"peak buffered {report['peak_buffered_bytes'] / 2 ** 20:.1f} MiB, "
+                      f"members match: {contents == expected}")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
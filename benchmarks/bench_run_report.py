@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_report import RunReport, sdk_call
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+from benchmarks.bench_parser import BenchParser
+
+
+class CountingParser(BenchParser):
+    """
+    Counts the backend calls of the `parse_data` stand-in, which are not instrumented. Only the calls of its
+    thread count, the other stages run alongside it.
+    """
+
+    def parse_frames(self, mapping_item):
+        backend = mapping_item.dataset.backend
+        thread_id = threading.get_ident()
+        call = backend.call
+        self.parse_data_calls = 0
+
+        def _call(*args, **kwargs):
+            if threading.get_ident() == thread_id:
+                self.parse_data_calls += 1
+            return call(*args, **kwargs)
+
+        backend.call = _call
+        try:
+            return super().parse_frames(mapping_item=mapping_item)
+        finally:
+            del backend.call
+
+
+class CountingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = dict()
+
+    def emit(self, record):
+        self.records[record.levelname] = self.records.get(record.levelname, 0) + 1
+
+
+def print_report(report: dict):
+    print(f"{'stage':<20}{'wall s':>8}{'cpu s':>8}{'MiB':>9}{'MiB/s':>8}{'calls':>7}{'p50 ms':>8}{'p99 ms':>8}"
+          f"{'RSS MiB':>9}")
+    for stage in report['stages']:
+        latencies = [call for call in stage['calls'].values()]
+        p50 = max([call['p50'] for call in latencies], default=0.0)
+        p99 = max([call['p99'] for call in latencies], default=0.0)
+        print(f"{stage['name']:<20}{stage['wall_time']:>8.2f}{stage['cpu_time']:>8.2f}"
+              f"{stage['bytes'] / 2 ** 20:>9.1f}{stage['bytes_per_sec'] / 2 ** 20:>8.1f}{stage['sdk_calls']:>7}"
+              f"{1000 * p50:>8.1f}{1000 * p99:>8.1f}{stage['peak_rss'] / 2 ** 20:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level run report of an import against the fake backend")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per SDK call")
+    parser.add_argument('--output', type=str, default=None, help="json file to save the run report to")
+    args = parser.parse_args()
+
+    # Overhead of the instrumentation of a single call, with and without an open stage
+    num_calls = 100000
+    for name, report in [("no stage", None), ("open stage", RunReport())]:
+        start = time.perf_counter()
+        if report is None:
+            for _ in range(num_calls):
+                with sdk_call(name="items.get"):
+                    pass
+        else:
+            with report.stage(name="overhead"):
+                for _ in range(num_calls):
+                    with sdk_call(name="items.get"):
+                        pass
+        print(f"sdk_call overhead, {name}: {1e6 * (time.perf_counter() - start) / num_calls:.2f} us/call")
+
+    work_dir = tempfile.mkdtemp()
+    handler = CountingHandler()
+    logger = logging.getLogger(name='osdar-dataset')
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        scene = generate_scene(num_frames=args.frames, num_cuboid_tracks=10, num_bboxes=3, num_seg3d=2)
+        num_cuboids = sum(1 for frame in scene.frames.values() for annotation in frame.annotations.values()
+                          if type(annotation).__name__ == 'Cuboid')
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      default_file_size=256 * 1024)
+        dataset = FakeDataset(backend=FakeBackend(latency=args.latency))
+        run_report_path = args.output or os.path.join(work_dir, 'run_report.json')
+        lidar_parser = CountingParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                                      enable_rgb_highres_cameras="true", extraction_mode="stream",
+                                      remote_root="/sequence", run_report_path=run_report_path)
+        lidar_parser.scene_provider.enable_cache = False
+        start = time.perf_counter()
+        lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+        duration = time.perf_counter() - start
+
+        with open(run_report_path, 'r') as f:
+            report = json.load(f)
+        print(f"import of {args.frames} frames: {duration:.2f}s")
+        print_report(report=report)
+
+        stages = sorted(stage['name'] for stage in report['stages'])
+        expected_stages = sorted(["extract", "recipe", "media_upload", "mapping", "lidar_conversion",
+                                  "image_conversion", "parse_data", "lidar_annotations", "image_annotations",
+                                  "manifest"])
+        assert stages == expected_stages, stages
+        # Every backend call but the ones of the dtlpylidar `parse_data` is in the report
+        recorded_calls = report['total']['sdk_calls']
+        expected_calls = dataset.backend.total_calls - lidar_parser.parse_data_calls
+        print(f"recorded SDK calls: {recorded_calls}, backend calls outside parse_data: {expected_calls}")
+        assert recorded_calls == expected_calls, (recorded_calls, expected_calls)
+        stage_time = report['total']['wall_time']
+        print(f"stage wall time: {stage_time:.2f}s of {duration:.2f}s ({100 * stage_time / duration:.1f}%)")
+        print(f"log records: {handler.records} "
+              f"(the replaced prints wrote {args.frames + num_cuboids + 1} lines)")
+    finally:
+        logger.removeHandler(handler)
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scene_provider import SceneProvider
+from benchmarks.synthetic_scene import generate_scene, save_scene
+
+
+def bench_scene_cache(data_path: str, cache_dir: str):
+    # Cold parse: empty cache, scene is parsed with `raillabel.load` and written to the cache
+    provider = SceneProvider(cache_dir=cache_dir, enable_cache=True)
+    start = time.perf_counter()
+    provider.get_scene(data_path=data_path)
+    cold = time.perf_counter() - start
+
+    # In-run reuse: every stage after the first gets the already parsed scene
+    start = time.perf_counter()
+    provider.get_scene(data_path=data_path)
+    shared = time.perf_counter() - start
+
+    # Cache hit: a new run on the same archive
+    provider = SceneProvider(cache_dir=cache_dir, enable_cache=True)
+    start = time.perf_counter()
+    provider.get_scene(data_path=data_path)
+    cached = time.perf_counter() - start
+
+    scene_filepath = SceneProvider.find_scene_jsons(data_path=data_path)[0]
+    json_size = os.path.getsize(scene_filepath)
+    cache_size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir))
+    print(f"scene json: {json_size / 2 ** 20:.1f} MiB, cache file: {cache_size / 2 ** 20:.1f} MiB")
+    print(f"cold parse: {cold:.3f}s | in-run reuse: {shared * 1e6:.1f}us | cache hit: {cached:.3f}s "
+          f"({cold / cached:.1f}x faster)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold raillabel parse vs. scene cache hit")
+    parser.add_argument('--data-path', default=None, help="extracted OSDaR sequence, synthetic if not given")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--tracks', type=int, default=100)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        data_path = args.data_path
+        if data_path is None:
+            data_path = os.path.join(work_dir, 'data')
+            save_scene(scene=generate_scene(num_frames=args.frames, num_cuboid_tracks=args.tracks),
+                       data_path=data_path)
+        bench_scene_cache(data_path=data_path, cache_dir=os.path.join(work_dir, 'cache'))
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
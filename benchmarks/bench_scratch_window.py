@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+from benchmarks.bench_extraction import disk_usage
+from benchmarks.bench_parser import BenchParser
+
+
+class DiskMonitor:
+    """
+    Samples the bytes of the files under `path` on a thread, keeps the peak.
+    """
+
+    def __init__(self, path: str, interval: float = 0.005):
+        self.path = path
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak_bytes = max(self.peak_bytes, disk_usage(path=self.path))
+            except FileNotFoundError:
+                # A file deleted during the walk
+                pass
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_import(zip_filepath: str, scratch_root: str, latency: float, parser_options: dict) -> dict:
+    dataset = FakeDataset(backend=FakeBackend(latency=latency))
+    lidar_parser = BenchParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                               enable_rgb_highres_cameras="true", remote_root="/sequence", **parser_options)
+    lidar_parser.scene_provider.enable_cache = False
+    # The archive is extracted to the working directory
+    cwd = os.getcwd()
+    os.chdir(scratch_root)
+    try:
+        with DiskMonitor(path=scratch_root) as monitor:
+            start = time.perf_counter()
+            lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+            duration = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    assert disk_usage(path=scratch_root) == 0, os.listdir(scratch_root)
+    scratch_report = lidar_parser.scratch_report or dict()
+    return dict(duration=duration, peak_disk=monitor.peak_bytes, window_peak=scratch_report.get('peak_bytes', None),
+                waited=scratch_report.get('wait_time', None),
+                media={filepath: data for filepath, data in dataset.items.uploaded.items()
+                       if filepath.startswith(('/sequence/lidar/', '/sequence/frames/'))})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak scratch disk of the extraction modes vs. the sequence length")
+    parser.add_argument('--frames', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--file-size', type=int, default=256 * 1024, help="bytes of every sensor file")
+    parser.add_argument('--budget', type=int, default=2 * 2 ** 20, help="scratch budget of the window mode")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per fake SDK call")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    scratch_root = os.path.join(work_dir, 'scratch')
+    os.makedirs(name=scratch_root)
+    try:
+        window_peaks = list()
+        for num_frames in args.frames:
+            scene = generate_scene(num_frames=num_frames, num_cuboid_tracks=5)
+            zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, f'{num_frames}.zip'),
+                                          default_file_size=args.file_size)
+            media = None
+            for mode in ["full", "selective", "stream", "window"]:
+                result = run_import(zip_filepath=zip_filepath, scratch_root=scratch_root, latency=args.latency,
+                                    parser_options=dict(extraction_mode=mode, scratch_budget=args.budget))
+                window = ""
+                if mode == "window":
+                    window = f", window peak {result['window_peak'] / 2 ** 20:.1f} MiB, " \
+                             f"waited {result['waited']:.2f}s"
+                    window_peaks.append(result['window_peak'])
+                    assert result['window_peak'] <= args.budget, (result['window_peak'], args.budget)
+                print(f"{num_frames} frames, {mode}: {result['duration']:.2f}s, "
+                      f"peak scratch disk {result['peak_disk'] / 2 ** 20:.1f} MiB{window}")
+                media = media if media is not None else result['media']
+                assert result['media'] == media, f"{mode} uploaded different media files"
+            os.remove(zip_filepath)
+        # Flat: the window of every sequence length stays within the same budget
+        assert max(window_peaks) <= args.budget, window_peaks
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
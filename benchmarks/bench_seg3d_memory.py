@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from point_ids_codec import encode_ref_item, dump_ref_item, decode_ref_item
+from point_ids_store import PointIdsStore
+from run_report import peak_rss, reset_peak_rss
+
+
+def segments(num_frames: int, num_segments: int, points: int, seed: int = 0):
+    """
+    Yield the (frame, annotation uid, point ids) of a densely segmented sequence, every segment tracked over all
+    the frames. The ids are new lists, like those of a downsampled frame or of a scene loaded frame by frame.
+    """
+    rng = np.random.default_rng(seed)
+    for frame in range(num_frames):
+        for segment in range(num_segments):
+            start = int(rng.integers(0, 2 ** 20))
+            yield frame, f"segment_{segment:04d}", list(range(start, start + points))
+
+
+def previous(args, work_dir: str, encoding: str) -> dict:
+    # The previous `convert_pre_annotation_lidar`: every ref item in memory until the end of the sequence
+    ref_items_dict = dict()
+    for frame, uid, point_ids in segments(num_frames=args.frames, num_segments=args.segments, points=args.points):
+        ref_items_dict.setdefault(uid, {"type": "index", "frames": {}})["frames"][str(frame)] = point_ids
+    uploaded = dict()
+    for uid, ref_item_json in ref_items_dict.items():
+        buffer = BytesIO()
+        buffer.write(json.dumps(encode_ref_item(ref_item_json=ref_item_json, encoding=encoding)).encode())
+        uploaded[uid] = len(buffer.getvalue())
+    return uploaded
+
+
+def store(args, work_dir: str, encoding: str) -> dict:
+    uploaded = dict()
+    with PointIdsStore(path=os.path.join(work_dir, 'point_ids')) as point_ids_store:
+        for frame, uid, point_ids in segments(num_frames=args.frames, num_segments=args.segments,
+                                              points=args.points):
+            point_ids_store.append(uid=uid, frame=frame, point_ids=point_ids)
+        for uid in point_ids_store.uids():
+            filepath = os.path.join(point_ids_store.path, f"{uid}.json")
+            with open(filepath, 'wb') as f:
+                dump_ref_item(frames=point_ids_store.read(uid=uid, sort_key=str), fp=f, encoding=encoding)
+            uploaded[uid] = os.path.getsize(filepath)
+            os.remove(filepath)
+    return uploaded
+
+
+def _measure(target, args, work_dir: str, encoding: str, queue):
+    # The peak is the current RSS right after the reset
+    reset_peak_rss()
+    baseline = peak_rss()
+    start = time.perf_counter()
+    uploaded = target(args, work_dir, encoding)
+    queue.put((time.perf_counter() - start, peak_rss() - baseline, sum(uploaded.values())))
+
+
+def measure(target, args, work_dir: str, encoding: str) -> (float, int, int):
+    """
+    Run `target` in a fresh process, so its peak RSS isn't hidden by the pages of an earlier run.
+
+    :return: seconds, peak RSS above the process start and bytes of the ref items
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(target, args, work_dir, encoding, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def check_round_trip(work_dir: str):
+    frames = {"0": [7, 3, 3, 9], "2": [], "10": [1, 2, 3]}
+    with PointIdsStore(path=os.path.join(work_dir, 'round_trip')) as point_ids_store:
+        for frame, point_ids in frames.items():
+            point_ids_store.append(uid="a", frame=int(frame), point_ids=point_ids)
+        for encoding in ["json", "delta", "ranges"]:
+            buffer = BytesIO()
+            dump_ref_item(frames=point_ids_store.read(uid="a", sort_key=str), fp=buffer, encoding=encoding)
+            expected = json.dumps(encode_ref_item(ref_item_json={"type": "index", "frames": frames},
+                                                  encoding=encoding), sort_keys=True)
+            assert buffer.getvalue().decode() == expected, f"'{encoding}' item differs"
+            assert decode_ref_item(json.loads(buffer.getvalue()))['frames'].keys() == frames.keys()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of the Seg3d accumulation, in memory vs. on disk")
+    parser.add_argument('--frames', type=int, default=400)
+    parser.add_argument('--segments', type=int, default=20, help="segments tracked over the sequence")
+    parser.add_argument('--points', type=int, default=5000, help="points per segment per frame")
+    parser.add_argument('--encodings', nargs='+', default=["json", "ranges"])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        check_round_trip(work_dir=work_dir)
+        print("round trip: ok")
+        total_points = args.frames * args.segments * args.points
+        print(f"{args.frames} frames x {args.segments} segments x {args.points} points = {total_points} point ids")
+        for encoding in args.encodings:
+            for name, target in [("in memory", previous), ("point ids store", store)]:
+                duration, rss, num_bytes = measure(target=target, args=args, work_dir=work_dir, encoding=encoding)
+                print(f"{encoding:>6} {name:<16}: peak RSS +{rss / 2 ** 20:7.1f} MiB, {duration:6.2f}s, "
+                      f"ref items {num_bytes / 2 ** 20:.1f} MiB")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+from benchmarks.bench_parser import BenchParser
+from custom_converter import preload_dependencies
+
+
+def annotation_json(annotation) -> str:
+    if isinstance(annotation, dict):
+        # The semantic reference item ids differ between the datasets
+        annotation = dict(annotation, coordinates=dict(annotation['coordinates'], ref=None))
+        return json.dumps(annotation, sort_keys=True, default=str)
+    return json.dumps({"label": annotation.label, "metadata": annotation.metadata,
+                       "coordinates": annotation.annotation_definition.to_coordinates(color=None),
+                       "frames": len(annotation.frames or dict())}, sort_keys=True, default=str)
+
+
+def run_import(zip_filepath: str, backend_options: dict, max_parallel_stages: int) -> (float, dict, dict):
+    dataset = FakeDataset(backend=FakeBackend(**backend_options))
+    lidar_parser = BenchParser(enable_ir_cameras="false", enable_rgb_cameras="false",
+                               enable_rgb_highres_cameras="true", extraction_mode="stream", remote_root="/sequence",
+                               max_parallel_stages=max_parallel_stages)
+    lidar_parser.scene_provider.enable_cache = False
+    start = time.perf_counter()
+    lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+    duration = time.perf_counter() - start
+    # Uploaded media and annotations by remote filepath, to compare the runs
+    uploaded = {filepath: (len(item.data), sorted(annotation_json(annotation=annotation)
+                                                  for annotation in item.annotations.uploaded))
+                for filepath, item in dataset.items.by_filepath.items() if not filepath.startswith('/.dataloop')}
+    return duration, lidar_parser.run_report.to_dict(), uploaded
+
+
+def print_timeline(report: dict, duration: float, width: int = 50):
+    for stage in report['stages']:
+        start = int(width * stage['start'] / duration)
+        length = max(1, int(width * stage['wall_time'] / duration))
+        print(f"  {stage['name']:<20}{stage['start']:>7.2f}{stage['wall_time']:>7.2f}s  "
+              f"{' ' * start}{'#' * length}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import stages one after the other vs. as a dependency graph")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per fake SDK call")
+    parser.add_argument('--bandwidth', type=float, default=20 * 2 ** 20, help="upload bytes per second per call")
+    args = parser.parse_args()
+
+    preload_dependencies().join()
+    work_dir = tempfile.mkdtemp()
+    try:
+        scene = generate_scene(num_frames=args.frames, cameras=3, num_cuboid_tracks=40, num_bboxes=5, num_seg3d=4,
+                               num_polylines=2)
+        zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, 'sequence.zip'),
+                                      default_file_size=512 * 1024)
+        backend_options = dict(latency=args.latency, bandwidth=args.bandwidth)
+
+        results = dict()
+        for name, max_parallel_stages in [("sequential", 1), ("graph", None)]:
+            duration, report, uploaded = run_import(zip_filepath=zip_filepath, backend_options=backend_options,
+                                                    max_parallel_stages=max_parallel_stages)
+            results[name] = uploaded
+            stage_times = {stage['name']: stage['wall_time'] for stage in report['stages']}
+            print(f"{name}: {duration:.2f}s, sum of the stages {sum(stage_times.values()):.2f}s, "
+                  f"slowest stage {max(stage_times, key=stage_times.get)} {max(stage_times.values()):.2f}s")
+            print_timeline(report=report, duration=duration)
+        assert results['graph'] == results['sequential'], "the runs uploaded different items or annotations"
+        print(f"same {len(results['graph'])} items and annotations uploaded")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import argparse
+import dtlpy as dl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_converter import ObjectTracks
+from benchmarks.synthetic_scene import generate_scene
+
+
+def scene_cuboids(scene) -> list:
+    cuboids = list()
+    for lidar_frame, frame in enumerate(scene.frames.values()):
+        for annotation in frame.annotations.values():
+            annotation_definition = dl.Cube3d(
+                label=annotation.object.type,
+                position=[annotation.pos.x, annotation.pos.y, annotation.pos.z],
+                scale=[annotation.size.x, annotation.size.y, annotation.size.z],
+                rotation=[0, 0, 0]
+            )
+            cuboids.append((lidar_frame, annotation.object.uid, annotation.uid, annotation_definition))
+    return cuboids
+
+
+def assemble_linear(cuboids: list) -> dl.AnnotationCollection:
+    # The previous track assembly: scan the builder for the object id of every existing track
+    builder = dl.AnnotationCollection(item=None)
+    object_id_map = dict()
+    for lidar_frame, object_uid, uid, annotation_definition in cuboids:
+        object_id = object_id_map.get(object_uid, None)
+        if object_id is None:
+            object_id = len(object_id_map)
+            object_id_map[object_uid] = object_id
+            metadata = {"object_uid": object_uid, "system": {"frameNumberBased": True}, "uid": uid}
+            builder.add(annotation_definition=annotation_definition, frame_num=lidar_frame,
+                        end_frame_num=lidar_frame, object_id=str(object_id), metadata=metadata)
+        else:
+            for idx, builder_annotation in enumerate(builder):
+                if builder_annotation.object_id == str(object_id):
+                    builder[idx].add_frame(annotation_definition=annotation_definition, frame_num=lidar_frame)
+                    builder[idx].end_frame = lidar_frame
+                    builder[idx].end_time = lidar_frame
+                    break
+    return builder
+
+
+def assemble_indexed(cuboids: list) -> dl.AnnotationCollection:
+    builder = dl.AnnotationCollection(item=None)
+    tracks = ObjectTracks(builder=builder)
+    for lidar_frame, object_uid, uid, annotation_definition in cuboids:
+        metadata = {"object_uid": object_uid, "system": {"frameNumberBased": True}, "uid": uid}
+        tracks.add(object_uid=object_uid, annotation_definition=annotation_definition,
+                   frame_num=lidar_frame, metadata=metadata)
+    return builder
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linear scan vs. indexed cuboid track assembly")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--tracks', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--skip-linear-above', type=int, default=2000)
+    args = parser.parse_args()
+
+    for num_tracks in args.tracks:
+        cuboids = scene_cuboids(scene=generate_scene(num_frames=args.frames, cameras=[], num_cuboid_tracks=num_tracks))
+        start = time.perf_counter()
+        indexed = assemble_indexed(cuboids=cuboids)
+        indexed_time = time.perf_counter() - start
+        line = f"{num_tracks} tracks x {args.frames} frames: indexed {indexed_time:.2f}s"
+        if num_tracks <= args.skip_linear_above:
+            start = time.perf_counter()
+            linear = assemble_linear(cuboids=cuboids)
+            linear_time = time.perf_counter() - start
+            same = [a.to_json() for a in linear] == [a.to_json() for a in indexed]
+            line += f" | linear scan {linear_time:.2f}s ({linear_time / indexed_time:.1f}x), same output: {same}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
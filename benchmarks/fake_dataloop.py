@@ -0,0 +1,222 @@
+import io
+import os
+import time
+import uuid
+import threading
+import dtlpy as dl
+
+from annotation_uploader import annotation_size
+
+
+class FakeBackend:
+    """
+    Shared state of the local Dataloop stand-in: call counters and the injected latency.
+
+    :param latency: seconds added to every call
+    :param bandwidth: bytes per second of every upload call, unlimited if None
+    :param max_concurrency: number of calls the fake backend serves at the same time, unlimited if None
+    :param max_request_bytes: calls with a larger body time out after `timeout` seconds, unlimited if None
+    """
+
+    def __init__(self, latency: float = 0.05, bandwidth: float = None, max_concurrency: int = None,
+                 max_request_bytes: int = None, timeout: float = 1.0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_request_bytes = max_request_bytes
+        self.timeout = timeout
+        self.calls = dict()
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrency) if max_concurrency else None
+
+    def call(self, name: str, num_bytes: int = 0):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.max_request_bytes is not None and num_bytes > self.max_request_bytes:
+            time.sleep(self.timeout)
+            raise TimeoutError(f"{name} timed out, {num_bytes} bytes request")
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            delay = self.latency
+            if self.bandwidth:
+                delay += num_bytes / self.bandwidth
+            time.sleep(delay)
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+
+class FakeAnnotations:
+    def __init__(self, item):
+        self.item = item
+        self.uploaded = list()
+
+    def builder(self):
+        return dl.AnnotationCollection(item=self.item)
+
+    def upload(self, annotations):
+        annotations = list(annotations)
+        self.item.backend.call(name='annotations.upload',
+                               num_bytes=sum(annotation_size(annotation=annotation) for annotation in annotations))
+        self.uploaded.extend(annotations)
+        return annotations
+
+    def delete(self, filters=None):
+        self.item.backend.call(name='annotations.delete')
+        self.uploaded = list()
+        return True
+
+
+class FakeItem:
+    def __init__(self, dataset, filename: str, data: bytes):
+        self.id = uuid.uuid4().hex[:24]
+        self.dataset = dataset
+        self.dataset_id = dataset.id
+        self.dataset_url = None
+        self.filename = filename
+        self.name = os.path.basename(filename)
+        self.data = data
+        self.metadata = {"system": {"mimetype": "application/octet-stream"}}
+        self.mimetype = self.metadata["system"]["mimetype"]
+        self.fps = None
+        self.width = None
+        self.height = None
+        self.annotations = FakeAnnotations(item=self)
+
+    @property
+    def backend(self):
+        return self.dataset.backend
+
+    def download(self, save_locally: bool = True, **kwargs):
+        self.backend.call(name='item.download', num_bytes=len(self.data))
+        buffer = io.BytesIO(self.data)
+        buffer.name = self.name
+        return buffer
+
+
+class FakePagedEntities:
+    def __init__(self, items: list, page_size: int):
+        self.items_count = len(items)
+        self._pages = [items[i:i + page_size] for i in range(0, len(items), page_size)]
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def all(self):
+        for page in self._pages:
+            for item in page:
+                yield item
+
+
+class FakeItems:
+    """
+    Local stand-in for `dl.Dataset.items`. Every call is counted and delayed by the backend.
+    """
+
+    def __init__(self, dataset=None, latency: float = 0.05, bandwidth: float = None, max_concurrency: int = None):
+        if dataset is None:
+            dataset = FakeDataset(backend=FakeBackend(latency=latency, bandwidth=bandwidth,
+                                                      max_concurrency=max_concurrency),
+                                  items=self)
+        self.dataset = dataset
+        self.by_filepath = dict()
+        self.by_id = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return self.dataset.backend
+
+    @property
+    def calls(self):
+        return self.backend.calls
+
+    @property
+    def uploaded(self):
+        return {filepath: item.data for filepath, item in self.by_filepath.items()}
+
+    @staticmethod
+    def _read(local_path) -> bytes:
+        if isinstance(local_path, io.BytesIO):
+            return local_path.getvalue()
+        with open(local_path, 'rb') as f:
+            return f.read()
+
+    def upload(self, local_path, remote_path: str = '/', remote_name: str = None, overwrite: bool = False, **kwargs):
+        if hasattr(local_path, 'iterrows'):
+            elements = [dict(row) for _, row in local_path.iterrows()]
+        else:
+            elements = [{"local_path": local_path, "remote_path": remote_path, "remote_name": remote_name}]
+
+        uploaded = list()
+        for element in elements:
+            data = self._read(local_path=element['local_path'])
+            remote_name = element.get('remote_name') or os.path.basename(getattr(element['local_path'], 'name', '')
+                                                                        or element['local_path'])
+            remote_filepath = f"{(element.get('remote_path') or '/').rstrip('/')}/{remote_name}"
+            with self._lock:
+                item = self.by_filepath.get(remote_filepath, None)
+                if item is not None and not overwrite:
+                    uploaded.append(item)
+                    continue
+                if item is not None:
+                    # Overwriting keeps the item id
+                    item.data = data
+                else:
+                    item = FakeItem(dataset=self.dataset, filename=remote_filepath, data=data)
+                    self.by_filepath[remote_filepath] = item
+                    self.by_id[item.id] = item
+            uploaded.append(item)
+        self.backend.call(name='items.upload', num_bytes=sum(len(item.data) for item in uploaded))
+        return uploaded[0] if len(uploaded) == 1 else uploaded
+
+    def get(self, item_id: str = None, filepath: str = None):
+        self.backend.call(name='items.get')
+        item = self.by_id.get(item_id) if item_id is not None else self.by_filepath.get(filepath)
+        if item is None:
+            raise dl.exceptions.NotFound(status_code="404", message=f"Item not found: {item_id or filepath}")
+        return item
+
+    def list(self, filters: dl.Filters = None, page_size: int = 1000, **kwargs):
+        self.backend.call(name='items.list')
+        items = list(self.by_id.values())
+        if filters is not None:
+            for condition in filters.prepare().get('filter', dict()).get('$and', list()):
+                for field, value in condition.items():
+                    if field in ['hidden', 'type']:
+                        continue
+                    attribute = {'dir': lambda i: os.path.dirname(i.filename)}.get(field, lambda i: getattr(i, field))
+                    if isinstance(value, dict) and '$in' in value:
+                        values = set(value['$in'])
+                        items = [item for item in items if attribute(item) in values]
+                    else:
+                        items = [item for item in items if attribute(item) == value]
+        return FakePagedEntities(items=items, page_size=page_size)
+
+
+class FakeRecipe:
+    def __init__(self):
+        self.metadata = dict()
+
+
+class FakeRecipes:
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._recipes = [FakeRecipe()]
+
+    def list(self):
+        self.dataset.backend.call(name='recipes.list')
+        return self._recipes
+
+
+class FakeDataset:
+    def __init__(self, backend: FakeBackend = None, items: FakeItems = None, name: str = 'fake-dataset'):
+        self.id = uuid.uuid4().hex[:24]
+        self.name = name
+        self.backend = backend if backend is not None else FakeBackend()
+        self.items = items if items is not None else FakeItems(dataset=self)
+        self.recipes = FakeRecipes(dataset=self)
@@ -0,0 +1,129 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class RangeHTTPServer:
+    """
+    Local HTTP server for a single directory, with Range requests, an ETag, per-connection bandwidth
+    throttling and optional dropped connections, to exercise the downloaders without network access.
+
+    :param directory: served directory
+    :param bandwidth: bytes per second per connection, unlimited if None
+    :param latency: seconds added to every request
+    :param drop_after_bytes: drop every response after sending this many bytes, as long as `drops_left` > 0
+    """
+
+    def __init__(self, directory: str, bandwidth: float = None, latency: float = 0.0,
+                 drop_after_bytes: int = None, drops: int = 0):
+        self.directory = directory
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.drop_after_bytes = drop_after_bytes
+        self.drops_left = drops
+        self.requests = list()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _take_drop(self) -> bool:
+        with self._lock:
+            if self.drop_after_bytes is not None and self.drops_left > 0:
+                self.drops_left -= 1
+                return True
+            return False
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _resolve(self):
+                filepath = os.path.join(server.directory, self.path.lstrip('/').split('?')[0])
+                if not os.path.isfile(filepath):
+                    self.send_error(404)
+                    return None
+                return filepath
+
+            @staticmethod
+            def _etag(filepath: str) -> str:
+                stat = os.stat(filepath)
+                return '"%s"' % hashlib.md5(f"{filepath}{stat.st_size}{stat.st_mtime_ns}".encode()).hexdigest()
+
+            def _send_headers(self, filepath: str, status: int, start: int, end: int, size: int):
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/zip')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', self._etag(filepath=filepath))
+                self.send_header('Content-Length', str(end - start + 1))
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+                self.end_headers()
+
+            def _byte_range(self, size: int):
+                match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+                if match is None:
+                    return 200, 0, size - 1
+                start, end = match.groups()
+                if start == '':
+                    start, end = size - int(end), size - 1
+                else:
+                    start, end = int(start), int(end) if end else size - 1
+                return 206, start, min(end, size - 1)
+
+            def do_HEAD(self):
+                filepath = self._resolve()
+                if filepath is None:
+                    return
+                size = os.path.getsize(filepath)
+                self._send_headers(filepath=filepath, status=200, start=0, end=size - 1, size=size)
+
+            def do_GET(self):
+                filepath = self._resolve()
+                if filepath is None:
+                    return
+                size = os.path.getsize(filepath)
+                status, start, end = self._byte_range(size=size)
+                with server._lock:
+                    server.requests.append((status, start, end))
+                if server.latency:
+                    time.sleep(server.latency)
+                self._send_headers(filepath=filepath, status=status, start=start, end=end, size=size)
+                drop = server._take_drop()
+                sent = 0
+                chunk_size = 64 * 1024
+                with open(filepath, 'rb') as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = f.read(min(chunk_size, remaining))
+                        if drop and sent + len(chunk) > server.drop_after_bytes:
+                            self.close_connection = True
+                            return
+                        self.wfile.write(chunk)
+                        sent += len(chunk)
+                        remaining -= len(chunk)
+                        if server.bandwidth:
+                            time.sleep(len(chunk) / server.bandwidth)
+
+        return Handler
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_dataloop import FakeDataset, FakeBackend
+from benchmarks.synthetic_scene import generate_scene, save_scene_zip
+from benchmarks.bench_parser import BenchParser
+from custom_converter import preload_dependencies
+
+THRESHOLDS_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thresholds.json')
+
+# Scene and parser options of every benchmark profile, small enough to run offline in minutes
+PROFILES = {
+    "small": {
+        "scene": dict(num_frames=20, cameras=3, num_cuboid_tracks=10, num_bboxes=3, num_seg3d=2, num_polylines=2),
+        "zip": dict(default_file_size=256 * 1024),
+        "parser": dict(extraction_mode="stream")
+    },
+    "long_sequence": {
+        "scene": dict(num_frames=200, cameras=3, num_cuboid_tracks=20, num_bboxes=5, num_seg3d=4, num_polylines=2),
+        "zip": dict(default_file_size=128 * 1024),
+        "parser": dict(extraction_mode="selective")
+    },
+    "all_cameras": {
+        "scene": dict(num_frames=20, cameras=9, num_cuboid_tracks=10, num_bboxes=3, num_polylines=2),
+        "zip": dict(default_file_size=256 * 1024),
+        "parser": dict(extraction_mode="full", enable_rgb_cameras="true", enable_ir_cameras="true")
+    },
+    "dense_segments": {
+        "scene": dict(num_frames=20, cameras=3, num_cuboid_tracks=5, num_seg3d=20, num_lidar_points=200000,
+                      seg3d_points=(5000, 20000)),
+        "zip": dict(default_file_size=256 * 1024),
+        "parser": dict(extraction_mode="stream", sem_ref_encoding="ranges", allow_compact_sem_ref=True)
+    },
+    "preprocessing": {
+        "scene": dict(num_frames=10, cameras=3, num_cuboid_tracks=10, num_bboxes=3, num_polylines=2,
+                      camera_resolution=(1028, 626)),
+        "zip": dict(pcd_points=50000, images=True),
+        "parser": dict(extraction_mode="stream",
+                       pcd_options={"data_format": "binary_compressed", "voxel_size": 0.05},
+                       image_options={"image_format": "jpeg", "quality": 90, "max_size": 512})
+    }
+}
+
+
+def run_profile(name: str, latency: float, work_dir: str) -> dict:
+    """
+    Import the synthetic scene of a profile into a fresh fake dataset.
+
+    :return: the run report of the import
+    """
+    profile = PROFILES[name]
+    scene = generate_scene(**profile['scene'])
+    zip_filepath = save_scene_zip(scene=scene, zip_filepath=os.path.join(work_dir, f'{name}.zip'), **profile['zip'])
+    dataset = FakeDataset(backend=FakeBackend(latency=latency))
+    parser_options = dict(enable_ir_cameras="false", enable_rgb_cameras="false", enable_rgb_highres_cameras="true",
+                          remote_root=f"/{name}")
+    parser_options.update(profile['parser'])
+    lidar_parser = BenchParser(**parser_options)
+    lidar_parser.scene_provider.enable_cache = False
+    start = time.perf_counter()
+    lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset)
+    report = lidar_parser.run_report.to_dict()
+    report['import_time'] = time.perf_counter() - start
+    report['frames'] = len(scene.frames)
+    report['backend_calls'] = dataset.backend.total_calls
+    return report
+
+
+def measurements(report: dict) -> dict:
+    """
+    The values of a run report the thresholds apply to.
+    """
+    return {
+        "frames_per_sec": report['frames'] / report['import_time'],
+        "backend_calls": report['backend_calls'],
+        "peak_rss_mib": report['total']['peak_rss'] / 2 ** 20,
+        "stages": {stage['name']: {"wall_time": stage['wall_time'], "sdk_calls": stage['sdk_calls']}
+                   for stage in report['stages']}
+    }
+
+
+def derive_thresholds(values: dict, time_headroom: float, rss_headroom: float, time_floor: float = 0.5) -> dict:
+    """
+    Thresholds from the measurements of a reference run: the SDK calls are deterministic and kept exact,
+    the times and the memory get a headroom for noisy machines.
+
+    :param time_floor: seconds a stage may always take over its reference time, the relative headroom of the
+    short stages is below the scheduling noise
+    """
+    return {
+        "min_frames_per_sec": round(values['frames_per_sec'] / time_headroom, 2),
+        "max_backend_calls": values['backend_calls'],
+        "max_peak_rss_mib": round(values['peak_rss_mib'] * rss_headroom),
+        "stages": {name: {"max_wall_time": round(max(stage['wall_time'] * time_headroom,
+                                                     stage['wall_time'] + time_floor), 2),
+                          "max_sdk_calls": stage['sdk_calls']}
+                   for name, stage in values['stages'].items()}
+    }
+
+
+def check_thresholds(values: dict, thresholds: dict) -> list:
+    """
+    :return: the descriptions of the exceeded thresholds
+    """
+    failures = list()
+    if values['frames_per_sec'] < thresholds['min_frames_per_sec']:
+        failures.append(f"frames/s {values['frames_per_sec']:.2f} < {thresholds['min_frames_per_sec']}")
+    if values['backend_calls'] > thresholds['max_backend_calls']:
+        failures.append(f"backend calls {values['backend_calls']} > {thresholds['max_backend_calls']}")
+    if values['peak_rss_mib'] > thresholds['max_peak_rss_mib']:
+        failures.append(f"peak RSS {values['peak_rss_mib']:.0f} MiB > {thresholds['max_peak_rss_mib']} MiB")
+    for name, stage_thresholds in thresholds['stages'].items():
+        stage = values['stages'].get(name, None)
+        if stage is None:
+            failures.append(f"stage '{name}' missing")
+            continue
+        if stage['wall_time'] > stage_thresholds['max_wall_time']:
+            failures.append(f"{name} wall time {stage['wall_time']:.2f}s > {stage_thresholds['max_wall_time']}s")
+        if stage['sdk_calls'] > stage_thresholds['max_sdk_calls']:
+            failures.append(f"{name} SDK calls {stage['sdk_calls']} > {stage_thresholds['max_sdk_calls']}")
+    return failures
+
+
+def print_report(name: str, report: dict):
+    print(f"\n{name}: {report['frames']} frames in {report['import_time']:.2f}s "
+          f"({report['frames'] / report['import_time']:.1f} frames/s), {report['backend_calls']} backend calls")
+    print(f"  {'stage':<20}{'wall s':>8}{'cpu s':>8}{'MiB':>9}{'MiB/s':>8}{'calls':>7}{'p50 ms':>8}{'p99 ms':>8}"
+          f"{'RSS MiB':>9}")
+    for stage in report['stages']:
+        p50 = max([call['p50'] for call in stage['calls'].values()], default=0.0)
+        p99 = max([call['p99'] for call in stage['calls'].values()], default=0.0)
+        print(f"  {stage['name']:<20}{stage['wall_time']:>8.2f}{stage['cpu_time']:>8.2f}"
+              f"{stage['bytes'] / 2 ** 20:>9.1f}{stage['bytes_per_sec'] / 2 ** 20:>8.1f}{stage['sdk_calls']:>7}"
+              f"{1000 * p50:>8.1f}{1000 * p99:>8.1f}{stage['peak_rss'] / 2 ** 20:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end to end benchmarks of the OSDaR converter, "
+                                                 "checked against regression thresholds")
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per fake SDK call")
+    parser.add_argument('--thresholds', type=str, default=THRESHOLDS_FILEPATH)
+    parser.add_argument('--update-thresholds', action='store_true',
+                        help="derive the thresholds of the profiles from this run instead of checking them")
+    parser.add_argument('--time-headroom', type=float, default=2.0)
+    parser.add_argument('--time-floor', type=float, default=0.5, help="seconds of headroom of every stage at least")
+    parser.add_argument('--rss-headroom', type=float, default=1.3)
+    parser.add_argument('--output', type=str, default=None, help="json file to save the run reports to")
+    args = parser.parse_args()
+
+    thresholds = dict()
+    if os.path.isfile(args.thresholds):
+        with open(args.thresholds, 'r') as f:
+            thresholds = json.load(f)
+
+    # The import time of the dependencies is measured by bench_import_time.py, not in the first profile
+    preload_dependencies().join()
+
+    reports = dict()
+    failures = dict()
+    work_dir = tempfile.mkdtemp()
+    try:
+        for name in args.profiles:
+            report = run_profile(name=name, latency=args.latency, work_dir=work_dir)
+            reports[name] = report
+            print_report(name=name, report=report)
+            values = measurements(report=report)
+            if args.update_thresholds:
+                thresholds[name] = derive_thresholds(values=values,
+                                                     time_headroom=args.time_headroom,
+                                                     rss_headroom=args.rss_headroom,
+                                                     time_floor=args.time_floor)
+            elif name in thresholds:
+                failures[name] = check_thresholds(values=values, thresholds=thresholds[name])
+                for failure in failures[name]:
+                    print(f"  REGRESSION: {failure}")
+            else:
+                print(f"  no thresholds for '{name}'")
+    finally:
+        shutil.rmtree(path=work_dir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(obj=reports, fp=f, indent=2)
+    if args.update_thresholds:
+        with open(args.thresholds, 'w') as f:
+            json.dump(obj=thresholds, fp=f, indent=2)
+            f.write("\n")
+        print(f"\nThresholds saved to: {args.thresholds}")
+        return 0
+
+    num_failures = sum(len(profile_failures) for profile_failures in failures.values())
+    print(f"\n{len(failures)} profiles checked, {num_failures} regressions")
+    return 1 if num_failures > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
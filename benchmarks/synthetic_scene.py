@@ -0,0 +1,267 @@
+import os
+import decimal
+import zipfile
+import random
+import functools
+import numpy as np
+from io import BytesIO
+import raillabel
+from raillabel import format as rl
+
+# Camera sensors of an OSDaR23 sequence
+OSDAR_CAMERAS = ['rgb_highres_center', 'rgb_highres_left', 'rgb_highres_right', 'rgb_center', 'rgb_left', 'rgb_right',
+                 'ir_center', 'ir_left', 'ir_right']
+
+
+def generate_scene(num_frames: int = 10,
+                   cameras=None,
+                   num_cuboid_tracks: int = 10,
+                   num_bboxes: int = 0,
+                   num_seg3d: int = 0,
+                   num_lidar_points: int = 20000,
+                   camera_resolution: tuple = (4112, 2504),
+                   num_polylines: int = 0,
+                   polyline_points: int = 20,
+                   seg3d_points: tuple = (10, 500),
+                   seed: int = 0) -> raillabel.Scene:
+    """
+    Generate a synthetic RailLabel scene, laid out like an OSDaR23 sequence.
+
+    :param num_frames: number of frames in the sequence
+    :param cameras: camera sensor uids or a number of cameras in the `OSDAR_CAMERAS` order, defaults to the
+    3 highres rgb cameras
+    :param num_cuboid_tracks: number of cuboid tracks, each track is annotated in every frame
+    :param num_bboxes: number of 2d boxes per camera per frame
+    :param num_seg3d: number of lidar segments per frame
+    :param num_lidar_points: number of points of the lidar clouds the segments point ids refer to
+    :param camera_resolution: width and height of the cameras
+    :param num_polylines: number of rail tracks per frame, each one is a lidar polyline and a polyline in
+    every camera
+    :param polyline_points: number of points of each polyline
+    :param seg3d_points: minimum and maximum number of points of each lidar segment
+    :param seed: random seed
+    :return: raillabel.Scene
+    """
+    rnd = random.Random(seed)
+    if cameras is None:
+        cameras = OSDAR_CAMERAS[:3]
+    elif isinstance(cameras, int):
+        cameras = OSDAR_CAMERAS[:cameras]
+
+    sensors = {
+        'lidar': rl.Sensor(
+            uid='lidar',
+            extrinsics=rl.Transform(pos=rl.Point3d(0, 0, 0), quat=rl.Quaternion(0, 0, 0, 1)),
+            type=rl.SensorType.LIDAR,
+            uri='/lidar_merged'
+        )
+    }
+    for camera in cameras:
+        sensors[camera] = rl.Sensor(
+            uid=camera,
+            extrinsics=rl.Transform(
+                pos=rl.Point3d(rnd.uniform(0, 5), rnd.uniform(-1, 1), rnd.uniform(2, 4)),
+                quat=rl.Quaternion(*_random_quaternion(rnd=rnd))
+            ),
+            intrinsics=rl.IntrinsicsPinhole(
+                camera_matrix=(4600.0, 0.0, 2050.0, 0.0, 0.0, 4600.0, 1250.0, 0.0, 0.0, 0.0, 1.0, 0.0),
+                distortion=(-0.08, 0.12, 0.0, 0.0, 0.0),
+                width_px=camera_resolution[0],
+                height_px=camera_resolution[1]
+            ),
+            type=rl.SensorType.CAMERA,
+            uri=f'/{camera}'
+        )
+
+    objects = dict()
+    for track in range(max(num_cuboid_tracks, num_bboxes, num_seg3d)):
+        object_uid = _uid(rnd=rnd)
+        objects[object_uid] = rl.Object(uid=object_uid, name=f'person_{track:04d}', type='person')
+    object_list = list(objects.values())
+    track_list = list()
+    for track in range(num_polylines):
+        object_uid = _uid(rnd=rnd)
+        objects[object_uid] = rl.Object(uid=object_uid, name=f'track_{track:04d}', type='track')
+        track_list.append(objects[object_uid])
+
+    frames = dict()
+    for frame_uid in range(num_frames):
+        timestamp = decimal.Decimal(f"{1631441453 + frame_uid * 0.1:.6f}")
+        frame_sensors = {
+            'lidar': rl.SensorReference(
+                sensor=sensors['lidar'],
+                timestamp=timestamp,
+                uri=f'/lidar/{frame_uid:03d}_{timestamp}.pcd'
+            )
+        }
+        for camera in cameras:
+            frame_sensors[camera] = rl.SensorReference(
+                sensor=sensors[camera],
+                timestamp=timestamp,
+                uri=f'/{camera}/{frame_uid:03d}_{timestamp}.png'
+            )
+
+        annotations = dict()
+        for obj in object_list[:num_cuboid_tracks]:
+            annotation = rl.Cuboid(
+                uid=_uid(rnd=rnd),
+                pos=rl.Point3d(rnd.uniform(5, 80), rnd.uniform(-10, 10), rnd.uniform(-1, 1)),
+                quat=rl.Quaternion(*_random_quaternion(rnd=rnd)),
+                size=rl.Size3d(rnd.uniform(0.4, 1), rnd.uniform(0.4, 1), rnd.uniform(1.5, 2)),
+                object=obj,
+                sensor=sensors['lidar'],
+                attributes={'occlusion': '0-25 %', 'pose': 'upright'}
+            )
+            annotations[annotation.uid] = annotation
+
+        for camera in cameras:
+            for obj in object_list[:num_bboxes]:
+                annotation = rl.Bbox(
+                    uid=_uid(rnd=rnd),
+                    pos=rl.Point2d(rnd.uniform(100, 4000), rnd.uniform(100, 2400)),
+                    size=rl.Size2d(rnd.uniform(20, 200), rnd.uniform(40, 400)),
+                    object=obj,
+                    sensor=sensors[camera],
+                    attributes={'occlusion': '0-25 %'}
+                )
+                annotations[annotation.uid] = annotation
+
+        for obj in object_list[:num_seg3d]:
+            start = rnd.randrange(0, num_lidar_points)
+            annotation = rl.Seg3d(
+                uid=_uid(rnd=rnd),
+                point_ids=list(range(start, min(num_lidar_points, start + rnd.randint(*seg3d_points)))),
+                object=obj,
+                sensor=sensors['lidar'],
+                attributes={'occlusion': '0-25 %'}
+            )
+            annotations[annotation.uid] = annotation
+
+        for track, obj in enumerate(track_list):
+            # A rail running ahead of the train, bending slightly
+            offset, curvature = (track - num_polylines / 2) * 4.5, rnd.uniform(-2e-3, 2e-3)
+            distances = [2 + 100 * i / max(1, polyline_points - 1) for i in range(polyline_points)]
+            annotation = rl.Poly3d(
+                uid=_uid(rnd=rnd),
+                points=[rl.Point3d(x, offset + curvature * x ** 2, rnd.uniform(-1.6, -1.4)) for x in distances],
+                closed=False,
+                object=obj,
+                sensor=sensors['lidar'],
+                attributes={'trackID': str(track)}
+            )
+            annotations[annotation.uid] = annotation
+            for camera in cameras:
+                width, height = sensors[camera].intrinsics.width_px, sensors[camera].intrinsics.height_px
+                annotation = rl.Poly2d(
+                    uid=_uid(rnd=rnd),
+                    points=[rl.Point2d(min(max(width / 2 + (offset + curvature * x ** 2) * width / (2 * x), 0), width),
+                                       height / 2 + height / x) for x in distances],
+                    closed=False,
+                    object=obj,
+                    sensor=sensors[camera],
+                    attributes={'trackID': str(track)}
+                )
+                annotations[annotation.uid] = annotation
+
+        frames[frame_uid] = rl.Frame(
+            uid=frame_uid,
+            timestamp=timestamp,
+            sensors=frame_sensors,
+            annotations=annotations
+        )
+
+    return raillabel.Scene(
+        metadata=rl.Metadata(schema_version='1.0.0', subschema_version='2.1.0'),
+        sensors=sensors,
+        objects=objects,
+        frames=frames
+    )
+
+
+def save_scene(scene: raillabel.Scene, data_path: str, filename: str = 'synthetic_labels.json') -> str:
+    os.makedirs(name=data_path, exist_ok=True)
+    scene_filepath = os.path.join(data_path, filename)
+    raillabel.save(scene=scene, path=scene_filepath)
+    return scene_filepath
+
+
+def generate_pcd(num_points: int, seed: int = 0) -> bytes:
+    """
+    Ascii PCD with the fields of the OSDaR23 lidar files, denser around the sensor like a real scan.
+    """
+    from pcd_preprocessor import PcdPreprocessor
+
+    rng = np.random.default_rng(seed)
+    points = np.empty(num_points, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4'),
+                                         ('timestamp', '<f8'), ('sensor_index', '<u2')])
+    distance = rng.exponential(scale=15.0, size=num_points) + 2
+    angle = rng.uniform(0, 2 * np.pi, size=num_points)
+    points['x'] = np.round(distance * np.cos(angle), 3)
+    points['y'] = np.round(distance * np.sin(angle), 3)
+    points['z'] = np.round(rng.normal(loc=0.0, scale=0.8, size=num_points), 3)
+    points['intensity'] = rng.integers(0, 255, size=num_points)
+    points['timestamp'] = np.round(1631441453.0 + np.sort(rng.uniform(0, 0.1, size=num_points)), 6)
+    points['sensor_index'] = rng.integers(0, 6, size=num_points)
+    return PcdPreprocessor.write(points=points, data_format="ascii")
+
+
+@functools.lru_cache(maxsize=4)
+def generate_image(width: int, height: int, seed: int = 0) -> bytes:
+    """
+    Lossless PNG with smooth gradients and sensor noise, compressing roughly like a camera frame.
+    """
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = rng.uniform(0, 2 * np.pi, size=3)
+    channels = [127 + 60 * np.sin(x / (80 + 40 * c) + phase[c]) * np.cos(y / (60 + 30 * c)) for c in range(3)]
+    image = np.stack(channels, axis=-1) + rng.normal(scale=6.0, size=(height, width, 3))
+    buffer = BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def save_scene_zip(scene: raillabel.Scene, zip_filepath: str, sensor_file_sizes: dict = None,
+                   default_file_size: int = 1024 * 1024, pcd_points: int = None, images: bool = False) -> str:
+    """
+    Write the scene json and a random payload for every sensor file of the scene to an OSDaR-like zip.
+    The payload of a file only depends on its uri and size, so re-saving a scene keeps the sensor files.
+
+    :param sensor_file_sizes: file size in bytes per sensor uid
+    :param default_file_size: file size in bytes of the sensors missing from `sensor_file_sizes`
+    :param pcd_points: write ascii PCDs of this many points for the lidar, instead of a random payload
+    :param images: write PNG images of the camera resolution, instead of a random payload
+    """
+    sensor_file_sizes = sensor_file_sizes if sensor_file_sizes is not None else dict()
+    work_dir = os.path.dirname(os.path.abspath(zip_filepath))
+    scene_filepath = save_scene(scene=scene, data_path=work_dir, filename='synthetic_labels.json')
+    with zipfile.ZipFile(zip_filepath, 'w', compression=zipfile.ZIP_STORED) as zip_object:
+        zip_object.write(scene_filepath, arcname=os.path.basename(scene_filepath))
+        for frame in scene.frames.values():
+            for sensor_uid, sensor_reference in frame.sensors.items():
+                if sensor_uid == 'lidar' and pcd_points is not None:
+                    zip_object.writestr(sensor_reference.uri[1:],
+                                        generate_pcd(num_points=pcd_points, seed=int(frame.uid)))
+                    continue
+                if images and sensor_reference.sensor.type == rl.SensorType.CAMERA:
+                    intrinsics = sensor_reference.sensor.intrinsics
+                    zip_object.writestr(sensor_reference.uri[1:],
+                                        generate_image(width=intrinsics.width_px, height=intrinsics.height_px,
+                                                       seed=int(frame.uid)))
+                    continue
+                file_size = sensor_file_sizes.get(sensor_uid, default_file_size)
+                zip_object.writestr(sensor_reference.uri[1:], random.Random(sensor_reference.uri).randbytes(file_size))
+    os.remove(scene_filepath)
+    return zip_filepath
+
+
+def _uid(rnd: random.Random) -> str:
+    return '%08x-%04x-%04x-%04x-%012x' % (rnd.getrandbits(32), rnd.getrandbits(16), rnd.getrandbits(16),
+                                          rnd.getrandbits(16), rnd.getrandbits(48))
+
+
+def _random_quaternion(rnd: random.Random) -> list:
+    quaternion = [rnd.gauss(0, 1) for _ in range(4)]
+    norm = sum(value ** 2 for value in quaternion) ** 0.5
+    return [value / norm for value in quaternion]
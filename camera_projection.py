@@ -0,0 +1,241 @@
+import time
+import numpy as np
+
+# Corners of the unit cube centered on the origin, scaled by the cuboid size
+_UNIT_CORNERS = np.array([[x, y, z] for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)], dtype=np.float64)
+
+
+class CameraCalibration:
+    """
+    Calibration of the cameras of a sequence, as arrays over the cameras: the values `create_mapping_json` writes
+    for every image, so the projection matches what the platform renders.
+
+    :param names: camera sensor uids
+    :param rotations: (C, 3, 3) camera to lidar rotations, camera axes x right, y down, z forward (the extrinsics
+    with `FixTransformation` applied)
+    :param translations: (C, 3) camera positions in the lidar frame
+    :param intrinsics: (C, 4) fx, fy, cx, cy
+    :param distortion: (C, 5) k1, k2, k3, p1, p2
+    :param sizes: (C, 2) image width and height
+    """
+
+    def __init__(self, names: list, rotations, translations, intrinsics, distortion, sizes):
+        self.names = list(names)
+        self.rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+        self.translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+        self.intrinsics = np.asarray(intrinsics, dtype=np.float64).reshape(-1, 4)
+        self.distortion = np.asarray(distortion, dtype=np.float64).reshape(-1, 5)
+        self.sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def max_r2(self) -> np.ndarray:
+        """
+        Squared normalized radius of the image corners, doubled, per camera.
+        """
+        fx, fy, cx, cy = self.intrinsics.T
+        width, height = self.sizes.T
+        return 2 * ((np.maximum(cx, width - cx) / fx) ** 2 + (np.maximum(cy, height - cy) / fy) ** 2)
+
+    @classmethod
+    def from_mapping_frame(cls, frame: dict, names: list, sizes: list):
+        """
+        Calibration of the images of a mapping.json frame.
+
+        :param names: camera sensor uids, in the order of the frame images
+        :param sizes: (width, height) of every image
+        """
+        from scipy.spatial.transform import Rotation
+
+        images = [frame['images'][key] for key in sorted(frame['images'], key=int)]
+        quaternions = [[image['extrinsics']['rotation'][axis] for axis in "xyzw"] for image in images]
+        return cls(
+            names=names,
+            rotations=Rotation.from_quat(quaternions).as_matrix(),
+            translations=[[image['extrinsics']['translation'][axis] for axis in "xyz"] for image in images],
+            intrinsics=[[image['intrinsics'][key] for key in ["fx", "fy", "cx", "cy"]] for image in images],
+            distortion=[[image['distortion'][key] for key in ["k1", "k2", "k3", "p1", "p2"]] for image in images],
+            sizes=sizes
+        )
+
+    def project(self, points) -> (np.ndarray, np.ndarray):
+        """
+        Project points into every camera, with the radial (k1, k2, k3) and tangential (p1, p2) distortion.
+
+        :param points: (..., 3) points in the lidar frame
+        :return: (C, ..., 2) pixel coordinates and (C, ...) depths along the optical axes
+        """
+        points = np.asarray(points, dtype=np.float64)
+        flat = points.reshape(-1, 3)
+        # Lidar to camera: R^T (p - t), for every camera at once
+        camera_points = np.einsum('cji,cnj->cni', self.rotations, flat[None, :, :] - self.translations[:, None, :])
+        depth = camera_points[..., 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = camera_points[..., 0] / depth
+            y = camera_points[..., 1] / depth
+        k1, k2, k3, p1, p2 = (self.distortion[:, i:i + 1] for i in range(5))
+        r2 = x * x + y * y
+        # The distortion polynomial only holds around the image, far outside it could fold points back in
+        r2_limit = np.minimum(r2, self.max_r2[:, None])
+        radial = 1 + r2_limit * (k1 + r2_limit * (k2 + r2_limit * k3))
+        x_distorted = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+        y_distorted = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+        fx, fy, cx, cy = (self.intrinsics[:, i:i + 1] for i in range(4))
+        uv = np.stack([fx * x_distorted + cx, fy * y_distorted + cy], axis=-1)
+        return uv.reshape((len(self),) + points.shape[:-1] + (2,)), depth.reshape((len(self),) + points.shape[:-1])
+
+
+def cuboid_corners(positions, sizes, quaternions) -> np.ndarray:
+    """
+    :param positions: (N, 3) cuboid centers
+    :param sizes: (N, 3) cuboid sizes
+    :param quaternions: (N, 4) x, y, z, w cuboid rotations
+    :return: (N, 8, 3) corners of every cuboid
+    """
+    from scipy.spatial.transform import Rotation
+
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    if len(positions) == 0:
+        return np.zeros((0, 8, 3))
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 3)
+    rotations = Rotation.from_quat(np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)).as_matrix()
+    corners = _UNIT_CORNERS[None, :, :] * sizes[:, None, :]
+    return np.einsum('nij,nkj->nki', rotations, corners) + positions[:, None, :]
+
+
+def box_iou(boxes_a, boxes_b) -> np.ndarray:
+    """
+    IoU of (..., 4) left, top, right, bottom boxes, element-wise.
+    """
+    boxes_a, boxes_b = np.asarray(boxes_a, dtype=np.float64), np.asarray(boxes_b, dtype=np.float64)
+    width = np.minimum(boxes_a[..., 2], boxes_b[..., 2]) - np.maximum(boxes_a[..., 0], boxes_b[..., 0])
+    height = np.minimum(boxes_a[..., 3], boxes_b[..., 3]) - np.maximum(boxes_a[..., 1], boxes_b[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class ProjectionQA:
+    """
+    Projects the cuboids of a frame or of a whole sequence into every camera in one batch, and checks them against
+    the 2D boxes of the same objects.
+
+    The 8 corners of every cuboid go through `CameraCalibration.project` together, in chunks of `chunk_size`
+    cuboids to bound the memory. The 2D extent of a cuboid is the box around its projected corners, clipped to
+    the image. A cuboid is visible in a camera when all its corners are at least `min_depth` in front of it and
+    its clipped extent isn't empty. A 2D box is matched to the cuboid of the same object in the same frame.
+
+    :param calibration: `CameraCalibration` of the enabled cameras
+    :param iou_threshold: matched boxes below this IoU are reported as inconsistent
+    """
+
+    def __init__(self, calibration: CameraCalibration, iou_threshold: float = 0.5, min_depth: float = 0.5,
+                 chunk_size: int = 65536):
+        self.calibration = calibration
+        self.iou_threshold = iou_threshold
+        self.min_depth = min_depth
+        self.chunk_size = chunk_size
+
+    def extents(self, corners) -> (np.ndarray, np.ndarray):
+        """
+        :param corners: (N, 8, 3) cuboid corners
+        :return: (C, N, 4) left, top, right, bottom extents and (C, N) visibility
+        """
+        corners = np.asarray(corners, dtype=np.float64).reshape(-1, 8, 3)
+        num_cameras = len(self.calibration)
+        extents = np.zeros((num_cameras, len(corners), 4))
+        visible = np.zeros((num_cameras, len(corners)), dtype=bool)
+        width, height = self.calibration.sizes[:, 0:1], self.calibration.sizes[:, 1:2]
+        for start in range(0, len(corners), self.chunk_size):
+            uv, depth = self.calibration.project(points=corners[start:start + self.chunk_size])
+            in_front = np.all(depth >= self.min_depth, axis=-1)
+            box = np.stack([
+                np.clip(uv[..., 0].min(axis=-1), 0, width),
+                np.clip(uv[..., 1].min(axis=-1), 0, height),
+                np.clip(uv[..., 0].max(axis=-1), 0, width),
+                np.clip(uv[..., 1].max(axis=-1), 0, height)
+            ], axis=-1)
+            end = start + len(box[0])
+            extents[:, start:end] = np.where(in_front[..., None], box, 0.0)
+            visible[:, start:end] = in_front & (box[..., 2] > box[..., 0]) & (box[..., 3] > box[..., 1])
+        return extents, visible
+
+    def run(self, cuboids: dict, bboxes: dict) -> dict:
+        """
+        :param cuboids: arrays of the cuboids: "frames" (N,), "object_uids" (N,), "positions" (N, 3),
+        "sizes" (N, 3), "quaternions" (N, 4)
+        :param bboxes: arrays of the 2D boxes: "frames" (M,), "cameras" (M,) camera index in the calibration,
+        "object_uids" (M,), "boxes" (M, 4) left, top, right, bottom
+        :return: the report, with the per camera counts and IoU statistics. The extents and visibility of every
+        cuboid are under "extents" and "visible", the visible cuboids without a 2D box under "missing" as
+        (cuboid index, camera index) pairs
+        """
+        start_time = time.perf_counter()
+        corners = cuboid_corners(positions=cuboids['positions'], sizes=cuboids['sizes'],
+                                 quaternions=cuboids['quaternions'])
+        extents, visible = self.extents(corners=corners)
+
+        # Key of every (frame, object): the object uids are mapped to integers shared by the cuboids and the boxes
+        cuboid_frames = np.asarray(cuboids['frames'], dtype=np.int64)
+        box_frames = np.asarray(bboxes['frames'], dtype=np.int64)
+        box_cameras = np.asarray(bboxes['cameras'], dtype=np.int64)
+        boxes = np.asarray(bboxes['boxes'], dtype=np.float64).reshape(-1, 4)
+        object_uids, object_ids = np.unique(np.concatenate([np.asarray(cuboids['object_uids'], dtype=str),
+                                                            np.asarray(bboxes['object_uids'], dtype=str)]),
+                                            return_inverse=True)
+        num_objects = max(1, len(object_uids))
+        cuboid_keys = cuboid_frames * num_objects + object_ids[:len(cuboid_frames)]
+        box_keys = box_frames * num_objects + object_ids[len(cuboid_frames):]
+
+        # Cuboid of every box, -1 if its object has no cuboid in the frame
+        box_cuboids = np.full(len(box_keys), -1, dtype=np.int64)
+        if len(cuboid_keys) > 0:
+            order = np.argsort(cuboid_keys, kind='stable')
+            sorted_keys = cuboid_keys[order]
+            positions = np.minimum(np.searchsorted(sorted_keys, box_keys), len(order) - 1)
+            found = sorted_keys[positions] == box_keys
+            box_cuboids[found] = order[positions[found]]
+
+        matched = box_cuboids >= 0
+        matched[matched] = visible[box_cameras[matched], box_cuboids[matched]]
+        ious = np.zeros(len(boxes))
+        ious[matched] = box_iou(boxes[matched], extents[box_cameras[matched], box_cuboids[matched]])
+
+        # Visible cuboids without any box of their object in the camera
+        has_box = np.zeros_like(visible)
+        has_box[box_cameras[box_cuboids >= 0], box_cuboids[box_cuboids >= 0]] = True
+        missing_cameras, missing_cuboids = np.nonzero(visible & ~has_box)
+
+        report = {"cameras": dict()}
+        for camera, name in enumerate(self.calibration.names):
+            in_camera = box_cameras == camera
+            camera_ious = ious[in_camera & matched]
+            report["cameras"][name] = {
+                "visible_cuboids": int(visible[camera].sum()),
+                "bboxes": int(in_camera.sum()),
+                "matched": int(len(camera_ious)),
+                "unmatched_bboxes": int((in_camera & ~matched).sum()),
+                "missing_bboxes": int((missing_cameras == camera).sum()),
+                "inconsistent": int((camera_ious < self.iou_threshold).sum()),
+                "mean_iou": float(camera_ious.mean()) if len(camera_ious) > 0 else None,
+                "median_iou": float(np.median(camera_ious)) if len(camera_ious) > 0 else None
+            }
+        report.update({
+            "cuboids": len(corners),
+            "bboxes": len(boxes),
+            "matched": int(matched.sum()),
+            "inconsistent": int((ious[matched] < self.iou_threshold).sum()),
+            "missing_bboxes": len(missing_cuboids),
+            "mean_iou": float(ious[matched].mean()) if matched.any() else None,
+            "seconds": time.perf_counter() - start_time,
+            "extents": extents,
+            "visible": visible,
+            "ious": ious,
+            "missing": np.stack([missing_cuboids, missing_cameras], axis=1)
+        })
+        return report
@@ -1,17 +1,56 @@
 import dtlpy as dl
 import os
+import logging
 import json
-import raillabel
 import uuid
 import shutil
 from zipfile import ZipFile
-from scipy.spatial.transform import Rotation
 import math
+import functools
+import threading
 import numpy as np
-from io import BytesIO
 
 from dtlpylidar.parsers.base_parser import LidarFileMappingParser
 
+from scene_provider import SceneProvider
+from scene_archive import SceneArchive
+from remote_archive import RemoteSceneArchive
+from scratch_window import ScratchWindow
+from stage_graph import StageGraph
+from media_pipeline import MediaPipeline
+from annotation_uploader import AnnotationUploader
+from point_ids_codec import ENCODINGS as POINT_IDS_ENCODINGS, dump_ref_item, remap_point_ids
+from point_ids_store import PointIdsStore
+from sync_manifest import SyncManifest, payload_digest
+from mapping_format import MAPPING_FORMATS, ExpandedMappingItem, write_mapping
+from downloader import file_sha256
+from image_transcoder import ImageTranscoder
+from camera_projection import CameraCalibration, ProjectionQA
+from run_report import RunReport, RateLimitedLogger, StageExecutor, sdk_call, add_bytes
+
+# This module is imported on the first `DatasetLidarOSDAR._lidar_parser` call, not at the service start. Its own
+# imports stay eager: dtlpylidar holds the parser base class, and dtlpy and numpy (a dtlpy dependency) are loaded
+# with the service runner anyway. raillabel, scipy and the numba kernels of `pcd_preprocessor` are imported on
+# first use
+
+logger = logging.getLogger(name='osdar-dataset')
+rate_limited_logger = RateLimitedLogger(logger_=logger)
+
+
+def preload_dependencies() -> threading.Thread:
+    """
+    Import the heavy dependencies of the conversion on a daemon thread, so they load while the archive downloads.
+    A conversion that needs one of them earlier waits for its import.
+    """
+
+    def _preload():
+        import raillabel  # noqa: F401
+        from scipy.spatial.transform import Rotation  # noqa: F401
+
+    thread = threading.Thread(target=_preload, name="preload-dependencies", daemon=True)
+    thread.start()
+    return thread
+
 
 class FixTransformation:
     @staticmethod
@@ -49,38 +88,240 @@ class FixTransformation:
         rotation[np.abs(rotation) < 1e-5] = 0
         return rotation
 
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def camera_rotation_fix() -> np.ndarray:
+        # Constant rotation from the RailLabel camera frame to the Dataloop camera frame
+        rotation_fix = FixTransformation.rotate_system(theta_y=90, theta_z=-90, radians=False)
+        rotation_fix.setflags(write=False)
+        return rotation_fix
+
+    @staticmethod
+    def fix_camera_transformations(quaternions: np.ndarray, positions: np.ndarray):
+        """
+        Vectorized `fix_camera_transformation` for N camera extrinsics.
+
+        :param quaternions: (N, 4) array of x, y, z, w quaternions
+        :param positions: (N, 3) array of positions
+        :return: (N, 3) array of translations and (N, 4) array of x, y, z, w rotations
+        """
+        from scipy.spatial.transform import Rotation
+
+        quaternions = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+
+        # Rotation with the rotation fix applied, the fix has no translation so the position is kept as is
+        rotation_fix = FixTransformation.camera_rotation_fix()[0:3, 0:3]
+        rotation_matrices = Rotation.from_quat(quaternions).as_matrix() @ rotation_fix
+        rotations = Rotation.from_matrix(rotation_matrices).as_quat()
+        return positions.copy(), rotations
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _fix_camera_transformation(quaternion: tuple, position: tuple):
+        translations, rotations = FixTransformation.fix_camera_transformations(
+            quaternions=np.array([quaternion]),
+            positions=np.array([position])
+        )
+        return tuple(translations[0]), tuple(rotations[0])
+
     @staticmethod
     def fix_camera_transformation(quaternion: np.ndarray, position: np.ndarray):
-        # Rotation
-        rotation_matrix = np.identity(4)
-        rotation_matrix[0:3, 0:3] = Rotation.from_quat(quaternion).as_matrix()
-
-        # Apply Rotation fix
-        theta_y = 90
-        theta_z = -90
-        rotation_fix = FixTransformation.rotate_system(theta_y=theta_y, theta_z=theta_z, radians=False)
-        rotation_matrix = rotation_matrix @ rotation_fix
-
-        # Translation
-        translation_matrix = np.identity(4)
-        translation_matrix[0:3, 3] = position.tolist()
-
-        # Extrinsic Matrix
-        extrinsic_matrix = translation_matrix @ rotation_matrix
-        translation_array = extrinsic_matrix[0:3, 3]
+        # Camera calibrations are static within a sequence, so results are memoized per extrinsics
+        translation_array, rotation_array = FixTransformation._fix_camera_transformation(
+            quaternion=tuple(np.asarray(quaternion, dtype=np.float64).tolist()),
+            position=tuple(np.asarray(position, dtype=np.float64).tolist())
+        )
         translation = {"x": translation_array[0], "y": translation_array[1], "z": translation_array[2]}
-        rotation_array = Rotation.as_quat(Rotation.from_matrix(extrinsic_matrix[0:3, 0:3]))
-        # rotation_array = FixTransformation.rotate_coordinates(rotation=quaternion)
         rotation = {"x": rotation_array[0], "y": rotation_array[1], "z": rotation_array[2], "w": rotation_array[3]}
         return translation, rotation
 
 
+class ObjectTracks:
+    """
+    Cuboid tracks of a sequence, indexed by the RailLabel object uid.
+
+    Every object uid maps straight to its builder annotation, so appending the cuboid of a frame to its track
+    doesn't scan the builder, and assembling a sequence costs O(frames x objects).
+    """
+
+    def __init__(self, builder: dl.AnnotationCollection):
+        self.builder = builder
+        self.object_ids = dict()
+        self._annotations = dict()
+
+    def add(self, object_uid: str, annotation_definition, frame_num: int, metadata: dict) -> int:
+        annotation = self._annotations.get(object_uid, None)
+
+        # Create new annotation
+        if annotation is None:
+            object_id = len(self.object_ids)
+            self.object_ids[object_uid] = object_id
+            # Same as `builder.add` for a new object id, without matching it against every builder annotation
+            annotation = dl.Annotation.new(
+                item=self.builder.item,
+                annotation_definition=annotation_definition,
+                frame_num=frame_num,
+                automated=True,
+                metadata=metadata,
+                object_id=str(object_id)
+            )
+            annotation.add_frames(
+                annotation_definition=annotation_definition,
+                frame_num=frame_num,
+                end_frame_num=frame_num
+            )
+            self.builder.annotations.append(annotation)
+            self._annotations[object_uid] = annotation
+        # Add frame for the existing annotation
+        else:
+            annotation.add_frame(
+                annotation_definition=annotation_definition,
+                frame_num=frame_num,
+            )
+            annotation.end_frame = frame_num
+            annotation.end_time = frame_num
+        return self.object_ids[object_uid]
+
+
+class LidarAnnotations:
+    """
+    Lidar annotations of a sequence converted ahead of its frames item: the json annotations (polylines and
+    semantic references) and the cuboids with their `dl.Cube3d` definitions, assembled into tracks on upload.
+
+    :param annotations: json annotations
+    :param cuboids: list of (lidar frame, raillabel.format.Cuboid, label, attributes)
+    :param definitions: `dl.Cube3d` of every cuboid, in the order of `cuboids`
+    """
+
+    def __init__(self, annotations: list, cuboids: list, definitions: list):
+        self.annotations = annotations
+        self.cuboids = cuboids
+        self.definitions = definitions
+
+
 class LidarCustomParser(LidarFileMappingParser):
     def __init__(self,
                  enable_ir_cameras: str,
                  enable_rgb_cameras: str,
-                 enable_rgb_highres_cameras: str):
+                 enable_rgb_highres_cameras: str,
+                 scene_cache_dir: str = None,
+                 scene_cache: bool = False,
+                 upload_options: dict = None,
+                 extraction_mode: str = "selective",
+                 sem_ref_encoding: str = "json",
+                 allow_compact_sem_ref: bool = False,
+                 annotation_workers: int = 8,
+                 remote_root: str = "/",
+                 incremental: bool = True,
+                 pcd_options: dict = None,
+                 image_options: dict = None,
+                 run_report_path: str = None,
+                 annotation_options: dict = None,
+                 scratch_budget: int = 2 * 1024 ** 3,
+                 max_parallel_stages: int = None,
+                 remote_options: dict = None,
+                 projection_qa: bool = False,
+                 iou_threshold: float = 0.5,
+                 lod_options: dict = None,
+                 mapping_format: str = "frames"):
+        """
+        :param scene_cache_dir: folder of the on-disk scene cache, see `SceneProvider`
+        :param scene_cache: keep the parsed scenes in the on-disk cache, for repeated local runs on the same archives
+        :param extraction_mode: "full" extracts the whole archive, "selective" extracts only the files of the
+        enabled sensors, "stream" uploads the files of the enabled sensors straight from the archive and "window"
+        extracts them frame by frame within `scratch_budget`, deleting every file once uploaded. "remote" reads
+        them from the archive url with Range requests, like "stream" but without downloading the archive first
+        :param sem_ref_encoding: point ids encoding of the semantic reference items, one of "json", "delta", "ranges".
+        The platform viewer only reads "json": the "delta" and "ranges" items are for readers that decode them with
+        `point_ids_codec.decode_ref_item`, and the viewer shows their segments as empty
+        :param allow_compact_sem_ref: accept a "delta" or "ranges" `sem_ref_encoding`, rejected otherwise
+        :param annotation_workers: number of concurrent annotation upload calls
+        :param remote_root: remote folder of the sequence, the lidar, frames and mapping.json items are uploaded
+        under it, so several sequences can share a dataset
+        :param incremental: keep a `SyncManifest` of the uploaded content with the dataset and skip what a
+        previous import already uploaded unchanged
+        :param pcd_options: `PcdPreprocessor` options (data_format, keep_fields, voxel_size, num_workers),
+        the lidar files are uploaded unchanged if None
+        :param image_options: `ImageTranscoder` options (image_format, quality, max_size, num_workers),
+        the camera images are uploaded unchanged if None
+        :param run_report_path: json file the `RunReport` of each import is saved to, only logged if None
+        :param annotation_options: `AnnotationUploader` options of the lidar annotations (max_batch_bytes,
+        max_batch_annotations, num_workers, max_retries, backoff_factor)
+        :param scratch_budget: bytes of extracted sensor files on disk at the same time, in the "window" mode
+        :param max_parallel_stages: stages of the import running at the same time, all the ready ones if None,
+        1 runs them one after the other
+        :param remote_options: `RemoteSceneArchive` options of the "remote" mode (num_connections, block_size,
+        max_gap, max_buffered_bytes)
+        :param projection_qa: project the cuboids into the enabled cameras and report how well they agree with the
+        2D boxes, a QA pass of its own on every import
+        :param iou_threshold: IoU below which a 2D box is reported as inconsistent with its cuboid
+        :param lod_options: `LodTiler` options (levels, base_resolution, tile_depth, data_format, num_workers),
+        the level-of-detail tiles of every lidar frame are uploaded next to its PCD and referenced from the
+        mapping.json. No tiles if None
+        :param mapping_format: "frames" repeats the camera calibrations in every image of every frame, the format
+        dtlpylidar reads. "shared" writes them once in the mapping.json and references them from the images, a
+        smaller file that `parse_data` expands back, but other readers of the mapping.json need `expand_mapping`
+        """
+        if extraction_mode not in ["full", "selective", "stream", "window", "remote"]:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Unsupported extraction mode: '{extraction_mode}'")
+        if mapping_format not in MAPPING_FORMATS:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Unsupported mapping format: '{mapping_format}'")
+        if sem_ref_encoding not in POINT_IDS_ENCODINGS:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Unsupported point ids encoding: '{sem_ref_encoding}'")
+        if sem_ref_encoding != "json" and not allow_compact_sem_ref:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"The '{sem_ref_encoding}' point ids encoding can't be read by the "
+                                                   f"platform viewer, set allow_compact_sem_ref to use it")
+        self.extraction_mode = extraction_mode
+        self.mapping_format = mapping_format
+        self.scratch_budget = scratch_budget
+        self.max_parallel_stages = max_parallel_stages
+        self.remote_options = remote_options if remote_options is not None else dict()
+        self.projection_qa = projection_qa
+        self.iou_threshold = iou_threshold
+        # `ProjectionQA` report of the last import
+        self.projection_report = None
+        # `ScratchWindow` report of the last "window" mode import
+        self.scratch_report = None
+        self.sem_ref_encoding = sem_ref_encoding
+        self.annotation_workers = max(1, annotation_workers)
+        self.remote_root = "/" + remote_root.strip("/") if remote_root.strip("/") else ""
+        self.incremental = incremental
+        self.manifest = None
+        preload_dependencies()
+        self.pcd_preprocessor = None
+        if pcd_options is not None:
+            from pcd_preprocessor import PcdPreprocessor
+
+            self.pcd_preprocessor = PcdPreprocessor(**pcd_options)
+            # Compile the kernels while the archive downloads, a cold container has no numba cache
+            self.pcd_preprocessor.warmup(background=True)
+        self.lod_tiler = None
+        if lod_options is not None:
+            from pcd_tiling import LodTiler
+
+            self.lod_tiler = LodTiler(**lod_options)
+            if self.pcd_preprocessor is None:
+                self.lod_tiler.warmup(background=True)
+        self.image_transcoder = None
+        if image_options is not None:
+            # Its worker pool lives for a `custom_parse_data` call
+            self.image_transcoder = ImageTranscoder(**image_options)
+        self.run_report_path = run_report_path
+        self.annotation_uploader = AnnotationUploader(**(annotation_options if annotation_options is not None
+                                                         else dict()))
+        # Stage timings of the last `custom_parse_data`
+        self.run_report = None
+        # New index of every original point of the downsampled frames, by lidar frame
+        self.point_maps = dict()
         self.attributes_id_mapping_dict = None
+        self.scene_provider = SceneProvider(cache_dir=scene_cache_dir, enable_cache=scene_cache)
+        # `MediaUploader` options: num_workers, batch_size, max_inflight_bytes, max_inflight_files, ...
+        self.upload_options = upload_options if upload_options is not None else dict()
         # Handle Cameras Options
         ir_cameras = ['ir_center', 'ir_left', 'ir_right']
         rgb_cameras = ['rgb_center', 'rgb_left', 'rgb_right']
@@ -97,7 +338,8 @@ class LidarCustomParser(LidarFileMappingParser):
         super().__init__()
 
     def attributes_id_mapping(self, dataset):
-        recipe = dataset.recipes.list()[0]
+        with sdk_call(name="recipes.list"):
+            recipe = dataset.recipes.list()[0]
         attributes_mapping = {}
 
         instructions = recipe.metadata.get('system', dict()).get('script', dict()).get('entryPoints', dict()).get(
@@ -112,14 +354,18 @@ class LidarCustomParser(LidarFileMappingParser):
         self.attributes_id_mapping_dict = attributes_mapping
 
     @staticmethod
-    def extract_zip_file(zip_filepath: str):
+    def extract_zip_file(zip_filepath: str, archive: SceneArchive = None, members: list = None):
         data_path = str(uuid.uuid4())
 
         try:
             os.makedirs(name=data_path, exist_ok=True)
 
-            with ZipFile(zip_filepath, 'r') as zip_object:
-                zip_object.extractall(path=os.path.join(".", data_path))
+            if archive is not None and members is not None:
+                archive.extract(members=members, path=os.path.join(".", data_path))
+            else:
+                with ZipFile(zip_filepath, 'r') as zip_object:
+                    zip_object.extractall(path=os.path.join(".", data_path))
+                    add_bytes(num_bytes=sum(info.file_size for info in zip_object.infolist()))
 
         except Exception as e:
             shutil.rmtree(path=data_path, ignore_errors=True)
@@ -130,82 +376,100 @@ class LidarCustomParser(LidarFileMappingParser):
         data_path = os.path.join(os.getcwd(), data_path)
         return data_path
 
-    def upload_pcds_and_images(self, data_path: str, dataset: dl.Dataset, progress: dl.Progress = None):
-        scene = None
-        dir_items = os.listdir(path=data_path)
-        for dir_item in dir_items:
-            if ".json" in dir_item:
-                try:
-                    calibration_json = os.path.join(data_path, dir_item)
-                    scene = raillabel.load(calibration_json)
-                    break
-                except:
-                    continue
+    def extract_sensor_data(self, archive: SceneArchive, data_path: str):
+        scene = self.scene_provider.get_scene(data_path=data_path)
+        members = archive.sensor_members(scene=scene, sensors=['lidar'] + self.camera_list)
+        archive.extract(members=members, path=data_path)
 
-        if scene is None:
-            dl.exceptions.NotFound("Couldn't find supported json for 'raillabel'")
+    def upload_pcds_and_images(self, data_path: str, dataset: dl.Dataset, progress: dl.Progress = None,
+                               archive: SceneArchive = None, scratch: ScratchWindow = None):
+        """
+        Upload the lidar and camera files of every frame, see `MediaPipeline`.
+        If `archive` is given, the files are streamed from the zip straight into the uploader, instead of
+        being read from `data_path`. If `scratch` is given, the files are extracted to its window as the frames
+        are uploaded, and released as soon as uploaded or read by the preprocessing.
+        """
+        scene = self.scene_provider.get_scene(data_path=data_path)
+        pipeline = MediaPipeline(items_repository=dataset.items,
+                                 data_path=data_path,
+                                 remote_root=self.remote_root,
+                                 cameras=self.camera_list,
+                                 archive=archive,
+                                 scratch=scratch,
+                                 pcd_preprocessor=self.pcd_preprocessor,
+                                 lod_tiler=self.lod_tiler,
+                                 image_transcoder=self.image_transcoder,
+                                 manifest=self.manifest,
+                                 upload_options=self.upload_options)
+        # Filled by the pipeline as the frames are preprocessed
+        self.point_maps = pipeline.point_maps
+        return pipeline.run(frames=list(scene.frames.items()), progress=progress)
 
-        # Loop through frames
-        frames = scene.frames
-        total_lidar_frames = len(frames)
-        modulo_report = total_lidar_frames // 10
-        for lidar_frame, (frame_num, frame) in enumerate(frames.items()):
-            # Sensor ego pose
-            ego_pose = frame.sensors['lidar']
-            pcd_filepath = os.path.join(data_path, ego_pose.uri[1:])
-            dataset.items.upload(
-                local_path=pcd_filepath,
-                remote_path=f"/lidar",
-                remote_name=f"{lidar_frame}.pcd",
-                overwrite=True
-            )
-            print(
-                f"Uploaded to 'lidar' directory, the file: '{pcd_filepath}', "
-                f"as: '/lidar/{lidar_frame}.pcd'"
-            )
+    def image_extension(self, uri: str) -> str:
+        if self.image_transcoder is not None:
+            return self.image_transcoder.extension
+        return os.path.splitext(p=uri)[1]
 
-            # Loop through images
-            for idx, image in enumerate(self.camera_list):
-                # Get sensor
-                sensor_reference = frame.sensors[image]
-                image_filepath = os.path.join(data_path, sensor_reference.uri[1:])
-                ext = os.path.splitext(p=sensor_reference.uri)[1]
-                dataset.items.upload(
-                    local_path=image_filepath,
-                    remote_path=f"/frames/{lidar_frame}",
-                    remote_name=f"{idx}{ext}",
-                    overwrite=True
-                )
-                print(
-                    f"Uploaded to 'frames' directory, the file: '{image_filepath}', "
-                    f"as: '/frames/{lidar_frame}/{idx}{ext}'"
-                )
-
-            if progress is not None:
-                if (lidar_frame + 1) % modulo_report == 0:
-                    _progress = 40 + int(40 * ((lidar_frame + 1) / total_lidar_frames))
-                    progress.update(progress=_progress, message="Uploading source data...")
+    def image_scale(self, sensor) -> (float, float):
+        """
+        Scale of the pixel coordinates of a camera, when its images are resized by the transcoding.
+        """
+        if self.image_transcoder is None or sensor is None or sensor.intrinsics is None:
+            return 1.0, 1.0
+        return self.image_transcoder.scale(width=sensor.intrinsics.width_px, height=sensor.intrinsics.height_px)
 
-    def create_mapping_json(self, data_path: str, dataset: dl.Dataset):
-        scene = None
-        dir_items = os.listdir(path=data_path)
-        for dir_item in dir_items:
-            if ".json" in dir_item:
-                try:
-                    calibration_json = os.path.join(data_path, dir_item)
-                    scene = raillabel.load(calibration_json)
-                    break
-                except:
-                    continue
+    def image_calibration(self, sensor) -> dict:
+        """
+        Intrinsics, fixed extrinsics and distortion of a camera in the mapping.json, in the pixels of the
+        uploaded images.
+        """
+        # Get extrinsics
+        extrinsics = sensor.extrinsics
+        quaternion = np.array([extrinsics.quat.x, extrinsics.quat.y, extrinsics.quat.z, extrinsics.quat.w])
+        position = np.array([extrinsics.pos.x, extrinsics.pos.y, extrinsics.pos.z])
 
-        if scene is None:
-            dl.exceptions.NotFound("Couldn't find supported json for 'raillabel'")
+        # Apply camera transformation fix
+        translation, rotation = FixTransformation.fix_camera_transformation(
+            quaternion=quaternion,
+            position=position
+        )
 
-        output_frames = dict()
+        scale_x, scale_y = self.image_scale(sensor=sensor)
+        return {
+            "intrinsics": {
+                "fx": sensor.intrinsics.camera_matrix[0] * scale_x,
+                "fy": sensor.intrinsics.camera_matrix[5] * scale_y,
+                "cx": sensor.intrinsics.camera_matrix[2] * scale_x,
+                "cy": sensor.intrinsics.camera_matrix[6] * scale_y,
+            },
+            "extrinsics": {
+                "translation": {
+                    "x": translation["x"],
+                    "y": translation["y"],
+                    "z": translation["z"]
+                },
+                "rotation": {
+                    "x": rotation["x"],
+                    "y": rotation["y"],
+                    "z": rotation["z"],
+                    "w": rotation["w"]
+                },
+            },
+            "distortion": {
+                "k1": sensor.intrinsics.distortion[0],
+                "k2": sensor.intrinsics.distortion[1],
+                "k3": sensor.intrinsics.distortion[2],
+                "p1": sensor.intrinsics.distortion[3],
+                "p2": sensor.intrinsics.distortion[4]
+            }
+        }
 
-        # Loop through frames
-        frames = scene.frames
-        for lidar_frame, (frame_num, frame) in enumerate(frames.items()):
+    def mapping_frames(self, scene, calibrations: dict):
+        """
+        Yield the mapping.json dict of every frame, the images reference their camera in `calibrations` in the
+        "shared" format and carry its calibration in the "frames" format.
+        """
+        for lidar_frame, (frame_num, frame) in enumerate(scene.frames.items()):
             # Sensor ego pose
             ego_pose = frame.sensors['lidar']
 
@@ -230,269 +494,429 @@ class LidarCustomParser(LidarFileMappingParser):
                 },
                 "images": dict()
             }
+            if self.lod_tiler is not None:
+                # Level-of-detail index of the frame, the coarse tiles can be loaded before the full PCD
+                output_frame_dict['lod_index'] = self.lod_tiler.index_path(path=output_frame_dict['path'])
 
             # Loop through images
             for idx, image in enumerate(self.camera_list):
                 # Get sensor
                 sensor_reference = frame.sensors[image]
 
-                # Get extrinsics
-                extrinsics = sensor_reference.sensor.extrinsics
-                quaternion = np.array([extrinsics.quat.x, extrinsics.quat.y, extrinsics.quat.z, extrinsics.quat.w])
-                position = np.array([extrinsics.pos.x, extrinsics.pos.y, extrinsics.pos.z])
-
-                # Apply camera transformation fix
-                translation, rotation = FixTransformation.fix_camera_transformation(
-                    quaternion=quaternion,
-                    position=position
-                )
-
                 # Output image dict
-                ext = os.path.splitext(p=sensor_reference.uri)[1]
+                ext = self.image_extension(uri=sensor_reference.uri)
                 image_dict = {
                     "metadata": {
                         "frame": int(frame_num),
                         "image_uri": sensor_reference.uri,
                     },
                     "image_path": f"frames/{lidar_frame}/{idx}{ext}",
-                    "timestamp": float(sensor_reference.timestamp),
-                    "intrinsics": {
-                        "fx": sensor_reference.sensor.intrinsics.camera_matrix[0],
-                        "fy": sensor_reference.sensor.intrinsics.camera_matrix[5],
-                        "cx": sensor_reference.sensor.intrinsics.camera_matrix[2],
-                        "cy": sensor_reference.sensor.intrinsics.camera_matrix[6],
-                    },
-                    "extrinsics": {
-                        "translation": {
-                            "x": translation["x"],
-                            "y": translation["y"],
-                            "z": translation["z"]
-                        },
-                        "rotation": {
-                            "x": rotation["x"],
-                            "y": rotation["y"],
-                            "z": rotation["z"],
-                            "w": rotation["w"]
-                        },
-                    },
-                    "distortion": {
-                        "k1": sensor_reference.sensor.intrinsics.distortion[0],
-                        "k2": sensor_reference.sensor.intrinsics.distortion[1],
-                        "k3": sensor_reference.sensor.intrinsics.distortion[2],
-                        "p1": sensor_reference.sensor.intrinsics.distortion[3],
-                        "p2": sensor_reference.sensor.intrinsics.distortion[4]
-                    }
+                    "timestamp": float(sensor_reference.timestamp)
                 }
+                if self.mapping_format == "shared":
+                    image_dict["calibration"] = image
+                else:
+                    image_dict.update(calibrations[image])
                 output_frame_dict['images'][str(idx)] = image_dict
 
-            output_frames[str(lidar_frame)] = output_frame_dict
+            yield output_frame_dict
+
+    def create_mapping_json(self, data_path: str, dataset: dl.Dataset):
+        scene = self.scene_provider.get_scene(data_path=data_path)
 
-        mapping_data = {"frames": output_frames}
+        # The calibrations are static within a sequence, computed once per camera
+        calibrations = {image: self.image_calibration(sensor=scene.sensors[image]) for image in self.camera_list}
         mapping_filepath = os.path.join(data_path, "mapping.json")
-        with open(mapping_filepath, "w") as f:
-            json.dump(obj=mapping_data, fp=f, indent=4)
+        with open(mapping_filepath, "wb") as f:
+            digest, num_bytes = write_mapping(fp=f, frames=self.mapping_frames(scene=scene, calibrations=calibrations),
+                                              calibrations=calibrations if self.mapping_format == "shared" else None)
+
+        if self.manifest is not None:
+            key = f"{self.remote_root}/mapping.json"
+            entry = self.manifest.get(key=key, digest=digest)
+            if entry is not None:
+                try:
+                    with sdk_call(name="items.get"):
+                        mapping_item = dataset.items.get(item_id=entry['item_id'])
+                    self.manifest.skip(key=key, digest=digest, calls=0)
+                    return mapping_item
+                except dl.exceptions.NotFound:
+                    logger.warning(msg=f"Item of the unchanged '{key}' was deleted, uploading it again")
 
-        mapping_item = dataset.items.upload(local_path=mapping_filepath, overwrite=True)
+        with sdk_call(name="items.upload"):
+            mapping_item = dataset.items.upload(local_path=mapping_filepath,
+                                                remote_path=self.remote_root or "/",
+                                                overwrite=True)
+        add_bytes(num_bytes=num_bytes)
+        if self.manifest is not None:
+            self.manifest.record(key=key, digest=digest, num_bytes=num_bytes, item_id=mapping_item.id)
         return mapping_item
 
+    def camera_calibration(self, scene) -> CameraCalibration:
+        """
+        Calibration of the enabled cameras, with the intrinsics, distortion and fixed extrinsics of the mapping.json,
+        in the pixels of the original images.
+        """
+        from scipy.spatial.transform import Rotation
+
+        sensors = [scene.sensors[camera] for camera in self.camera_list]
+        translations, rotations = FixTransformation.fix_camera_transformations(
+            quaternions=[[s.extrinsics.quat.x, s.extrinsics.quat.y, s.extrinsics.quat.z, s.extrinsics.quat.w]
+                         for s in sensors],
+            positions=[[s.extrinsics.pos.x, s.extrinsics.pos.y, s.extrinsics.pos.z] for s in sensors]
+        )
+        return CameraCalibration(
+            names=self.camera_list,
+            rotations=Rotation.from_quat(rotations).as_matrix(),
+            translations=translations,
+            intrinsics=[[s.intrinsics.camera_matrix[0], s.intrinsics.camera_matrix[5],
+                         s.intrinsics.camera_matrix[2], s.intrinsics.camera_matrix[6]] for s in sensors],
+            distortion=[list(s.intrinsics.distortion[:5]) for s in sensors],
+            sizes=[[s.intrinsics.width_px, s.intrinsics.height_px] for s in sensors]
+        )
+
+    def check_projections(self, data_path: str) -> dict:
+        """
+        Project the cuboids of the sequence into the enabled cameras and compare them with the RailLabel 2D boxes
+        of the same objects, see `ProjectionQA`.
+        """
+        import raillabel
+
+        scene = self.scene_provider.get_scene(data_path=data_path)
+        cameras = {camera: idx for idx, camera in enumerate(self.camera_list)}
+        cuboids = {"frames": list(), "object_uids": list(), "positions": list(), "sizes": list(),
+                   "quaternions": list()}
+        bboxes = {"frames": list(), "cameras": list(), "object_uids": list(), "boxes": list()}
+        for lidar_frame, frame in enumerate(scene.frames.values()):
+            for annotation in frame.annotations.values():
+                if isinstance(annotation, raillabel.format.Cuboid):
+                    cuboids['frames'].append(lidar_frame)
+                    cuboids['object_uids'].append(annotation.object.uid)
+                    cuboids['positions'].append([annotation.pos.x, annotation.pos.y, annotation.pos.z])
+                    cuboids['sizes'].append([annotation.size.x, annotation.size.y, annotation.size.z])
+                    cuboids['quaternions'].append([annotation.quat.x, annotation.quat.y, annotation.quat.z,
+                                                   annotation.quat.w])
+                elif isinstance(annotation, raillabel.format.Bbox) and annotation.sensor.uid in cameras:
+                    bboxes['frames'].append(lidar_frame)
+                    bboxes['cameras'].append(cameras[annotation.sensor.uid])
+                    bboxes['object_uids'].append(annotation.object.uid)
+                    bboxes['boxes'].append([annotation.pos.x - annotation.size.x / 2,
+                                            annotation.pos.y - annotation.size.y / 2,
+                                            annotation.pos.x + annotation.size.x / 2,
+                                            annotation.pos.y + annotation.size.y / 2])
+
+        qa = ProjectionQA(calibration=self.camera_calibration(scene=scene), iou_threshold=self.iou_threshold)
+        report = qa.run(cuboids=cuboids, bboxes=bboxes)
+        mean_iou = f"{report['mean_iou']:.3f}" if report['mean_iou'] is not None else "-"
+        logger.info(
+            msg=f"Projection QA: {report['cuboids']} cuboids x {len(self.camera_list)} cameras in "
+                f"{report['seconds']:.2f}s, {report['matched']} of {report['bboxes']} 2D boxes matched, mean IoU "
+                f"{mean_iou}, {report['inconsistent']} below {self.iou_threshold}, "
+                f"{report['missing_bboxes']} visible cuboids without a 2D box"
+        )
+        self.projection_report = report
+        return report
+
+    def parse_data(self, mapping_item: dl.Item) -> dl.Item:
+        """
+        dtlpylidar `parse_data`, which reads the calibrations in every image: a "shared" mapping.json is expanded
+        as it is downloaded.
+        """
+        if self.mapping_format == "shared":
+            mapping_item = ExpandedMappingItem(item=mapping_item)
+        return super().parse_data(mapping_item=mapping_item)
+
+    def parse_frames(self, mapping_item: dl.Item) -> dl.Item:
+        """
+        `parse_data`, skipped if the frames item of the same mapping.json was already created.
+        """
+        if self.manifest is None:
+            return self.parse_data(mapping_item=mapping_item)
+
+        key = f"frames/{mapping_item.id}"
+        digest = self.manifest.entries.get(f"{self.remote_root}/mapping.json", dict()).get('digest')
+        entry = self.manifest.get(key=key, digest=digest)
+        if entry is not None:
+            try:
+                with sdk_call(name="items.get"):
+                    frames_item = mapping_item.dataset.items.get(item_id=entry['item_id'])
+                self.manifest.skip(key=key, digest=digest, calls=0)
+                return frames_item
+            except dl.exceptions.NotFound:
+                logger.warning(msg=f"Frames item of '{mapping_item.filename}' was deleted, parsing it again")
+        frames_item = self.parse_data(mapping_item=mapping_item)
+        self.manifest.record(key=key, digest=digest, item_id=frames_item.id)
+        return frames_item
+
+    def convert_attributes(self, annotation) -> dict:
+        attributes = dict()
+        for key, value in annotation.attributes.items():
+            if isinstance(value, bool) or key == 'carrying':
+                attributes[self.attributes_id_mapping_dict.get(key)] = value
+            else:
+                attributes[self.attributes_id_mapping_dict.get(key)] = str(value).replace(' %', '%')
+        return attributes
+
     @staticmethod
-    def upload_sem_ref_items(frames_item: dl.Item, ref_items_dict, dl_annotations):
-        for annotation_uid, annotation_data in ref_items_dict.items():
-            buffer = BytesIO()
-            buffer.write(json.dumps(annotation_data.get('ref_item_json')).encode())
-            buffer.seek(0)
-            buffer.name = f"{annotation_uid}.json"
-            sem_ref_item = frames_item.dataset.items.upload(
-                remote_path="/.dataloop/sem_ref",
-                local_path=buffer,
-                overwrite=True
-            )
-            annotation = annotation_data.get('ref_annotation')
+    def convert_cuboids(cuboids: list) -> list:
+        """
+        Convert the cuboids of a scene to `dl.Cube3d` definitions in one batch.
+        All the rotations go through a single vectorized `Rotation.from_quat(...).as_euler` call.
+
+        :param cuboids: list of (raillabel.format.Cuboid, label, attributes)
+        :return: list of dl.Cube3d, in the order of `cuboids`
+        """
+        if len(cuboids) == 0:
+            return list()
+
+        from scipy.spatial.transform import Rotation
+
+        positions = np.array([[c.pos.x, c.pos.y, c.pos.z] for c, _, _ in cuboids], dtype=np.float64)
+        scales = np.array([[c.size.x, c.size.y, c.size.z] for c, _, _ in cuboids], dtype=np.float64)
+        quaternions = np.array([[c.quat.x, c.quat.y, c.quat.z, c.quat.w] for c, _, _ in cuboids], dtype=np.float64)
+        rotations = Rotation.from_quat(quaternions).as_euler(seq="xyz", degrees=False)
+
+        return [
+            dl.Cube3d(
+                label=label,
+                position=position,
+                scale=scale,
+                rotation=rotation,
+                attributes=attributes
+            ) for (_, label, attributes), position, scale, rotation in zip(
+                cuboids, positions.tolist(), scales.tolist(), rotations)
+        ]
+
+    @staticmethod
+    def convert_poly3d(annotation, label: str, attributes: dict, lidar_frame: int) -> dict:
+        """
+        Convert a Poly3d annotation to a json annotation. Unlike the cuboids it's not batched: there is no math on
+        the points, so gathering them into an array and back only adds a copy and is slower than one comprehension.
+        """
+        # The first point is the polyline position, the rest are its points
+        dl_points = [{'x': point_3d.x, 'y': point_3d.y, 'z': point_3d.z} for point_3d in annotation.points]
+        return {
+            'type': 'polyline_3d',
+            'label': label,
+            'coordinates': {'interpolation': 'Linear',
+                            'lineType': 'linear',
+                            'points': dl_points[1:],
+                            'position': dl_points[0] if len(dl_points) > 0 else {}},
+            "metadata": {
+                "system": {
+                    "frame": lidar_frame,
+                    "attributes": attributes
+                },
+                "object_uid": f"{annotation.object.uid}",
+                "uid": annotation.uid
+            }
+        }
+
+    @staticmethod
+    def upload_sem_ref_items(dataset: dl.Dataset, point_ids_store: PointIdsStore, ref_items: dict, dl_annotations,
+                             encoding: str = "json", manifest: SyncManifest = None):
+        """
+        Write and upload the semantic reference item of every Seg3d annotation, one at a time, from the point ids
+        of `point_ids_store`.
+
+        :param ref_items: dict of annotation uid to its label, attributes and object uid
+        """
+        for annotation_uid in point_ids_store.uids():
+            annotation_data = ref_items[annotation_uid]
+            ref_item_filepath = os.path.join(point_ids_store.path, f"{annotation_uid}.json")
+            with open(ref_item_filepath, 'wb') as f:
+                # Frames in the order of the sorted json keys, so the file digest is the payload digest
+                dump_ref_item(frames=point_ids_store.read(uid=annotation_uid, sort_key=str), fp=f, encoding=encoding)
+            try:
+                key = f"/.dataloop/sem_ref/{annotation_uid}.json"
+                digest, num_bytes = f"sha256:{file_sha256(filepath=ref_item_filepath)}", \
+                    os.path.getsize(ref_item_filepath)
+                entry = manifest.get(key=key, digest=digest) if manifest is not None else None
+                if entry is not None:
+                    manifest.skip(key=key, digest=digest)
+                    sem_ref_item_id = entry['item_id']
+                else:
+                    with sdk_call(name="items.upload"):
+                        sem_ref_item = dataset.items.upload(
+                            remote_path="/.dataloop/sem_ref",
+                            local_path=ref_item_filepath,
+                            overwrite=True
+                        )
+                    add_bytes(num_bytes=num_bytes)
+                    sem_ref_item_id = sem_ref_item.id
+                    if manifest is not None:
+                        manifest.record(key=key, digest=digest, num_bytes=num_bytes, item_id=sem_ref_item_id)
+            finally:
+                os.remove(ref_item_filepath)
+            frames = point_ids_store.frames(uid=annotation_uid)
             ann_def = {"type": "ref_semantic_3d",
                        "label": annotation_data.get('label'),
                        "coordinates": {
                            "interpolation": "none",
                            "mode": "overwrite",
-                           "ref": f"{sem_ref_item.id}",
+                           "ref": f"{sem_ref_item_id}",
                            "refType": "id"
                        },
                        "metadata": {
                            "system": {
                                "attributes": annotation_data.get('attributes'),
-                               "frame": int(min(annotation_data.get('ref_item_json').get('frames').keys())),
-                               "endFrame": int(max(annotation_data.get('ref_item_json').get('frames').keys()))
+                               "frame": frames[0],
+                               "endFrame": frames[-1]
                            },
-                           "object_uid": annotation.object.uid,
-                           "uid": annotation.uid
+                           "object_uid": annotation_data.get('object_uid'),
+                           "uid": annotation_uid
                        }}
             dl_annotations.append(ann_def)
 
-    def upload_pre_annotation_lidar(self, frames_item: dl.Item, data_path: str):
-        self.attributes_id_mapping(dataset=frames_item.dataset)
-        scene = None
-        dir_items = os.listdir(path=data_path)
-        for dir_item in dir_items:
-            if ".json" in dir_item:
-                try:
-                    calibration_json = os.path.join(data_path, dir_item)
-                    scene = raillabel.load(calibration_json)
-                    break
-                except:
-                    continue
-        dl_annotations = list()
-        builder = frames_item.annotations.builder()
+    def convert_pre_annotation_lidar(self, dataset: dl.Dataset, data_path: str) -> LidarAnnotations:
+        """
+        Convert the lidar annotations of the scene and upload their semantic reference items. Only needs the
+        frames item for the upload, so it can run alongside the media upload, once the point maps of the
+        downsampled frames are known.
+        """
+        import raillabel
 
-        next_object_id = 0
-        object_id_map = dict()
+        if self.attributes_id_mapping_dict is None:
+            self.attributes_id_mapping(dataset=dataset)
+        scene = self.scene_provider.get_scene(data_path=data_path)
+        dl_annotations = list()
 
         # Loop through frames
         frames = scene.frames
-        ref_items_dict = dict()
+        # The point ids go to disk as they're converted, only the annotation data of each item stays in memory
+        point_ids_store = PointIdsStore(path=os.path.join(data_path, ".point_ids"))
+        ref_items = dict()
+        cuboids = list()
         for lidar_frame, (frame_num, frame) in enumerate(frames.items()):
-            print(f"Frame: {lidar_frame}")
+            rate_limited_logger.log(level=logging.INFO,
+                                    msg=f"Converting lidar annotations of frame {lidar_frame}/{len(frames)}",
+                                    key="lidar_frame")
             annotations = frame.annotations
             for annotation_id, annotation in annotations.items():
                 label = annotation.object.type.replace('_', ' ')
-                attributes = dict()
-                for key, value in annotation.attributes.items():
-                    if isinstance(value, bool) or key == 'carrying':
-                        attributes[self.attributes_id_mapping_dict.get(key)] = value
-                    else:
-                        attributes[self.attributes_id_mapping_dict.get(key)] = str(value).replace(' %', '%')
+                attributes = self.convert_attributes(annotation=annotation)
                 if isinstance(annotation, raillabel.format.Cuboid):
-                    position = [
-                        annotation.pos.x,
-                        annotation.pos.y,
-                        annotation.pos.z
-                    ]
-                    scale = [
-                        annotation.size.x,
-                        annotation.size.y,
-                        annotation.size.z
-                    ]
-                    rotation = Rotation.from_quat([
-                        annotation.quat.x,
-                        annotation.quat.y,
-                        annotation.quat.z,
-                        annotation.quat.w
-                    ])
-
-                    annotation_definition = dl.Cube3d(
-                        label=label,
-                        position=position,
-                        scale=scale,
-                        rotation=rotation.as_euler(seq="xyz", degrees=False),
-                        attributes=attributes
-                    )
-
-                    object_id = object_id_map.get(annotation.object.uid, None)
-
-                    # Create new annotation
-                    if object_id is None:
-                        object_id = next_object_id
-                        object_id_map[annotation.object.uid] = object_id
-                        next_object_id += 1
-
-                        metadata = {"object_uid": annotation.object.uid,
-                                    "system": {"frameNumberBased": True},
-                                    "uid": annotation.uid}
-                        builder.add(
-                            annotation_definition=annotation_definition,
-                            frame_num=lidar_frame,
-                            end_frame_num=lidar_frame,
-                            object_id=str(object_id),
-                            metadata=metadata
-                        )
-                    # Add frame for the existing annotation
-                    else:
-                        for idx, builder_annotation in enumerate(builder):
-                            if builder_annotation.object_id == str(object_id):
-                                builder[idx].add_frame(
-                                    annotation_definition=annotation_definition,
-                                    frame_num=lidar_frame,
-                                )
-                                builder[idx].end_frame = lidar_frame
-                                builder[idx].end_time = lidar_frame
-                                break
-
-                    print(
-                        f"Adding annotation: "
-                        f"(Type: Cube3d, Label: {label}, ObjectID: {object_id}, Frame: {lidar_frame})"
-                    )
+                    # Cuboids are converted in a single batch after the loop
+                    cuboids.append((lidar_frame, annotation, label, attributes))
 
                 elif isinstance(annotation, raillabel.format.Poly3d):
-                    ann_def = {
-                        'type': 'polyline_3d',
-                        'label': label,
-                        'coordinates': {'interpolation': 'Linear',
-                                        'lineType': 'linear',
-                                        'points': [],
-                                        'position': {}},
-                        "metadata": {
-                            "system": {
-                                "frame": lidar_frame,
-                                "attributes": attributes
-                            },
-                            "object_uid": f"{annotation.object.uid}",
-                            "uid": annotation.uid
-                        }
-                    }
-                    for point_3d in annotation.points:
-                        dl_point = {'x': point_3d.x, 'y': point_3d.y, 'z': point_3d.z}
-                        if len(ann_def['coordinates']['position']) == 0:
-                            ann_def['coordinates']['position'] = dl_point
-                        else:
-                            ann_def['coordinates']['points'].append(dl_point)
-                    dl_annotations.append(ann_def)
+                    dl_annotations.append(self.convert_poly3d(
+                        annotation=annotation,
+                        label=label,
+                        attributes=attributes,
+                        lidar_frame=lidar_frame
+                    ))
                 elif isinstance(annotation, raillabel.format.Seg3d):
-                    if annotation.uid not in ref_items_dict:
-                        ref_items_dict[annotation.uid] = {
-                            "ref_item_json": {
-                                "type": "index",
-                                "frames": {}
-                            },
+                    if annotation.uid not in ref_items:
+                        ref_items[annotation.uid] = {
                             "label": label,
                             "attributes": attributes,
-                            "ref_annotation": annotation}
-                    ref_items_dict[annotation.uid]['ref_item_json']["frames"][str(lidar_frame)] = annotation.point_ids
-        self.upload_sem_ref_items(frames_item=frames_item,
-                                  ref_items_dict=ref_items_dict,
-                                  dl_annotations=dl_annotations)
-        frames_item.annotations.upload(dl_annotations)
-        print(f"Annotations Object UID Mapping: {object_id_map}")
-        builder.upload()
-
-    def upload_pre_annotation_images(self, frames_item: dl.Item, data_path: str):
+                            "object_uid": annotation.object.uid
+                        }
+                    point_ids_store.append(uid=annotation.uid, frame=lidar_frame, point_ids=remap_point_ids(
+                        point_ids=annotation.point_ids,
+                        point_map=self.point_maps.get(lidar_frame, None)
+                    ))
+
+        annotation_definitions = self.convert_cuboids(cuboids=[cuboid[1:] for cuboid in cuboids])
+        with point_ids_store:
+            self.upload_sem_ref_items(dataset=dataset,
+                                      point_ids_store=point_ids_store,
+                                      ref_items=ref_items,
+                                      dl_annotations=dl_annotations,
+                                      encoding=self.sem_ref_encoding,
+                                      manifest=self.manifest)
+        return LidarAnnotations(annotations=dl_annotations, cuboids=cuboids, definitions=annotation_definitions)
+
+    def upload_pre_annotation_lidar(self, frames_item: dl.Item, data_path: str, converted: LidarAnnotations = None):
+        """
+        :param converted: the `convert_pre_annotation_lidar` result, converted here if None
+        """
+        if converted is None:
+            converted = self.convert_pre_annotation_lidar(dataset=frames_item.dataset, data_path=data_path)
+        dl_annotations = converted.annotations
+        cuboids = converted.cuboids
+        annotation_definitions = converted.definitions
+        builder = frames_item.annotations.builder()
+        tracks = ObjectTracks(builder=builder)
+        for (lidar_frame, annotation, label, _), annotation_definition in zip(cuboids, annotation_definitions):
+            metadata = {"object_uid": annotation.object.uid,
+                        "system": {"frameNumberBased": True},
+                        "uid": annotation.uid}
+            object_id = tracks.add(
+                object_uid=annotation.object.uid,
+                annotation_definition=annotation_definition,
+                frame_num=lidar_frame,
+                metadata=metadata
+            )
+
+            logger.debug(msg=f"Adding annotation: "
+                             f"(Type: Cube3d, Label: {label}, ObjectID: {object_id}, Frame: {lidar_frame})")
+
+        logger.debug(msg=f"Annotations Object UID Mapping: {tracks.object_ids}")
+        annotations = dl_annotations + list(builder.annotations)
+        batches = self.annotation_uploader.batches(annotations=annotations)
+        key, digest = f"annotations/{frames_item.id}", None
+        if self.manifest is not None:
+            tracks_payload = [
+                {"frame": lidar_frame, "uid": annotation.uid, "object_uid": annotation.object.uid,
+                 "label": annotation_definition.label, "attributes": annotation_definition.attributes,
+                 "coordinates": annotation_definition.to_coordinates(color=None)}
+                for (lidar_frame, annotation, _, _), annotation_definition in zip(cuboids, annotation_definitions)
+            ]
+            digest, num_bytes = payload_digest(payload={"annotations": dl_annotations, "tracks": tracks_payload})
+            if self.manifest.skip(key=key, digest=digest, calls=1 + len(batches)):
+                return
+        # Replaces the annotations of a previous import, or resumes its upload from the last uploaded batch
+        self.annotation_uploader.upload(item=frames_item, annotations=annotations, manifest=self.manifest, key=key,
+                                        digest=digest, batches=batches)
+        if self.manifest is not None:
+            self.manifest.record(key=key, digest=digest, num_bytes=num_bytes)
+
+    @staticmethod
+    def get_items_by_ids(dataset: dl.Dataset, item_ids: list, chunk_size: int = 500) -> dict:
+        """
+        Resolve items with paged list queries, instead of one `items.get` per item.
+
+        :return: dict of item id to dl.Item
+        """
+        items = dict()
+        unique_ids = list(dict.fromkeys(item_ids))
+        for i in range(0, len(unique_ids), chunk_size):
+            filters = dl.Filters(field='id', values=unique_ids[i:i + chunk_size], operator=dl.FiltersOperations.IN)
+            with sdk_call(name="items.list"):
+                pages = dataset.items.list(filters=filters)
+            for item in pages.all():
+                items[item.id] = item
+
+        missing_ids = [item_id for item_id in unique_ids if item_id not in items]
+        if len(missing_ids) > 0:
+            raise dl.exceptions.NotFound(status_code="404", message=f"Items not found: {missing_ids[:10]}")
+        return items
+
+    @staticmethod
+    def replace_annotations(builder: dl.AnnotationCollection):
+        filters = dl.Filters(resource=dl.FiltersResource.ANNOTATION, use_defaults=False)
+        with sdk_call(name="annotations.delete"):
+            builder.item.annotations.delete(filters=filters)
+        with sdk_call(name="annotations.upload"):
+            builder.upload()
+
+    def convert_pre_annotation_images(self, dataset: dl.Dataset, data_path: str) -> dict:
+        """
+        Convert the camera annotations of the scene, without their image items.
+
+        :return: dict of lidar frame to dict of image number to list of (annotation definition, metadata)
+        """
+        import raillabel
+
         if self.attributes_id_mapping_dict is None:
-            self.attributes_id_mapping(dataset=frames_item.dataset)
-        buffer = frames_item.download(save_locally=False)
-        frames_item_data = json.load(buffer)
-        scene = None
-        dir_items = os.listdir(path=data_path)
-        for dir_item in dir_items:
-            if ".json" in dir_item:
-                try:
-                    calibration_json = os.path.join(data_path, dir_item)
-                    scene = raillabel.load(calibration_json)
-                    break
-                except:
-                    continue
+            self.attributes_id_mapping(dataset=dataset)
+        scene = self.scene_provider.get_scene(data_path=data_path)
         frames = scene.frames
-        images_dict = dict()
-        for frame_num, frame in enumerate(frames_item_data.get('frames')):
-            images = frame.get('images', list())
-            for image_num, image in enumerate(images):
-                image_item = frames_item.dataset.items.get(item_id=image.get('image_id'))
-                if frame_num not in images_dict:
-                    images_dict[frame_num] = dict()
-                images_dict[frame_num][image_num] = {
-                    'builder': image_item.annotations.builder(),
-                    'item': image_item
-                }
-        anno_count = 0
+        converted = dict()
         for lidar_frame, (frame_num, frame) in enumerate(frames.items()):
             annotations = frame.annotations
-            anno_count += len(annotations)
             for annotation_id, annotation in annotations.items():
                 # # Option 1: IR images
                 # if 'ir' not in annotation.sensor.uid:
@@ -507,64 +931,248 @@ class LidarCustomParser(LidarFileMappingParser):
                     continue
 
                 label = annotation.object.type.replace('_', ' ')
-                attributes = dict()
                 metadata = {"object_uid": annotation.object.uid,
                             "uid": annotation.uid}
-                for key, value in annotation.attributes.items():
-                    if isinstance(value, bool) or key == 'carrying':
-                        attributes[self.attributes_id_mapping_dict.get(key)] = value
-                    else:
-                        attributes[self.attributes_id_mapping_dict.get(key)] = str(value).replace(' %', '%')
+                attributes = self.convert_attributes(annotation=annotation)
                 if isinstance(annotation, raillabel.format.Bbox):
                     img_num = 0 if 'center' in annotation.name else 1 if 'left' in annotation.name else 2
-                    builder = images_dict[lidar_frame][img_num]['builder']
-                    left = annotation.pos.x - annotation.size.x / 2
-                    top = annotation.pos.y - annotation.size.y / 2
-                    right = annotation.pos.x + annotation.size.x / 2
-                    bottom = annotation.pos.y + annotation.size.y / 2
-                    builder.add(annotation_definition=dl.Box(left=left,
-                                                             right=right,
-                                                             top=top,
-                                                             bottom=bottom,
-                                                             label=label,
-                                                             attributes=attributes),
-                                metadata=metadata)
+                    # Scaled to the transcoded image
+                    scale_x, scale_y = self.image_scale(sensor=annotation.sensor)
+                    left = (annotation.pos.x - annotation.size.x / 2) * scale_x
+                    top = (annotation.pos.y - annotation.size.y / 2) * scale_y
+                    right = (annotation.pos.x + annotation.size.x / 2) * scale_x
+                    bottom = (annotation.pos.y + annotation.size.y / 2) * scale_y
+                    annotation_definition = dl.Box(left=left,
+                                                   right=right,
+                                                   top=top,
+                                                   bottom=bottom,
+                                                   label=label,
+                                                   attributes=attributes)
+                    converted.setdefault(lidar_frame, dict()).setdefault(img_num, list()).append(
+                        (annotation_definition, metadata))
                 if isinstance(annotation, raillabel.format.Poly2d):
                     img_num = 0 if 'center' in annotation.name else 1 if 'left' in annotation.name else 2
-                    builder = images_dict[lidar_frame][img_num]['builder']
+                    scale_x, scale_y = self.image_scale(sensor=annotation.sensor)
                     coordinates = list()
                     for point in annotation.points:
-                        coordinates.append({'x': point.x, 'y': point.y})
+                        coordinates.append({'x': point.x * scale_x, 'y': point.y * scale_y})
                     polyline_geo = dl.Polyline.from_coordinates(coordinates=coordinates)
-                    builder.add(annotation_definition=dl.Polyline(geo=polyline_geo,
-                                                                  label=label,
-                                                                  attributes=attributes),
-                                metadata=metadata)
-        for frame_num, images in images_dict.items():
-            for image_num, image in images.items():
-                if len(image['builder']) > 0:
-                    filters = dl.Filters(resource=dl.FiltersResource.ANNOTATION, use_defaults=False)
-                    image['builder'].item.annotations.delete(filters=filters)
-                    image['builder'].upload()
+                    annotation_definition = dl.Polyline(geo=polyline_geo,
+                                                        label=label,
+                                                        attributes=attributes)
+                    converted.setdefault(lidar_frame, dict()).setdefault(img_num, list()).append(
+                        (annotation_definition, metadata))
+        return converted
 
-    def custom_parse_data(self, zip_filepath: str, lidar_dataset: dl.Dataset, progress: dl.Progress = None):
-        data_path = self.extract_zip_file(zip_filepath=zip_filepath)
+    def upload_pre_annotation_images(self, frames_item: dl.Item, data_path: str, converted: dict = None):
+        """
+        :param converted: the `convert_pre_annotation_images` result, converted here if None
+        """
+        if converted is None:
+            converted = self.convert_pre_annotation_images(dataset=frames_item.dataset, data_path=data_path)
+        with sdk_call(name="item.download"):
+            buffer = frames_item.download(save_locally=False)
+        frames_item_data = json.load(buffer)
+        image_items = self.get_items_by_ids(
+            dataset=frames_item.dataset,
+            item_ids=[image.get('image_id')
+                      for frame in frames_item_data.get('frames') for image in frame.get('images', list())]
+        )
+        images_dict = dict()
+        for frame_num, frame in enumerate(frames_item_data.get('frames')):
+            images = frame.get('images', list())
+            for image_num, image in enumerate(images):
+                image_item = image_items[image.get('image_id')]
+                if frame_num not in images_dict:
+                    images_dict[frame_num] = dict()
+                images_dict[frame_num][image_num] = {
+                    'builder': image_item.annotations.builder(),
+                    'item': image_item
+                }
+        for lidar_frame, frame_annotations in converted.items():
+            for img_num, annotations in frame_annotations.items():
+                builder = images_dict[lidar_frame][img_num]['builder']
+                for annotation_definition, metadata in annotations:
+                    builder.add(annotation_definition=annotation_definition, metadata=metadata)
+        builders = [image['builder']
+                    for images in images_dict.values() for image in images.values() if len(image['builder']) > 0]
+        digests = dict()
+        if self.manifest is not None:
+            for builder in list(builders):
+                key = f"annotations/{builder.item.id}"
+                digests[key] = payload_digest(payload=[
+                    {"label": annotation.label, "attributes": annotation.annotation_definition.attributes,
+                     "coordinates": annotation.annotation_definition.to_coordinates(color=None),
+                     "metadata": annotation.metadata}
+                    for annotation in builder
+                ])
+                if self.manifest.skip(key=key, digest=digests[key][0], calls=2):
+                    builders.remove(builder)
+
+        def _replace(builder: dl.AnnotationCollection):
+            self.replace_annotations(builder=builder)
+            if self.manifest is not None:
+                key = f"annotations/{builder.item.id}"
+                self.manifest.record(key=key, digest=digests[key][0], num_bytes=digests[key][1])
 
+        with StageExecutor(max_workers=self.annotation_workers) as executor:
+            futures = [executor.submit(_replace, builder) for builder in builders]
+            for future in futures:
+                future.result()
+
+    def custom_parse_data(self, zip_filepath: str, lidar_dataset: dl.Dataset, progress: dl.Progress = None):
+        """
+        :param zip_filepath: path of the sequence zip, or its url in the "remote" extraction mode. A local path
+        is read like in the "stream" mode
+        """
+        self.run_report = RunReport(name=self.remote_root or "/")
+        remote = self.extraction_mode == "remote" and not os.path.isfile(zip_filepath)
+        archive = None
+        scratch = None
+        data_path = None
+        self.scratch_report = None
+        self.projection_report = None
         try:
-            self.upload_pcds_and_images(data_path=data_path, dataset=lidar_dataset, progress=progress)
-            if progress is not None:
-                progress.update(progress=80, message="Parsing source data...")
-            mapping_item = self.create_mapping_json(data_path=data_path, dataset=lidar_dataset)
-            frames_item = self.parse_data(mapping_item=mapping_item)
-            if progress is not None:
-                progress.update(progress=90, message="Uploading annotations...")
-            self.upload_pre_annotation_lidar(frames_item=frames_item, data_path=data_path)
-            self.upload_pre_annotation_images(frames_item=frames_item, data_path=data_path)
+            if self.image_transcoder is not None:
+                # The workers spawn during the extraction, shut down below whatever stage fails
+                self.image_transcoder.warmup()
+            with self.run_report.stage(name="extract"):
+                if self.incremental:
+                    self.manifest = SyncManifest(dataset=lidar_dataset, remote_root=self.remote_root).load()
+                if self.extraction_mode == "full":
+                    data_path = self.extract_zip_file(zip_filepath=zip_filepath)
+                else:
+                    # Extract only the scene json first, the sensor members are resolved from the scene
+                    archive = RemoteSceneArchive(url=zip_filepath, **self.remote_options) if remote \
+                        else SceneArchive(zip_filepath=zip_filepath)
+                    data_path = self.extract_zip_file(zip_filepath=zip_filepath,
+                                                      archive=archive,
+                                                      members=archive.scene_members())
+                if self.extraction_mode == "selective":
+                    self.extract_sensor_data(archive=archive, data_path=data_path)
+                if self.extraction_mode == "window":
+                    scratch = ScratchWindow(archive=archive, path=data_path, budget_bytes=self.scratch_budget)
+                if archive is not None:
+                    add_bytes(num_bytes=archive.report()['extracted_bytes'])
+                # Parsed once here, the stages below share the scene
+                scene = self.scene_provider.get_scene(data_path=data_path)
+                if remote:
+                    # Fetched ahead of the media upload, in the order it reads them
+                    archive.prefetch(members=archive.sensor_members(scene=scene, sensors=['lidar'] + self.camera_list))
+
+            def _media_upload(results: dict):
+                self.upload_pcds_and_images(data_path=data_path, dataset=lidar_dataset, progress=progress,
+                                            archive=archive if self.extraction_mode in ["stream", "remote"] else None,
+                                            scratch=scratch)
+                if scratch is not None:
+                    scratch.close()
+                    self.scratch_report = scratch.report()
+                    logger.info(
+                        msg=f"Scratch window: peak {self.scratch_report['peak_bytes']} bytes of a "
+                            f"{self.scratch_report['budget_bytes']} bytes budget, {self.scratch_report['files']} "
+                            f"files, waited {self.scratch_report['wait_time']:.2f}s for the budget"
+                    )
+                if archive is not None:
+                    report = archive.report()
+                    logger.info(
+                        msg=f"Archive members: {report['total_bytes']} bytes, "
+                            f"extracted: {report['extracted_bytes']} bytes, "
+                            f"streamed: {report['streamed_bytes']} bytes, "
+                            f"skipped: {report['skipped_bytes']} bytes ({100 * report['skipped_ratio']:.1f}%)"
+                    )
+                    if remote:
+                        logger.info(
+                            msg=f"Remote archive: downloaded {report['downloaded_bytes']} of "
+                                f"{report['archive_bytes']} bytes in {report['requests']} Range requests, "
+                                f"peak buffered {report['peak_buffered_bytes']} bytes"
+                        )
+
+            def _parse_data(results: dict):
+                if progress is not None:
+                    progress.update(progress=80, message="Parsing source data...")
+                frames_item = self.parse_frames(mapping_item=results['mapping'])
+                if progress is not None:
+                    progress.update(progress=90, message="Uploading annotations...")
+                return frames_item
+
+            def _projection_qa(results: dict):
+                # Only reported, a failed check doesn't fail the import
+                try:
+                    return self.check_projections(data_path=data_path)
+                except Exception as e:
+                    logger.warning(msg=f"Projection QA failed: {e}")
+
+            # Only `parse_data` needs the media items, the conversions only need the scene and the recipe.
+            # The Seg3d point ids of downsampled frames need the point maps of the media upload
+            downsampled = self.pcd_preprocessor is not None and self.pcd_preprocessor.voxel_size is not None
+            graph = StageGraph(run_report=self.run_report, max_workers=self.max_parallel_stages)
+            graph.add(name="recipe", fn=lambda results: self.attributes_id_mapping(dataset=lidar_dataset))
+            graph.add(name="media_upload", fn=_media_upload)
+            graph.add(name="mapping",
+                      fn=lambda results: self.create_mapping_json(data_path=data_path, dataset=lidar_dataset))
+            graph.add(name="lidar_conversion",
+                      fn=lambda results: self.convert_pre_annotation_lidar(dataset=lidar_dataset, data_path=data_path),
+                      dependencies=["recipe", "media_upload"] if downsampled else ["recipe"])
+            graph.add(name="image_conversion",
+                      fn=lambda results: self.convert_pre_annotation_images(dataset=lidar_dataset,
+                                                                            data_path=data_path),
+                      dependencies=["recipe"])
+            graph.add(name="parse_data", fn=_parse_data, dependencies=["media_upload", "mapping"])
+            if self.projection_qa and len(self.camera_list) > 0:
+                graph.add(name="projection_qa", fn=_projection_qa)
+            graph.add(name="lidar_annotations",
+                      fn=lambda results: self.upload_pre_annotation_lidar(frames_item=results['parse_data'],
+                                                                          data_path=data_path,
+                                                                          converted=results['lidar_conversion']),
+                      dependencies=["parse_data", "lidar_conversion"])
+            graph.add(name="image_annotations",
+                      fn=lambda results: self.upload_pre_annotation_images(frames_item=results['parse_data'],
+                                                                           data_path=data_path,
+                                                                           converted=results['image_conversion']),
+                      dependencies=["parse_data", "image_conversion"])
+            frames_item = graph.run()['parse_data']
         finally:
-            shutil.rmtree(path=data_path, ignore_errors=True)
+            if self.image_transcoder is not None:
+                self.image_transcoder.shutdown()
+            if scratch is not None:
+                scratch.close()
+            if archive is not None:
+                archive.close()
+            if self.manifest is not None:
+                try:
+                    with self.run_report.stage(name="manifest"):
+                        self.manifest.save()
+                except Exception as e:
+                    logger.warning(msg=f"Failed to save the sync manifest: {e}")
+                report = self.manifest.report()
+                logger.info(
+                    msg=f"Sync manifest: skipped {report['skipped_files']} unchanged uploads, "
+                        f"{report['skipped_bytes']} bytes, {report['skipped_calls']} calls"
+                )
+            if data_path is not None:
+                self.scene_provider.release(data_path=data_path)
+                shutil.rmtree(path=data_path, ignore_errors=True)
+            self.save_run_report()
 
         return frames_item
 
+    def save_run_report(self):
+        """
+        Log the run report of the last import and save it to `run_report_path`, if set.
+        """
+        report = self.run_report.to_dict()
+        total = report['total']
+        logger.info(msg=f"Import of '{report['run']}': {total['wall_time']:.2f}s wall, {total['cpu_time']:.2f}s cpu, "
+                        f"{total['bytes']} bytes, {total['sdk_calls']} SDK calls, "
+                        f"peak RSS {total['peak_rss'] / 2 ** 20:.0f} MiB")
+        logger.debug(msg=f"Run report: {json.dumps(report)}")
+        if self.run_report_path is not None:
+            try:
+                self.run_report.save(filepath=self.run_report_path)
+                logger.info(msg=f"Run report saved to: {self.run_report_path}")
+            except OSError as e:
+                logger.warning(msg=f"Failed to save the run report: {e}")
+
 
 def main():
     cp = LidarCustomParser(
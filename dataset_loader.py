@@ -1,14 +1,27 @@
 import dtlpy as dl
-import requests
 import os
 import logging
+import copy
 import json
+import functools
+from zipfile import ZipFile
 
-import custom_converter as lidar
+from downloader import ArchiveCache, RangedDownloader
+from sequence_scheduler import SequenceScheduler, sequence_name
+from local_export import ExportDataset, bulk_upload
 
 logger = logging.getLogger(name='osdar-dataset')
 
 
+@functools.lru_cache(maxsize=None)
+def load_ontology(filename: str) -> dict:
+    """
+    Ontology json next to the module, parsed once per process.
+    """
+    with open(file=os.path.join(os.path.dirname(os.path.abspath(__file__)), filename), mode='r') as file:
+        return json.load(fp=file)
+
+
 class DatasetLidarOSDAR(dl.BaseServiceRunner):
     def __init__(self):
         # Original sources
@@ -16,60 +29,278 @@ class DatasetLidarOSDAR(dl.BaseServiceRunner):
         # self.dataset_url = "https://download.data.fid-move.de/dzsf/osdar23/1_calibration_1.2.zip"  # 100 Frames
 
         self.dataset_url = "https://storage.googleapis.com/model-mgmt-snapshots/datasets-OSDAR2023/1_calibration_1_1_subset.zip"
-        self.zip_filename = "data.zip"
+        # Optional sha256 of the archive, verified after the download
+        self.dataset_sha256 = None
+        self.download_connections = 8
+        self.archive_cache_size = 20 * 1024 ** 3
         self.ontology_filename = "osdar_ontology.json"
 
         self.enable_ir_cameras = "false"
         self.enable_rgb_cameras = "false"
         self.enable_rgb_highres_cameras = "true"
 
+        # "full", "selective", "stream" (upload the enabled sensors straight from the zip), "window" (extract
+        # the enabled sensors frame by frame, at most `scratch_budget` bytes on disk at the same time) or "remote"
+        # (read the scene json and the enabled sensors from the archive url with Range requests, without
+        # downloading the archive)
+        self.extraction_mode = "stream"
+        self.scratch_budget = 2 * 1024 ** 3
+        # Range requests of the "remote" mode, e.g. {"num_connections": 8, "max_buffered_bytes": 256 * 1024 ** 2},
+        # see `RemoteSceneArchive`
+        self.remote_options = None
+        # Import stages running at the same time: the annotation conversions and the mapping run alongside the
+        # media upload. 1 runs them one after the other
+        self.max_parallel_stages = None
+
+        # Media upload engine options
+        self.upload_options = {
+            "num_workers": 16,
+            "batch_size": 4,
+            "max_inflight_bytes": 1024 * 1024 * 1024
+        }
+
+        # Lidar annotations upload options, e.g. {"max_batch_annotations": 1000, "num_workers": 4},
+        # see `AnnotationUploader`
+        self.annotation_options = None
+
+        # Lidar preprocessing before upload, e.g. {"data_format": "binary_compressed", "voxel_size": 0.05},
+        # see `PcdPreprocessor`. None uploads the original PCD files
+        self.pcd_options = None
+        # Level-of-detail tiles of every lidar frame, uploaded next to its PCD, e.g. {"levels": 4, "tile_depth": 2},
+        # see `LodTiler`. None uploads no tiles
+        self.lod_options = None
+        # "frames" writes the camera calibrations in every frame of the mapping.json, "shared" once, see
+        # `LidarCustomParser`
+        self.mapping_format = "frames"
+        # Project the cuboids into the enabled cameras and report the 2D boxes inconsistent with them,
+        # see `ProjectionQA`
+        self.projection_qa = False
+        # Camera images transcoding before upload, e.g. {"image_format": "jpeg", "quality": 90, "max_size": 2048},
+        # see `ImageTranscoder`. None uploads the original images
+        self.image_options = None
+
+        # Multi-sequence ingestion: archive URLs or paths, each sequence is uploaded to its own folder
+        # e.g. ["https://download.data.fid-move.de/dzsf/osdar23/1_calibration_1.2.zip", ...]
+        self.sequence_urls = list()
+        # Scheduler limits: worker processes (defaults to the number of cores), concurrent downloads and
+        # extracted bytes on disk over all the sequences
+        self.num_workers = None
+        self.max_downloads = 2
+        self.max_disk_bytes = 100 * 1024 ** 3
+
+        # Folder the stage timing report of each import is saved to, as "<sequence name>.json".
+        # None only logs the reports
+        self.run_report_dir = None
+
+        # Concurrent upload calls of `upload_export`, over a prepared export folder
+        self.bulk_upload_workers = 32
+
+        # Parsed with the service start, instead of on the first import
+        load_ontology(filename=self.ontology_filename)
+
     def _import_recipe_ontology(self, dataset: dl.Dataset) -> dl.Recipe:
         recipe: dl.Recipe = dataset.recipes.list()[0]
         ontology: dl.Ontology = recipe.ontologies.list()[0]
 
-        new_ontology_filepath = os.path.join(os.path.dirname(str(__file__)), self.ontology_filename)
-        with open(file=new_ontology_filepath, mode='r') as file:
-            new_ontology_json = json.load(fp=file)
+        new_ontology_json = copy.deepcopy(load_ontology(filename=self.ontology_filename))
 
         ontology.copy_from(ontology_json=new_ontology_json)
         return recipe
 
-    def _download_zip(self, progress: dl.Progress = None) -> str:
-        zip_filepath = os.path.join(os.getcwd(), self.zip_filename)
-        chunk_size = 8192
-        with requests.get(self.dataset_url, stream=True) as r:
-            r.raise_for_status()
-            if progress is not None:
-                total_size = int(r.headers.get('Content-Length', 0))
-                total_chunks = (total_size // chunk_size) + (1 if total_size % chunk_size != 0 else 0)
-                modulo_report = total_chunks // 10
-            with open(zip_filepath, 'wb') as f:
-                for i, chunk in enumerate(r.iter_content(chunk_size=chunk_size)):
-                    f.write(chunk)
-                    if progress is not None:
-                        if (i + 1) % modulo_report == 0:
-                            _progress = int(40 * ((i + 1) / total_chunks))
-                            progress.update(progress=_progress, message="Downloading dataset for source...")
+    def _download_zip(self, progress: dl.Progress = None, url: str = None, sha256: str = None) -> str:
+        downloader = RangedDownloader(
+            cache=ArchiveCache(max_size=self.archive_cache_size),
+            num_connections=self.download_connections
+        )
+        reported = [0]
+
+        def progress_callback(downloaded: int, total_size: int):
+            if progress is None or not total_size:
+                return
+            _progress = int(40 * (downloaded / total_size))
+            if _progress >= reported[0] + 4:
+                reported[0] = _progress
+                progress.update(progress=_progress, message="Downloading dataset for source...")
 
+        if url is None:
+            url, sha256 = self.dataset_url, self.dataset_sha256
+        zip_filepath = downloader.download(url=url,
+                                           expected_sha256=sha256,
+                                           progress_callback=progress_callback)
         logger.info(msg=f"File downloaded to: {zip_filepath}")
         return zip_filepath
 
-    def upload_dataset(self, dataset: dl.Dataset, source: str, progress: dl.Progress = None) -> dl.Item:
-        self._import_recipe_ontology(dataset=dataset)
-        if self.zip_filename not in os.listdir(path=os.getcwd()):
-            zip_filepath = self._download_zip(progress=progress)
-        else:
-            zip_filepath = os.path.join(os.getcwd(), self.zip_filename)
+    def _lidar_parser(self, remote_root: str = "/"):
+        """
+        :return: `custom_converter.LidarCustomParser`, the converter and its dependencies (dtlpylidar, raillabel,
+        scipy) are imported on the first call instead of at the service start
+        """
+        import custom_converter
 
-        item: dl.Item
-        lidar_parser = lidar.LidarCustomParser(
+        return custom_converter.LidarCustomParser(
             enable_ir_cameras=self.enable_ir_cameras,
             enable_rgb_cameras=self.enable_rgb_cameras,
-            enable_rgb_highres_cameras=self.enable_rgb_highres_cameras
+            enable_rgb_highres_cameras=self.enable_rgb_highres_cameras,
+            upload_options=self.upload_options,
+            extraction_mode=self.extraction_mode,
+            scratch_budget=self.scratch_budget,
+            max_parallel_stages=self.max_parallel_stages,
+            remote_options=self.remote_options,
+            remote_root=remote_root,
+            pcd_options=self.pcd_options,
+            lod_options=self.lod_options,
+            mapping_format=self.mapping_format,
+            projection_qa=self.projection_qa,
+            image_options=self.image_options,
+            annotation_options=self.annotation_options,
+            run_report_path=self._run_report_path(remote_root=remote_root)
         )
+
+    def _run_report_path(self, remote_root: str = "/") -> str:
+        if self.run_report_dir is None:
+            return None
+        os.makedirs(name=self.run_report_dir, exist_ok=True)
+        name = remote_root.strip("/") or sequence_name(source=self.dataset_url)
+        return os.path.join(self.run_report_dir, f"{name}.json")
+
+    def upload_dataset(self, dataset: dl.Dataset, source: str, progress: dl.Progress = None) -> dict:
+        """
+        Import `dataset_url`, or every archive of `sequence_urls` with `upload_sequences`.
+
+        :return: dict of sequence name to its frames item, a single entry without `sequence_urls`
+        """
+        if len(self.sequence_urls) > 0:
+            return self.upload_sequences(dataset=dataset, sources=self.sequence_urls, progress=progress)
+        self._import_recipe_ontology(dataset=dataset)
+
+        # Created first, so its warm up overlaps the download
+        lidar_parser = self._lidar_parser()
+        if self.extraction_mode == "remote":
+            zip_filepath = self.dataset_url
+        else:
+            zip_filepath = self._download_zip(progress=progress)
+
+        item: dl.Item
         frames_item = lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset,
                                                      progress=progress)
-        return frames_item
+        return {sequence_name(source=self.dataset_url): frames_item}
+
+    def upload_sequences(self, dataset: dl.Dataset, sources: list, progress: dl.Progress = None) -> dict:
+        """
+        Ingest several sequences on a process pool, each one into the "/<sequence name>" folder.
+
+        :param sources: archive URLs or local archive paths
+        :return: dict of sequence name to its frames item
+        """
+        self._import_recipe_ontology(dataset=dataset)
+        # Only the plain configuration is sent to the worker processes
+        options = {key: value for key, value in vars(self).items() if not key.startswith('_')}
+        scheduler = SequenceScheduler(num_workers=self.num_workers,
+                                      max_downloads=self.max_downloads,
+                                      max_disk_bytes=self.max_disk_bytes)
+        frames_item_ids = scheduler.run(
+            sources=sources,
+            target=functools.partial(ingest_sequence, dataset_id=dataset.id, options=options),
+            progress=progress
+        )
+        return {name: dataset.items.get(item_id=item_id) for name, item_id in frames_item_ids.items()}
+
+    def export_sequences(self, sources: list, export_dir: str, progress: dl.Progress = None) -> dict:
+        """
+        Convert several sequences to a local export folder on a process pool, without the platform: the media,
+        mapping.json, frames, annotations and semantic reference items an import would upload, each sequence
+        under its "/<sequence name>" folder. `upload_export` uploads the folder to a dataset.
+
+        Not a `dataloop.json` function: the folder is on the local disk of the caller, run it with
+        `python local_export.py export`.
+
+        :param sources: archive URLs or local archive paths
+        :return: dict of sequence name to the remote filepath of its frames item
+        """
+        options = {key: value for key, value in vars(self).items() if not key.startswith('_')}
+        scheduler = SequenceScheduler(num_workers=self.num_workers,
+                                      max_downloads=self.max_downloads,
+                                      max_disk_bytes=self.max_disk_bytes)
+        return scheduler.run(
+            sources=sources,
+            target=functools.partial(export_sequence, export_dir=export_dir, options=options),
+            progress=progress
+        )
+
+    def upload_export(self, dataset: dl.Dataset, export_dir: str, num_workers: int = None) -> dict:
+        """
+        Upload an `export_sequences` folder to `dataset`, see `local_export.bulk_upload`.
+        Not a `dataloop.json` function, like `export_sequences`: run it with `python local_export.py upload`.
+
+        :return: the `bulk_upload` report
+        """
+        self._import_recipe_ontology(dataset=dataset)
+        return bulk_upload(path=export_dir,
+                           dataset=dataset,
+                           num_workers=num_workers or self.bulk_upload_workers,
+                           annotation_options=self.annotation_options)
+
+
+def convert_sequence(runner: DatasetLidarOSDAR, source: str, limits, progress, dataset):
+    """
+    Download, extract and convert a single sequence to `dataset`, a platform or an export dataset.
+
+    :return: the frames item of the sequence
+    """
+    name = sequence_name(source=source)
+    lidar_parser = runner._lidar_parser(remote_root=f"/{name}")
+
+    if os.path.isfile(source) or runner.extraction_mode == "remote":
+        # The remote mode reads the members of the archive url itself, with `remote_options` connections
+        zip_filepath = source
+    else:
+        with limits.network():
+            zip_filepath = runner._download_zip(progress=progress, url=source)
+
+    # Streaming and the remote mode keep only the scene json on disk, the window mode up to its scratch budget,
+    # the other modes extract up to the whole archive
+    disk_bytes = 0
+    if runner.extraction_mode not in ["stream", "remote"]:
+        with ZipFile(zip_filepath, 'r') as zip_object:
+            disk_bytes = sum(info.file_size for info in zip_object.infolist())
+        if runner.extraction_mode == "window":
+            disk_bytes = min(disk_bytes, runner.scratch_budget)
+    with limits.disk(num_bytes=disk_bytes):
+        return lidar_parser.custom_parse_data(zip_filepath=zip_filepath, lidar_dataset=dataset, progress=progress)
+
+
+def ingest_sequence(source: str, limits, progress, dataset_id: str, options: dict) -> str:
+    """
+    Convert and upload a single sequence, in a `SequenceScheduler` worker process.
+
+    :return: id of the frames item of the sequence
+    """
+    runner = DatasetLidarOSDAR()
+    runner.__dict__.update(options)
+    dataset = dl.datasets.get(dataset_id=dataset_id)
+    return convert_sequence(runner=runner, source=source, limits=limits, progress=progress, dataset=dataset).id
+
+
+def export_sequence(source: str, limits, progress, export_dir: str, options: dict) -> str:
+    """
+    Convert a single sequence to the `ExportDataset` of its name in `export_dir`, in a `SequenceScheduler` worker
+    process.
+
+    :return: remote filepath of the frames item of the sequence
+    """
+    runner = DatasetLidarOSDAR()
+    runner.__dict__.update(options)
+    dataset = ExportDataset(path=export_dir, name=sequence_name(source=source),
+                            ontology=load_ontology(filename=runner.ontology_filename))
+    try:
+        frames_item = convert_sequence(runner=runner, source=source, limits=limits, progress=progress,
+                                       dataset=dataset)
+    finally:
+        dataset.save()
+    report = dataset.report()
+    logger.info(msg=f"Exported '{dataset.name}' to '{dataset.path}': {report['items']} items "
+                    f"({report['bytes'] / 2 ** 20:.1f} MiB), {report['annotation_files']} annotation files")
+    return frames_item.filename
 
 
 def test_download():
@@ -90,7 +321,9 @@ def test_dataset_import():
 
     dataset = dl.datasets.get(dataset_id=dataset_id)
     sr = DatasetLidarOSDAR()
-    sr.upload_dataset(dataset=dataset, source="")
+    frames_items = sr.upload_dataset(dataset=dataset, source="")
+    for name, frames_item in frames_items.items():
+        logger.info(msg=f"Imported '{name}', frames item: {frames_item.id}")
 
 
 def main():
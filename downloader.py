@@ -0,0 +1,304 @@
+import dtlpy as dl
+import os
+import json
+import time
+import hashlib
+import logging
+import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class ArchiveCache:
+    """
+    Content-addressed store of downloaded archives.
+
+    Entries are keyed by the URL and the ETag (or Last-Modified and size, when the server sends no ETag),
+    so a changed remote file is never served from a stale entry. Every entry keeps its size and sha256
+    next to the archive, and the least recently used entries are evicted to stay under `max_size`.
+    """
+
+    def __init__(self, cache_dir: str = None, max_size: int = 50 * 1024 ** 3):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                'OSDAR_ARCHIVE_CACHE_DIR',
+                os.path.join(os.path.expanduser('~'), '.cache', 'osdar23', 'archives')
+            )
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(name=self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, version: str) -> str:
+        return hashlib.sha256(f"{url}\n{version}".encode()).hexdigest()
+
+    def archive_filepath(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.zip")
+
+    def meta_filepath(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def partial_filepath(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.part")
+
+    def get(self, key: str, verify_checksum: bool = False):
+        archive_filepath = self.archive_filepath(key=key)
+        meta_filepath = self.meta_filepath(key=key)
+        if not os.path.isfile(archive_filepath) or not os.path.isfile(meta_filepath):
+            return None
+        with open(meta_filepath, 'r') as f:
+            meta = json.load(f)
+        valid = os.path.getsize(archive_filepath) == meta.get('size')
+        if valid and verify_checksum:
+            valid = file_sha256(filepath=archive_filepath) == meta.get('sha256')
+        if not valid:
+            logger.warning(msg=f"Dropping corrupted cache entry for '{meta.get('url')}'")
+            self.remove(key=key)
+            return None
+        # Touch the entry for the LRU order
+        os.utime(archive_filepath)
+        return archive_filepath
+
+    def put(self, key: str, filepath: str, meta: dict) -> str:
+        archive_filepath = self.archive_filepath(key=key)
+        os.replace(filepath, archive_filepath)
+        with open(self.meta_filepath(key=key), 'w') as f:
+            json.dump(meta, f)
+        self.evict(keep=key)
+        return archive_filepath
+
+    def remove(self, key: str):
+        for filepath in [self.archive_filepath(key=key), self.meta_filepath(key=key)]:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+
+    def evict(self, keep: str = None):
+        entries = list()
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.zip'):
+                continue
+            filepath = os.path.join(self.cache_dir, filename)
+            stat = os.stat(filepath)
+            entries.append((stat.st_mtime, stat.st_size, filename[:-len('.zip')]))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            logger.info(msg=f"Evicting cached archive '{key}' ({size} bytes)")
+            self.remove(key=key)
+            total_size -= size
+
+
+class RangedDownloader:
+    """
+    Downloads a file over parallel HTTP Range requests into the `ArchiveCache`.
+
+    The download state is persisted next to the partial file, so an interrupted download resumes from
+    the bytes already on disk. The final file is verified against the remote size and, if given,
+    the expected sha256 before it is moved into the cache.
+    """
+
+    def __init__(self,
+                 cache: ArchiveCache = None,
+                 num_connections: int = 8,
+                 segment_size: int = 32 * 1024 * 1024,
+                 buffer_size: int = 1024 * 1024,
+                 max_retries: int = 5,
+                 backoff_factor: float = 1.0,
+                 timeout: float = 60):
+        self.cache = cache if cache is not None else ArchiveCache()
+        self.num_connections = max(1, num_connections)
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.state_save_interval = 16 * buffer_size
+        self._lock = threading.Lock()
+
+    def _probe(self, url: str) -> dict:
+        r = requests.head(url, allow_redirects=True, timeout=self.timeout)
+        if r.status_code >= 400:
+            # Some servers don't allow HEAD, read the headers of a GET instead
+            with requests.get(url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+        size = r.headers.get('Content-Length')
+        return {
+            "url": r.url,
+            "size": int(size) if size is not None else None,
+            "etag": r.headers.get('ETag'),
+            "last_modified": r.headers.get('Last-Modified'),
+            "accept_ranges": r.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        }
+
+    @staticmethod
+    def _version(remote: dict) -> str:
+        if remote['etag']:
+            return f"etag:{remote['etag']}"
+        return f"last-modified:{remote['last_modified']}|size:{remote['size']}"
+
+    def _load_state(self, state_filepath: str, remote: dict, segments: list) -> dict:
+        if os.path.isfile(state_filepath):
+            try:
+                with open(state_filepath, 'r') as f:
+                    state = json.load(f)
+                if state.get('size') == remote['size'] and state.get('segment_size') == self.segment_size:
+                    return state
+            except Exception:
+                pass
+        return {"size": remote['size'], "segment_size": self.segment_size, "done": [0] * len(segments)}
+
+    def _save_state(self, state_filepath: str, state: dict):
+        tmp_filepath = f"{state_filepath}.tmp"
+        with open(tmp_filepath, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_filepath, state_filepath)
+
+    def _download_segment(self, url: str, partial_filepath: str, state_filepath: str, state: dict,
+                          index: int, start: int, end: int, on_bytes=None):
+        for attempt in range(self.max_retries + 1):
+            offset = start + state['done'][index]
+            if offset > end:
+                return
+            try:
+                headers = {'Range': f"bytes={offset}-{end}"}
+                with requests.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise dl.exceptions.PlatformException(
+                            error="400", message=f"Server ignored the Range request for '{url}'"
+                        )
+                    with open(partial_filepath, 'r+b') as f:
+                        f.seek(offset)
+                        unsaved_bytes = 0
+                        for chunk in r.iter_content(chunk_size=self.buffer_size):
+                            f.write(chunk)
+                            unsaved_bytes += len(chunk)
+                            with self._lock:
+                                state['done'][index] += len(chunk)
+                            if on_bytes is not None:
+                                on_bytes(len(chunk))
+                            # Persist the progress regularly, so a killed process resumes close to where it stopped
+                            if unsaved_bytes >= self.state_save_interval:
+                                f.flush()
+                                unsaved_bytes = 0
+                                with self._lock:
+                                    self._save_state(state_filepath=state_filepath, state=state)
+                        f.flush()
+                with self._lock:
+                    self._save_state(state_filepath=state_filepath, state=state)
+                if start + state['done'][index] <= end:
+                    raise requests.exceptions.ChunkedEncodingError(f"Segment {index} ended early")
+                return
+            except (requests.exceptions.RequestException, OSError) as e:
+                with self._lock:
+                    self._save_state(state_filepath=state_filepath, state=state)
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_factor * (2 ** attempt)
+                logger.warning(msg=f"Segment {index} of '{url}' failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _download_single(self, url: str, partial_filepath: str, on_bytes=None):
+        with requests.get(url, stream=True, timeout=self.timeout) as r:
+            r.raise_for_status()
+            with open(partial_filepath, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=self.buffer_size):
+                    f.write(chunk)
+                    if on_bytes is not None:
+                        on_bytes(len(chunk))
+
+    def download(self, url: str, expected_sha256: str = None, progress_callback=None) -> str:
+        """
+        :param url: file url
+        :param expected_sha256: optional sha256 hex digest to verify the file against
+        :param progress_callback: optional callable(downloaded_bytes, total_bytes), called from the download
+        threads one call at a time, with a growing `downloaded_bytes`
+        :return: path of the archive in the cache
+        """
+        remote = self._probe(url=url)
+        key = self.cache.key(url=url, version=self._version(remote=remote))
+        cached_filepath = self.cache.get(key=key, verify_checksum=expected_sha256 is not None)
+        if cached_filepath is not None:
+            if expected_sha256 is None or self._checksum_matches(key=key, expected_sha256=expected_sha256):
+                logger.info(msg=f"Using cached archive for '{url}': {cached_filepath}")
+                return cached_filepath
+            self.cache.remove(key=key)
+
+        partial_filepath = self.cache.partial_filepath(key=key)
+        state_filepath = f"{partial_filepath}.json"
+        downloaded = [0]
+        # Its own lock, a slow callback doesn't hold the segments state
+        progress_lock = threading.Lock()
+
+        def on_bytes(num_bytes):
+            with self._lock:
+                downloaded[0] += num_bytes
+            if progress_callback is not None:
+                with progress_lock:
+                    progress_callback(downloaded[0], remote['size'])
+
+        start_time = time.perf_counter()
+        if remote['size'] and remote['accept_ranges']:
+            segments = [(start, min(start + self.segment_size, remote['size']) - 1)
+                        for start in range(0, remote['size'], self.segment_size)]
+            state = self._load_state(state_filepath=state_filepath, remote=remote, segments=segments)
+            # The state only describes the partial file it was saved with: without it, nothing is downloaded
+            if not os.path.isfile(partial_filepath) or os.path.getsize(partial_filepath) != remote['size']:
+                if sum(state['done']) > 0:
+                    logger.warning(msg=f"Partial download of '{url}' is missing, downloading it again")
+                state['done'] = [0] * len(segments)
+            downloaded[0] = sum(state['done'])
+            if downloaded[0] > 0:
+                logger.info(msg=f"Resuming '{url}' from {downloaded[0]} of {remote['size']} bytes")
+            else:
+                with open(partial_filepath, 'wb') as f:
+                    f.truncate(remote['size'])
+            with ThreadPoolExecutor(max_workers=self.num_connections) as executor:
+                futures = [
+                    executor.submit(self._download_segment, remote['url'], partial_filepath, state_filepath,
+                                    state, index, start, end, on_bytes)
+                    for index, (start, end) in enumerate(segments)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            self._download_single(url=remote['url'], partial_filepath=partial_filepath, on_bytes=on_bytes)
+        duration = time.perf_counter() - start_time
+
+        size = os.path.getsize(partial_filepath)
+        if remote['size'] is not None and size != remote['size']:
+            raise dl.exceptions.PlatformException(
+                error="400", message=f"Downloaded size {size} of '{url}' doesn't match the remote size {remote['size']}"
+            )
+        sha256 = file_sha256(filepath=partial_filepath)
+        if expected_sha256 is not None and sha256 != expected_sha256.lower():
+            os.remove(partial_filepath)
+            if os.path.exists(state_filepath):
+                os.remove(state_filepath)
+            raise dl.exceptions.PlatformException(
+                error="400", message=f"Checksum mismatch for '{url}': expected {expected_sha256}, got {sha256}"
+            )
+        if os.path.exists(state_filepath):
+            os.remove(state_filepath)
+
+        meta = {"url": url, "version": self._version(remote=remote), "size": size, "sha256": sha256}
+        archive_filepath = self.cache.put(key=key, filepath=partial_filepath, meta=meta)
+        logger.info(msg=f"Downloaded '{url}' ({size} bytes) in {duration:.1f}s to: {archive_filepath}")
+        return archive_filepath
+
+    def _checksum_matches(self, key: str, expected_sha256: str) -> bool:
+        with open(self.cache.meta_filepath(key=key), 'r') as f:
+            return json.load(f).get('sha256') == expected_sha256.lower()
+
+
+def file_sha256(filepath: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
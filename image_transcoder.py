@@ -0,0 +1,157 @@
+import time
+import logging
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+import dtlpy as dl
+
+from sequence_scheduler import cpu_share
+
+logger = logging.getLogger(name='osdar-dataset')
+
+IMAGE_FORMATS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+
+
+def output_size(width: int, height: int, max_size: int = None) -> (int, int):
+    """
+    Size of a `width` x `height` image after the resize to `max_size` pixels on the longest edge.
+    """
+    if max_size is None or max(width, height) <= max_size:
+        return width, height
+    ratio = max_size / max(width, height)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def transcode_image(source, image_format: str, quality: int, max_size: int = None) -> (bytes, tuple, tuple):
+    """
+    Re-encode a single image, in a worker process.
+
+    :param source: image bytes or filepath
+    :return: the encoded image, the original size and the output size
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+        image.load()
+        original_size = image.size
+        size = output_size(width=image.width, height=image.height, max_size=max_size)
+        if size != image.size:
+            # Box-reduce by the integer part of the ratio first, then a light bilinear pass
+            image = image.resize(size, resample=Image.BILINEAR, reducing_gap=1.0)
+        if image_format == "jpeg" and image.mode not in ["RGB", "L"]:
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        if image_format == "png":
+            image.save(buffer, format="PNG", compress_level=1)
+        else:
+            image.save(buffer, format=image_format.upper(), quality=quality)
+    return buffer.getvalue(), original_size, size
+
+
+class ImageTranscoder:
+    """
+    Re-encodes the camera images on a process pool before the upload, to a lighter format and optionally a
+    lower resolution. The annotations and the intrinsics of a resized camera are scaled by `scale`.
+
+    :param image_format: output format, one of "jpeg", "webp" or "png"
+    :param quality: encoder quality of jpeg and webp, 1-100
+    :param max_size: maximum pixels of the longest edge, the resolution is kept if None
+    :param num_workers: number of worker processes, at most and by default `sequence_scheduler.cpu_share()`, the
+    cores of the machine or the share of a sequence ingested alongside others
+    """
+
+    def __init__(self, image_format: str = "jpeg", quality: int = 90, max_size: int = None, num_workers: int = None):
+        if image_format not in IMAGE_FORMATS:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Unsupported image format: '{image_format}'")
+        if not 1 <= quality <= 100:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Invalid image quality: {quality}")
+        self.image_format = image_format
+        self.quality = quality
+        self.max_size = max_size
+        self.num_workers = max(1, min(num_workers or cpu_share(), cpu_share()))
+        self.images = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self._executor = None
+        self._start_time = None
+        self._end_time = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_FORMATS[self.image_format]
+
+    @property
+    def signature(self) -> str:
+        """
+        Identifies the output of the transcoding options, part of the sync manifest digests.
+        """
+        return f"image:{self.image_format}:{self.quality}:{self.max_size}"
+
+    def scale(self, width: int, height: int) -> (float, float):
+        """
+        :return: x and y scale factors of the pixel coordinates of a `width` x `height` image
+        """
+        if width is None or height is None:
+            return 1.0, 1.0
+        new_width, new_height = output_size(width=width, height=height, max_size=self.max_size)
+        return new_width / width, new_height / height
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, a fork would copy the locks held by the upload and download threads of the import
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def warmup(self):
+        """
+        Start the worker processes ahead of the first image, a spawned worker imports this module and dtlpy first.
+        """
+        for _ in range(self.num_workers):
+            self._pool().submit(output_size, 1, 1)
+
+    def submit(self, source):
+        """
+        :param source: image BytesIO or filepath
+        :return: future of the `transcode_image` result
+        """
+        if self._start_time is None:
+            self._start_time = time.perf_counter()
+        if isinstance(source, BytesIO):
+            source = source.getvalue()
+        return self._pool().submit(transcode_image, source, self.image_format, self.quality, self.max_size)
+
+    def result(self, future, name: str, input_bytes: int) -> BytesIO:
+        """
+        Wait for a transcoded image, as a named BytesIO for the uploader.
+        """
+        data, original_size, size = future.result()
+        self.images += 1
+        self.input_bytes += input_bytes
+        self.output_bytes += len(data)
+        self._end_time = time.perf_counter()
+        buffer = BytesIO(data)
+        buffer.name = name
+        return buffer
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def report(self) -> dict:
+        wall_time = (self._end_time - self._start_time) if self._end_time is not None else 0.0
+        return {
+            "images": self.images,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "saved_bytes": self.input_bytes - self.output_bytes,
+            "images_per_sec": self.images / wall_time if wall_time > 0 else 0.0
+        }
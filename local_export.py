@@ -0,0 +1,541 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+import mimetypes
+import threading
+
+import dtlpy as dl
+
+from media_uploader import MediaUploader
+from annotation_uploader import AnnotationUploader
+from run_report import StageExecutor, sdk_call
+
+logger = logging.getLogger(name='osdar-dataset')
+
+# Item and dataset ids of an export, 24 hex characters like the platform ids, replaced on upload
+EXPORT_ID_PATTERN = re.compile(r'\b[0-9a-f]{24}\b')
+
+
+def _export_id() -> str:
+    return uuid.uuid4().hex[:24]
+
+
+def annotation_files(path: str, item_id: str) -> list:
+    """
+    :return: paths of the saved annotations upload calls of an item of the export folder `path`, in upload order
+    """
+    folder = os.path.join(path, "annotations", item_id)
+    if not os.path.isdir(folder):
+        return list()
+    return [os.path.join(folder, filename)
+            for filename in sorted(os.listdir(folder), key=lambda filename: int(filename.split('.')[0]))]
+
+
+class ExportAnnotations:
+    """
+    `item.annotations` of an export item. Every upload call is saved as the json list the SDK would send,
+    "annotations/<item id>/<n>.json".
+    """
+
+    def __init__(self, item):
+        self.item = item
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.item.dataset.path, "annotations", self.item.id)
+
+    def builder(self):
+        return dl.AnnotationCollection(item=self.item)
+
+    def upload(self, annotations):
+        if isinstance(annotations, dl.AnnotationCollection):
+            annotations = annotations.annotations
+        elif isinstance(annotations, (dict, dl.Annotation)):
+            annotations = [annotations]
+        payload = list()
+        for annotation in annotations:
+            if isinstance(annotation, dl.Annotation):
+                # The video annotations need a `dl.Item` for their frames color, an offline one with no labels
+                annotation._item = self.item.entity
+                annotation = annotation.to_json()
+            payload.append(annotation)
+        data = json.dumps(payload, default=str).encode()
+        with self.item.dataset.lock:
+            os.makedirs(name=self.path, exist_ok=True)
+            filepath = os.path.join(self.path, f"{len(os.listdir(self.path))}.json")
+            with open(filepath, 'wb') as f:
+                f.write(data)
+        return payload
+
+    def delete(self, filters: dl.Filters = None):
+        with self.item.dataset.lock:
+            shutil.rmtree(path=self.path, ignore_errors=True)
+        return True
+
+
+class ExportItem:
+    """
+    An item of an `ExportDataset`, its content is the file at its remote filepath under "items/".
+
+    :param item_metadata: the user metadata of the upload (e.g. the frames item "fps" and shebang), set again
+    on the platform item by `bulk_upload`
+    """
+
+    def __init__(self, dataset, filename: str, item_id: str = None, item_metadata: dict = None):
+        self.id = item_id if item_id is not None else _export_id()
+        self.dataset = dataset
+        self.dataset_id = dataset.id
+        self.dataset_url = None
+        self.filename = filename
+        self.name = os.path.basename(filename)
+        self.item_metadata = item_metadata if item_metadata is not None else dict()
+        mimetype = mimetypes.guess_type(self.name)[0] or "application/octet-stream"
+        self.metadata = dict(self.item_metadata)
+        self.metadata['system'] = dict(self.item_metadata.get('system', dict()), mimetype=mimetype)
+        self.mimetype = mimetype
+        self.fps = self.item_metadata.get('fps')
+        self.annotations = ExportAnnotations(item=self)
+        self._size = None
+        self._entity = None
+
+    @property
+    def local_path(self) -> str:
+        return os.path.join(self.dataset.path, "items", self.filename.lstrip('/'))
+
+    @property
+    def entity(self) -> dl.Item:
+        """
+        Offline `dl.Item` of the same ids, the annotations serialize with it.
+        """
+        if self._entity is None:
+            self._entity = dl.Item.from_json(_json={"id": self.id, "datasetId": self.dataset_id,
+                                                    "filename": self.filename, "name": self.name,
+                                                    "metadata": self.metadata},
+                                             client_api=dl.client_api, dataset=self.dataset.entity,
+                                             is_fetched=False)
+        return self._entity
+
+    def _image_size(self) -> (int, int):
+        if self._size is None:
+            self._size = (None, None)
+            if self.mimetype.startswith("image/"):
+                from PIL import Image
+
+                # Only the header is read, an image the platform can't decode has no size either
+                try:
+                    with Image.open(self.local_path) as image:
+                        self._size = image.size
+                except OSError:
+                    pass
+        return self._size
+
+    @property
+    def width(self):
+        return self._image_size()[0]
+
+    @property
+    def height(self):
+        return self._image_size()[1]
+
+    def download(self, save_locally: bool = True, local_path: str = None):
+        if not save_locally:
+            with open(self.local_path, 'rb') as f:
+                buffer = io.BytesIO(f.read())
+            buffer.name = self.name
+            return buffer
+        if local_path is None:
+            local_path = os.getcwd()
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, self.name)
+        shutil.copyfile(src=self.local_path, dst=local_path)
+        return local_path
+
+    def update(self, system_metadata: bool = False):
+        """
+        Keep the user metadata and the fps set on the item for the upload. The system metadata is the upload's,
+        or the one set on the item with `system_metadata`.
+        """
+        system = self.item_metadata.get('system')
+        if system_metadata:
+            system = {key: value for key, value in self.metadata.get('system', dict()).items() if key != 'mimetype'}
+        self.item_metadata = {key: value for key, value in self.metadata.items() if key != 'system'}
+        if system:
+            self.item_metadata['system'] = system
+        if self.fps is not None:
+            self.item_metadata['fps'] = self.fps
+        return self
+
+    def to_json(self) -> dict:
+        entry = {"id": self.id, "filename": self.filename}
+        if len(self.item_metadata) > 0:
+            entry["item_metadata"] = self.item_metadata
+        return entry
+
+
+class ExportPagedEntities:
+    def __init__(self, items: list, page_size: int):
+        self.items_count = len(items)
+        self._pages = [items[i:i + page_size] for i in range(0, len(items), page_size)]
+
+    def __iter__(self):
+        return iter(self._pages)
+
+    def all(self):
+        for page in self._pages:
+            for item in page:
+                yield item
+
+
+class ExportItems:
+    """
+    `dataset.items` of an `ExportDataset`: the uploads are written under "items/" at their remote filepath.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.by_filepath = dict()
+        self.by_id = dict()
+
+    def _add(self, item: ExportItem):
+        self.by_filepath[item.filename] = item
+        self.by_id[item.id] = item
+
+    def _write(self, source, item: ExportItem):
+        os.makedirs(name=os.path.dirname(item.local_path), exist_ok=True)
+        if isinstance(source, io.BytesIO):
+            with open(item.local_path, 'wb') as f:
+                f.write(source.getbuffer())
+        else:
+            shutil.copyfile(src=source, dst=item.local_path)
+
+    def upload(self, local_path, remote_path: str = '/', remote_name: str = None, overwrite: bool = False,
+               item_metadata: dict = None, raise_on_error: bool = False):
+        """
+        A local path, a named `io.BytesIO`, or a `pandas.DataFrame` of "local_path", "remote_path" and
+        "remote_name" rows. A failed write always raises, whatever `raise_on_error`.
+        """
+        if hasattr(local_path, 'iterrows'):
+            elements = [dict(row) for _, row in local_path.iterrows()]
+        else:
+            elements = [{"local_path": local_path, "remote_path": remote_path, "remote_name": remote_name}]
+
+        uploaded = list()
+        for element in elements:
+            source = element['local_path']
+            remote_name = element.get('remote_name') or os.path.basename(getattr(source, 'name', '') or source)
+            remote_filepath = f"{(element.get('remote_path') or '/').rstrip('/')}/{remote_name}"
+            with self.dataset.lock:
+                item = self.by_filepath.get(remote_filepath, None)
+                if item is not None and not overwrite:
+                    uploaded.append(item)
+                    continue
+                # Overwriting keeps the item id
+                item = ExportItem(dataset=self.dataset, filename=remote_filepath,
+                                  item_id=item.id if item is not None else None, item_metadata=item_metadata)
+            self._write(source=source, item=item)
+            with self.dataset.lock:
+                self._add(item=item)
+            uploaded.append(item)
+        return uploaded[0] if len(uploaded) == 1 else uploaded
+
+    def get(self, item_id: str = None, filepath: str = None) -> ExportItem:
+        item = self.by_id.get(item_id) if item_id is not None else self.by_filepath.get(filepath)
+        if item is None:
+            raise dl.exceptions.NotFound(status_code="404", message=f"Item not found: {item_id or filepath}")
+        return item
+
+    def list(self, filters: dl.Filters = None, page_size: int = 1000) -> ExportPagedEntities:
+        """
+        Filters on the item fields ("id", "filename", "dir"), by value or "$in" a list of values.
+        """
+        items = list(self.by_id.values())
+        if filters is not None:
+            for condition in filters.prepare().get('filter', dict()).get('$and', list()):
+                for field, value in condition.items():
+                    if field in ['hidden', 'type']:
+                        continue
+                    attribute = {'dir': lambda i: os.path.dirname(i.filename)}.get(field, lambda i: getattr(i, field))
+                    if isinstance(value, dict) and '$in' in value:
+                        values = set(value['$in'])
+                        items = [item for item in items if attribute(item) in values]
+                    else:
+                        items = [item for item in items if attribute(item) == value]
+        return ExportPagedEntities(items=items, page_size=page_size)
+
+
+class ExportRecipe:
+    def __init__(self, ontology: dict = None):
+        """
+        The recipe `_import_recipe_ontology` creates from `ontology`: its attribute keys by title.
+        """
+        attributes = (ontology or dict()).get('metadata', dict()).get('attributes', list())
+        instructions = [{"title": attribute.get('scriptData', dict()).get('title'), "body": {"key": attribute['key']}}
+                        for attribute in attributes]
+        self.metadata = {"system": {"script": {"entryPoints": {"annotation:context:set": {
+            "_instructions": [{"body": {"block": {"_instructions": instructions}}}]
+        }}}}}
+
+
+class ExportRecipes:
+    def __init__(self, ontology: dict = None):
+        self._recipes = [ExportRecipe(ontology=ontology)]
+
+    def list(self) -> list:
+        return self._recipes
+
+
+class ExportDataset:
+    """
+    Local stand-in for the `dl.Dataset` of an import: `LidarCustomParser.custom_parse_data` writes the items,
+    the annotations and the semantic reference items the platform would receive to a folder, without a single
+    platform call. `bulk_upload` pushes the folder to a dataset later.
+
+    The folder holds "items/" (every item at its remote filepath), "annotations/<item id>/" (the json of every
+    annotations upload call) and "index/<name>.json" (the item ids, filepaths and upload metadata). The items
+    reference each other by export ids, replaced by the platform ids on upload. Several exports, e.g. the
+    sequences of a `SequenceScheduler` run, can share a folder with distinct names. An export reopened with the
+    same name keeps its item ids, so the sync manifest of the previous export still applies.
+
+    Only the calls of the import and of `dtlpylidar`'s `parse_data` are implemented, with their exact parameters:
+    `items.upload`, `items.get`, `items.list` (by "id", "filename" or "dir"), `item.download`, `item.update`,
+    `item.annotations.builder`, `upload` and `delete`, and `recipes.list`. Any other call or parameter raises
+    a `TypeError` or an `AttributeError` instead of being ignored.
+
+    :param path: export folder
+    :param name: name of the export within the folder
+    :param ontology: ontology json of the dataset recipe, for the attribute keys of the annotations
+    """
+
+    def __init__(self, path: str, name: str = "export", ontology: dict = None):
+        self.path = os.path.abspath(path)
+        self.name = name
+        self.id = _export_id()
+        self.lock = threading.RLock()
+        self.items = ExportItems(dataset=self)
+        self.recipes = ExportRecipes(ontology=ontology)
+        self._entity = None
+        os.makedirs(name=os.path.join(self.path, "index"), exist_ok=True)
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.id = index['dataset_id']
+            for entry in index['items']:
+                self.items._add(item=ExportItem(dataset=self, filename=entry['filename'], item_id=entry['id'],
+                                                item_metadata=entry.get('item_metadata')))
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.path, "index", f"{self.name}.json")
+
+    @property
+    def entity(self) -> dl.Dataset:
+        """
+        Offline `dl.Dataset` of the same id, without labels.
+        """
+        with self.lock:
+            if self._entity is None:
+                entity = dl.Dataset.from_json(_json={"id": self.id, "name": self.name}, client_api=dl.client_api,
+                                              project=None, is_fetched=False)
+                entity._labels = list()
+                self._entity = entity
+        return self._entity
+
+    def save(self):
+        with self.lock:
+            index = {"dataset_id": self.id, "items": [item.to_json() for item in self.items.by_id.values()]}
+        with open(self.index_path, 'w') as f:
+            json.dump(index, f)
+
+    def report(self) -> dict:
+        items = list(self.items.by_id.values())
+        return {
+            "items": len(items),
+            "bytes": sum(os.path.getsize(item.local_path) for item in items if os.path.isfile(item.local_path)),
+            "annotation_files": sum(len(annotation_files(path=self.path, item_id=item.id)) for item in items)
+        }
+
+
+class RecordingItems:
+    """
+    Wraps a `dataset.items` repository, keeps the items every upload call returns by filepath.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.by_filepath = dict()
+        self._lock = threading.Lock()
+
+    def upload(self, *args, **kwargs):
+        uploaded = self.items.upload(*args, **kwargs)
+        uploaded = [uploaded] if hasattr(uploaded, 'filename') else list(uploaded or list())
+        with self._lock:
+            for item in uploaded:
+                self.by_filepath[item.filename] = item
+        return uploaded[0] if len(uploaded) == 1 else uploaded
+
+    def __getattr__(self, name):
+        return getattr(self.items, name)
+
+
+def load_export(path: str) -> (dict, set):
+    """
+    :return: the index entries of every export of the folder by filepath, and their dataset ids
+    """
+    entries = dict()
+    dataset_ids = set()
+    index_path = os.path.join(path, "index")
+    for filename in sorted(os.listdir(index_path)):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(index_path, filename), 'r') as f:
+            index = json.load(f)
+        dataset_ids.add(index['dataset_id'])
+        for entry in index['items']:
+            if entry['filename'] in entries:
+                logger.warning(msg=f"'{entry['filename']}' is in several exports, uploading the one of '{filename}'")
+            entries[entry['filename']] = entry
+    return entries, dataset_ids
+
+
+def bulk_upload(path: str, dataset: dl.Dataset, num_workers: int = 32, upload_options: dict = None,
+                annotation_options: dict = None) -> dict:
+    """
+    Upload an `ExportDataset` folder to `dataset`, the export ids replaced with the platform ids.
+
+    The items that reference no other item (the media, the mapping.json and the semantic reference items) go
+    first, in multi-file calls on `num_workers` workers. Then the items that do (the frames items and the sync
+    manifests), once the items they reference have their platform ids, with their upload metadata. Then the
+    annotations of every item, `num_workers` items at a time.
+
+    :param upload_options: `MediaUploader` options, over the `num_workers` default
+    :param annotation_options: `AnnotationUploader` options of each item
+    :return: counts, bytes and seconds of the upload, and the platform id of every export id
+    """
+    start = time.perf_counter()
+    entries, dataset_ids = load_export(path=path)
+    id_map = {dataset_id: dataset.id for dataset_id in dataset_ids}
+
+    def _local_path(entry: dict) -> str:
+        return os.path.join(path, "items", entry['filename'].lstrip('/'))
+
+    def _rewrite(text: str) -> str:
+        return EXPORT_ID_PATTERN.sub(lambda match: id_map.get(match.group(0), match.group(0)), text)
+
+    export_ids = {entry['id'] for entry in entries.values()}
+    references = dict()
+    for filepath, entry in entries.items():
+        references[filepath] = set()
+        if filepath.endswith(".json"):
+            with open(_local_path(entry=entry), 'r') as f:
+                references[filepath] = (set(EXPORT_ID_PATTERN.findall(f.read())) & export_ids) - {entry['id']}
+
+    items = RecordingItems(items=dataset.items)
+    options = dict(dict(num_workers=num_workers, batch_size=8, max_inflight_files=8 * num_workers),
+                   **(upload_options or dict()))
+    plain = [filepath for filepath, entry in entries.items()
+             if len(references[filepath]) == 0 and 'item_metadata' not in entry]
+    with MediaUploader(items_repository=items, **options) as uploader:
+        for filepath in plain:
+            uploader.submit(local_path=_local_path(entry=entries[filepath]),
+                            remote_path=os.path.dirname(filepath), remote_name=os.path.basename(filepath))
+    for filepath in plain:
+        id_map[entries[filepath]['id']] = items.by_filepath[filepath].id
+
+    def _upload_rewritten(filepath: str):
+        entry = entries[filepath]
+        with open(_local_path(entry=entry), 'r' if filepath.endswith(".json") else 'rb') as f:
+            data = f.read()
+        buffer = io.BytesIO(_rewrite(text=data).encode() if isinstance(data, str) else data)
+        buffer.name = os.path.basename(filepath)
+        with sdk_call(name="items.upload"):
+            item = items.upload(local_path=buffer, remote_path=os.path.dirname(filepath), overwrite=True,
+                                item_metadata=entry.get('item_metadata'))
+        id_map[entry['id']] = item.id
+
+    # Every round uploads the items all the references of which are uploaded
+    pending = [filepath for filepath in entries if filepath not in items.by_filepath]
+    while len(pending) > 0:
+        ready = [filepath for filepath in pending if references[filepath] <= id_map.keys()]
+        if len(ready) == 0:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Circular item references in the export: {pending[:5]}")
+        with StageExecutor(max_workers=num_workers) as executor:
+            for future in [executor.submit(_upload_rewritten, filepath) for filepath in ready]:
+                future.result()
+        pending = [filepath for filepath in pending if filepath not in ready]
+
+    annotation_uploader = AnnotationUploader(**(annotation_options if annotation_options is not None else dict()))
+    annotated = [(filepath, annotation_files(path=path, item_id=entry['id'])) for filepath, entry in entries.items()]
+    annotated = [(filepath, files) for filepath, files in annotated if len(files) > 0]
+
+    def _upload_annotations(filepath: str, files: list) -> int:
+        annotations = list()
+        for filename in files:
+            with open(filename, 'r') as f:
+                annotations.extend(json.loads(_rewrite(text=f.read())))
+        item = items.by_filepath[filepath]
+        filters = dl.Filters(resource=dl.FiltersResource.ANNOTATION, use_defaults=False)
+        with sdk_call(name="annotations.delete"):
+            item.annotations.delete(filters=filters)
+        annotation_uploader.upload(item=item, annotations=annotations)
+        return len(annotations)
+
+    with StageExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(_upload_annotations, filepath, files) for filepath, files in annotated]
+        num_annotations = sum(future.result() for future in futures)
+
+    report = {
+        "items": len(entries),
+        "bytes": sum(os.path.getsize(_local_path(entry=entry)) for entry in entries.values()),
+        "rewritten_items": len(entries) - len(plain),
+        "annotated_items": len(annotated),
+        "annotations": num_annotations,
+        "seconds": time.perf_counter() - start,
+        "ids": {export_id: item_id for export_id, item_id in id_map.items() if export_id in export_ids}
+    }
+    logger.info(msg=f"Uploaded the export '{path}': {report['items']} items ({report['bytes'] / 2 ** 20:.1f} MiB, "
+                    f"{report['rewritten_items']} with references), {report['annotations']} annotations of "
+                    f"{report['annotated_items']} items in {report['seconds']:.1f}s")
+    return report
+
+
+def main():
+    # The export and the bulk upload are command line only, they are not `dataloop.json` functions
+    parser = argparse.ArgumentParser(description="Convert OSDaR23 sequences to a local export folder, "
+                                                 "or upload an export folder to a dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="convert sequence archives, without the platform")
+    export.add_argument('sources', nargs='+', help="archive paths or URLs, one per sequence")
+    export.add_argument('--export-dir', required=True)
+    export.add_argument('--workers', type=int, default=None, help="worker processes, defaults to the cores")
+    export.add_argument('--options', type=json.loads, default=dict(),
+                        help="`DatasetLidarOSDAR` options as json, e.g. '{\"pcd_options\": {\"voxel_size\": 0.05}}'")
+    upload = commands.add_parser("upload", help="upload an export folder to a dataset")
+    upload.add_argument('export_dir')
+    upload.add_argument('--dataset-id', required=True)
+    upload.add_argument('--workers', type=int, default=32, help="concurrent upload calls")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from dataset_loader import DatasetLidarOSDAR
+
+    runner = DatasetLidarOSDAR()
+    if args.command == "export":
+        runner.__dict__.update(args.options)
+        runner.num_workers = args.workers
+        frames_items = runner.export_sequences(sources=args.sources, export_dir=args.export_dir)
+        print(json.dumps(frames_items, indent=2))
+    else:
+        report = runner.upload_export(dataset=dl.datasets.get(dataset_id=args.dataset_id),
+                                      export_dir=args.export_dir, num_workers=args.workers)
+        print(json.dumps({key: value for key, value in report.items() if key != 'ids'}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
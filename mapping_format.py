@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import tempfile
+from io import BytesIO
+
+# "frames": the intrinsics, extrinsics and distortion in every image of every frame, as dtlpylidar reads them.
+# "shared": once per camera in a "calibrations" table, the images reference it by "calibration" id
+MAPPING_FORMATS = ["frames", "shared"]
+SHARED_VERSION = 2
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def write_mapping(fp, frames, calibrations: dict = None) -> (str, int):
+    """
+    Write a mapping.json one frame at a time, the frames are never all in memory.
+
+    :param fp: binary file the mapping is written to
+    :param frames: iterable of the frame dicts, in lidar frame order
+    :param calibrations: calibration table of the "shared" format, by id, None for the "frames" format
+    :return: the digest and the size of the written mapping
+    """
+    sha256 = hashlib.sha256()
+    num_bytes = 0
+
+    def _write(text: str):
+        nonlocal num_bytes
+        data = text.encode()
+        fp.write(data)
+        sha256.update(data)
+        num_bytes += len(data)
+
+    if calibrations is not None:
+        _write(f'{{"version":{SHARED_VERSION},"calibrations":{_dumps(calibrations)},"frames":{{')
+    else:
+        _write('{"frames":{')
+    for lidar_frame, frame in enumerate(frames):
+        _write(f'{"," if lidar_frame > 0 else ""}"{lidar_frame}":{_dumps(frame)}')
+    _write('}}')
+    return f"sha256:{sha256.hexdigest()}", num_bytes
+
+
+def expand_mapping(mapping: dict) -> dict:
+    """
+    :return: the "frames" format of a mapping, the calibration of every image copied from the table of a "shared"
+    mapping. A "frames" mapping is returned as is
+    """
+    calibrations = mapping.get("calibrations")
+    if calibrations is None:
+        return mapping
+    frames = dict()
+    for lidar_frame, frame in mapping["frames"].items():
+        images = dict()
+        for idx, image in frame.get("images", dict()).items():
+            image = dict(image)
+            image.update(calibrations[image.pop("calibration")])
+            images[idx] = image
+        frames[lidar_frame] = dict(frame, images=images)
+    return {"frames": frames}
+
+
+class ExpandedMappingItem:
+    """
+    A mapping.json item as `LidarFileMappingParser.parse_data` reads it: the download of a "shared" mapping is
+    expanded to the "frames" format, everything else is the item's.
+    """
+
+    def __init__(self, item):
+        self._item = item
+
+    def __getattr__(self, name):
+        return getattr(self._item, name)
+
+    def download(self, save_locally: bool = True, local_path: str = None, **kwargs):
+        buffer = self._item.download(save_locally=False)
+        data = json.dumps(expand_mapping(mapping=json.load(buffer))).encode()
+        if not save_locally:
+            buffer = BytesIO(data)
+            buffer.name = self._item.name
+            return buffer
+        if local_path is None:
+            local_path = tempfile.mkdtemp(prefix="mapping_")
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, self._item.name)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        return local_path
@@ -0,0 +1,300 @@
+import os
+import logging
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from scene_archive import SceneArchive
+from scratch_window import ScratchWindow
+from media_uploader import MediaUploader
+from downloader import file_sha256
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class MediaPipeline:
+    """
+    Uploads the lidar and camera files of every frame of a scene to `items_repository`.
+
+    The files are read from `data_path`, streamed from `archive` or extracted to the `scratch` window frame by
+    frame, and released as soon as uploaded or read. The frames go by windows: the files of a window are
+    preprocessed, tiled and transcoded concurrently while the previous window uploads, then submitted to the
+    uploader in frame order. With a `manifest`, the files of an unchanged digest are skipped.
+
+    :param remote_root: remote folder of the sequence
+    :param cameras: camera sensors of every frame, the image of camera `idx` is uploaded as "frames/<frame>/<idx>"
+    :param pcd_preprocessor: `PcdPreprocessor` of the lidar files, uploaded unchanged if None
+    :param lod_tiler: `LodTiler` of the lidar files, no tiles if None
+    :param image_transcoder: `ImageTranscoder` of the camera images, uploaded unchanged if None. Its worker pool is
+    started and shut down by the caller
+    :param manifest: `SyncManifest` of the sequence, everything is uploaded if None
+    :param upload_options: `MediaUploader` options
+    """
+
+    def __init__(self,
+                 items_repository,
+                 data_path: str,
+                 remote_root: str,
+                 cameras: list,
+                 archive: SceneArchive = None,
+                 scratch: ScratchWindow = None,
+                 pcd_preprocessor=None,
+                 lod_tiler=None,
+                 image_transcoder=None,
+                 manifest=None,
+                 upload_options: dict = None):
+        self.data_path = data_path
+        self.remote_root = remote_root
+        self.cameras = cameras
+        self.archive = archive
+        self.scratch = scratch
+        self.pcd_preprocessor = pcd_preprocessor
+        self.lod_tiler = lod_tiler
+        self.image_transcoder = image_transcoder
+        self.manifest = manifest
+        # New index of every original point of the downsampled frames, by lidar frame
+        self.point_maps = dict()
+        self.uploader = MediaUploader(items_repository=items_repository,
+                                      on_uploaded=self._record if manifest is not None else None,
+                                      on_finished=self._release if scratch is not None else None,
+                                      **(upload_options if upload_options is not None else dict()))
+        # The lidar files only go through the workers when they are preprocessed or tiled
+        self.lidar_workers = max(pcd_preprocessor.num_workers if pcd_preprocessor is not None else 0,
+                                 lod_tiler.num_workers if lod_tiler is not None else 0)
+        self.window_size = max(2 * self.lidar_workers,
+                               2 * image_transcoder.num_workers if image_transcoder is not None else 1)
+        self._executor = None
+
+    # Sources and manifest
+
+    def source(self, uri: str):
+        """
+        :return: the path or the `BytesIO` of a sensor file
+        """
+        if self.scratch is not None:
+            return self.scratch.materialize(member=SceneArchive.member_name(uri=uri), flush=self.uploader.flush)
+        if self.archive is not None:
+            return self.archive.read_member(member=SceneArchive.member_name(uri=uri))
+        return os.path.join(self.data_path, uri[1:])
+
+    def digest(self, uri: str) -> str:
+        if self.scratch is not None:
+            return self.scratch.archive.member_digest(member=SceneArchive.member_name(uri=uri))
+        if self.archive is not None:
+            return self.archive.member_digest(member=SceneArchive.member_name(uri=uri))
+        return f"sha256:{file_sha256(filepath=os.path.join(self.data_path, uri[1:]))}"
+
+    def skip(self, remote_filepath: str, digest: str) -> bool:
+        return self.manifest is not None and self.manifest.skip(key=remote_filepath, digest=digest,
+                                                                calls=1 / self.uploader.batch_size)
+
+    def discard(self, uri: str):
+        # A skipped member of a remote archive is dropped from its prefetch
+        if self.archive is not None:
+            self.archive.discard(member=SceneArchive.member_name(uri=uri))
+
+    def submit(self, uri: str, remote_path: str, remote_name: str):
+        """
+        Upload a sensor file unchanged, unless the manifest has the same digest.
+        """
+        digest = self.digest(uri=uri) if self.manifest is not None else None
+        if self.skip(remote_filepath=f"{remote_path}/{remote_name}", digest=digest):
+            self.discard(uri=uri)
+            return
+        self.uploader.submit(local_path=self.source(uri=uri), remote_path=remote_path, remote_name=remote_name,
+                             digest=digest)
+
+    def _record(self, tasks: list):
+        for task in tasks:
+            self.manifest.record(key=task.remote_filepath, digest=task.digest, num_bytes=task.size)
+
+    def _release(self, tasks: list):
+        for task in tasks:
+            if isinstance(task.local_path, str):
+                self.scratch.release(filepath=task.local_path)
+
+    # Lidar and tiles
+
+    def process_lidar(self, lidar_frame: int, source, tile: bool) -> (BytesIO, list):
+        """
+        Preprocess and tile a lidar file, in a worker thread.
+
+        :return: the uploaded PCD and the `(path, bytes)` of its tiles
+        """
+        if isinstance(source, BytesIO):
+            data = source.getvalue()
+        else:
+            with open(source, 'rb') as f:
+                data = f.read()
+            if self.scratch is not None:
+                self.scratch.release(filepath=source)
+        if self.pcd_preprocessor is not None:
+            data, point_map = self.pcd_preprocessor.process(data=data)
+            if point_map is not None:
+                self.point_maps[lidar_frame] = point_map
+        # The tiles of the uploaded cloud, after the preprocessing
+        tiles = self.lod_tiler.process(data=data, path=f"lidar/{lidar_frame}.pcd") if tile else list()
+        buffer = BytesIO(data)
+        buffer.name = f"{lidar_frame}.pcd"
+        return buffer, tiles
+
+    def prepare_lidar(self, lidar_frame: int, frame) -> tuple:
+        """
+        Start the processing of the lidar file of a frame, unless its PCD, its tiles and its point map are all
+        unneeded.
+
+        :return: the future of `process_lidar`, the digests of the PCD and of the tiles and whether the PCD is
+        skipped, None if there is nothing to process
+        """
+        import raillabel
+
+        uri = frame.sensors['lidar'].uri
+        digest = self.digest(uri=uri) if self.manifest is not None else None
+        if digest is not None and self.pcd_preprocessor is not None:
+            digest = f"{digest}|{self.pcd_preprocessor.signature}"
+        skipped = self.skip(remote_filepath=f"{self.remote_root}/lidar/{lidar_frame}.pcd", digest=digest)
+        # The tiles are skipped with their index
+        lod_digest = f"{digest}|{self.lod_tiler.signature}" \
+            if digest is not None and self.lod_tiler is not None else None
+        tile = self.lod_tiler is not None and not self.skip(
+            remote_filepath=f"{self.remote_root}/lidar/{lidar_frame}.lod.json", digest=lod_digest
+        )
+        # The point map of a downsampled frame is needed for its Seg3d point ids
+        needs_point_map = self.pcd_preprocessor is not None and self.pcd_preprocessor.voxel_size is not None \
+            and any(isinstance(annotation, raillabel.format.Seg3d) for annotation in frame.annotations.values())
+        if skipped and not tile and not needs_point_map:
+            self.discard(uri=uri)
+            return None
+        future = self._executor.submit(self.process_lidar, lidar_frame, self.source(uri=uri), tile)
+        return future, digest, skipped, lod_digest
+
+    def upload_lidar(self, lidar_frame: int, frame, prepared: tuple = None):
+        """
+        Submit the PCD of a frame and its tiles, `prepared` by `prepare_lidar` if the lidar files are processed.
+        """
+        if self._executor is None:
+            self.submit(uri=frame.sensors['lidar'].uri, remote_path=f"{self.remote_root}/lidar",
+                        remote_name=f"{lidar_frame}.pcd")
+            return
+        if prepared is None:
+            return
+        future, digest, skipped, lod_digest = prepared
+        buffer, tiles = future.result()
+        if not skipped:
+            self.uploader.submit(local_path=buffer, remote_path=f"{self.remote_root}/lidar",
+                                 remote_name=f"{lidar_frame}.pcd", digest=digest)
+        self.upload_tiles(tiles=tiles, digest=lod_digest)
+
+    def upload_tiles(self, tiles: list, digest: str):
+        """
+        Submit the tiles of a frame, then their index, the last of `tiles`.
+        """
+        for tile_path, tile_data in tiles:
+            tile_buffer = BytesIO(tile_data)
+            tile_buffer.name = os.path.basename(tile_path)
+            self.uploader.submit(local_path=tile_buffer, remote_path=f"{self.remote_root}/{os.path.dirname(tile_path)}",
+                                 remote_name=tile_buffer.name, digest=digest)
+
+    # Images
+
+    def prepare_images(self, lidar_frame: int, frame) -> dict:
+        """
+        Start the transcoding of the camera images of a frame, but the unchanged ones.
+
+        :return: dict of camera index to the transcoding future, the digest, the remote name and the input bytes
+        """
+        transcoder = self.image_transcoder
+        prepared = dict()
+        for idx, camera in enumerate(self.cameras):
+            uri = frame.sensors[camera].uri
+            digest = f"{self.digest(uri=uri)}|{transcoder.signature}" if self.manifest is not None else None
+            remote_name = f"{idx}{transcoder.extension}"
+            if self.skip(remote_filepath=f"{self.remote_root}/frames/{lidar_frame}/{remote_name}", digest=digest):
+                self.discard(uri=uri)
+                continue
+            source = self.source(uri=uri)
+            input_bytes = source.getbuffer().nbytes if isinstance(source, BytesIO) else os.path.getsize(source)
+            future = transcoder.submit(source=source)
+            if self.scratch is not None:
+                # The worker process reads the image file itself
+                future.add_done_callback(lambda _, filepath=source: self.scratch.release(filepath=filepath))
+            prepared[idx] = (future, digest, remote_name, input_bytes)
+        return prepared
+
+    def upload_images(self, lidar_frame: int, frame, prepared: dict = None):
+        """
+        Submit the camera images of a frame, `prepared` by `prepare_images` if they are transcoded.
+        """
+        remote_path = f"{self.remote_root}/frames/{lidar_frame}"
+        for idx, camera in enumerate(self.cameras):
+            if self.image_transcoder is None:
+                uri = frame.sensors[camera].uri
+                self.submit(uri=uri, remote_path=remote_path, remote_name=f"{idx}{os.path.splitext(p=uri)[1]}")
+            elif idx in prepared:
+                future, digest, remote_name, input_bytes = prepared[idx]
+                buffer = self.image_transcoder.result(future=future, name=remote_name, input_bytes=input_bytes)
+                self.uploader.submit(local_path=buffer, remote_path=remote_path, remote_name=remote_name,
+                                     digest=digest)
+
+    # Frames
+
+    def run(self, frames: list, progress=None):
+        """
+        :param frames: the `(frame_num, frame)` of the scene, in lidar frame order
+        :return: the `UploadReport` of the uploader
+        """
+        total_lidar_frames = len(frames)
+        modulo_report = max(1, total_lidar_frames // 10)
+        if self.lidar_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.lidar_workers)
+        try:
+            with self.uploader:
+                for window_start in range(0, total_lidar_frames, self.window_size):
+                    window = list(enumerate(frames[window_start:window_start + self.window_size],
+                                            start=window_start))
+                    lidar_uploads = dict()
+                    image_uploads = dict()
+                    for lidar_frame, (_, frame) in window:
+                        if self._executor is not None:
+                            lidar_uploads[lidar_frame] = self.prepare_lidar(lidar_frame=lidar_frame, frame=frame)
+                        if self.image_transcoder is not None:
+                            image_uploads[lidar_frame] = self.prepare_images(lidar_frame=lidar_frame, frame=frame)
+
+                    for lidar_frame, (_, frame) in window:
+                        self.upload_lidar(lidar_frame=lidar_frame, frame=frame,
+                                          prepared=lidar_uploads.get(lidar_frame))
+                        self.upload_images(lidar_frame=lidar_frame, frame=frame,
+                                           prepared=image_uploads.get(lidar_frame))
+                        if self.manifest is not None:
+                            self.manifest.checkpoint()
+                        if progress is not None and (lidar_frame + 1) % modulo_report == 0:
+                            _progress = 40 + int(40 * ((lidar_frame + 1) / total_lidar_frames))
+                            progress.update(progress=_progress, message="Uploading source data...")
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self.log_reports()
+        return self.uploader.report
+
+    def log_reports(self):
+        if self.pcd_preprocessor is not None:
+            report = self.pcd_preprocessor.report()
+            logger.info(
+                msg=f"Preprocessed {report['files']} PCDs: {report['input_bytes']} -> {report['output_bytes']} bytes "
+                    f"({100 * report['size_ratio']:.1f}%), {report['input_points']} -> {report['output_points']} "
+                    f"points, {1000 * report['seconds_per_file']:.1f} ms per frame"
+            )
+        if self.lod_tiler is not None:
+            report = self.lod_tiler.report()
+            logger.info(
+                msg=f"Tiled {report['frames']} PCDs: {report['tiles']} LOD tiles, {report['output_bytes']} bytes, "
+                    f"index built at {report['index_points_per_sec'] / 1e6:.1f}M points/s, "
+                    f"{1000 * report['seconds_per_file']:.1f} ms per frame"
+            )
+        if self.image_transcoder is not None:
+            report = self.image_transcoder.report()
+            logger.info(
+                msg=f"Transcoded {report['images']} images to {self.image_transcoder.image_format}: "
+                    f"{report['input_bytes']} -> {report['output_bytes']} bytes, {report['saved_bytes']} bytes saved, "
+                    f"{report['images_per_sec']:.1f} images/s"
+            )
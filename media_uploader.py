@@ -0,0 +1,252 @@
+import dtlpy as dl
+import io
+import os
+import time
+import random
+import logging
+import threading
+
+from run_report import StageExecutor, sdk_call, add_bytes
+
+logger = logging.getLogger(name='osdar-dataset')
+
+# Errors that retrying the same request can't fix
+NON_RETRYABLE_EXCEPTIONS = (
+    dl.exceptions.Unauthorized,
+    dl.exceptions.Forbidden,
+    dl.exceptions.NotFound,
+    dl.exceptions.TokenExpired
+)
+
+
+class UploadTask:
+    def __init__(self, local_path, remote_path: str, remote_name: str, size: int = None, digest: str = None):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.remote_name = remote_name
+        self.digest = digest
+        if size is None:
+            if isinstance(local_path, io.BytesIO):
+                size = local_path.getbuffer().nbytes
+            else:
+                size = os.path.getsize(local_path)
+        self.size = size
+        self.duration = None
+        self.attempts = 0
+
+    @property
+    def remote_filepath(self):
+        return f"{self.remote_path.rstrip('/')}/{self.remote_name}"
+
+
+class UploadReport:
+    def __init__(self):
+        self.files = list()
+        self.failed = list()
+        self.calls = 0
+        self.retries = 0
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def total_bytes(self):
+        return sum(task.size for task in self.files)
+
+    @property
+    def wall_time(self):
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    def to_dict(self) -> dict:
+        wall_time = self.wall_time
+        return {
+            "files": len(self.files),
+            "failed": [task.remote_filepath for task in self.failed],
+            "bytes": self.total_bytes,
+            "calls": self.calls,
+            "retries": self.retries,
+            "wall_time": wall_time,
+            "files_per_sec": len(self.files) / wall_time if wall_time > 0 else 0.0,
+            "bytes_per_sec": self.total_bytes / wall_time if wall_time > 0 else 0.0,
+            "per_file": [
+                {
+                    "remote_filepath": task.remote_filepath,
+                    "bytes": task.size,
+                    "duration": task.duration,
+                    "bytes_per_sec": task.size / task.duration if task.duration else 0.0,
+                    "attempts": task.attempts
+                } for task in self.files
+            ]
+        }
+
+
+class MediaUploader:
+    """
+    Concurrent upload engine for the sequence media files.
+
+    Files are grouped into multi-file `items.upload` calls, which run on a worker pool.
+    `submit` blocks while the in-flight bytes or files are over their caps, so the caller can't
+    run ahead of the network and fill the memory with pending uploads.
+    `on_uploaded(tasks)` is called from the worker threads with the tasks of every successful call, and
+    `on_finished(tasks)` with the tasks of every call once their sources are no longer read, uploaded or failed.
+    """
+
+    def __init__(self,
+                 items_repository,
+                 num_workers: int = 8,
+                 batch_size: int = 4,
+                 max_inflight_bytes: int = 512 * 1024 * 1024,
+                 max_inflight_files: int = 64,
+                 max_retries: int = 3,
+                 backoff_factor: float = 1.0,
+                 overwrite: bool = True,
+                 on_uploaded=None,
+                 on_finished=None):
+        self.items_repository = items_repository
+        self.num_workers = max(1, num_workers)
+        self.batch_size = max(1, batch_size)
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_inflight_files = max(self.batch_size, max_inflight_files)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.overwrite = overwrite
+        self.on_uploaded = on_uploaded
+        self.on_finished = on_finished
+
+        self.report = UploadReport()
+        self._pending = list()
+        self._futures = list()
+        self._inflight_bytes = 0
+        self._inflight_files = 0
+        self._condition = threading.Condition()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.wait()
+        else:
+            self.shutdown()
+
+    def submit(self, local_path, remote_path: str, remote_name: str, size: int = None, digest: str = None):
+        task = UploadTask(local_path=local_path, remote_path=remote_path, remote_name=remote_name, size=size,
+                          digest=digest)
+        if self._executor is None:
+            self._executor = StageExecutor(max_workers=self.num_workers)
+            self.report.start_time = time.perf_counter()
+        self._pending.append(task)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        batch, self._pending = self._pending, list()
+        batch_bytes = sum(task.size for task in batch)
+        with self._condition:
+            # A single batch over the bytes cap is still let through once nothing else is in flight
+            while self._inflight_files > 0 and (
+                    self._inflight_bytes + batch_bytes > self.max_inflight_bytes or
+                    self._inflight_files + len(batch) > self.max_inflight_files):
+                self._condition.wait()
+            self._inflight_bytes += batch_bytes
+            self._inflight_files += len(batch)
+        self._futures.append(self._executor.submit(self._upload_batch, batch))
+
+    def wait(self) -> UploadReport:
+        self.flush()
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self.shutdown()
+        self.report.end_time = time.perf_counter()
+        if len(self.report.failed) > 0:
+            raise dl.exceptions.PlatformException(
+                error="400",
+                message=f"Failed to upload {len(self.report.failed)} files, "
+                        f"e.g: {[task.remote_filepath for task in self.report.failed[:5]]}"
+            )
+        report = self.report.to_dict()
+        logger.info(
+            msg=f"Uploaded {report['files']} files ({report['bytes'] / 2 ** 20:.1f} MiB) "
+                f"in {report['wall_time']:.1f}s with {report['calls']} calls: "
+                f"{report['files_per_sec']:.1f} files/s, {report['bytes_per_sec'] / 2 ** 20:.1f} MiB/s"
+        )
+        return self.report
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._futures = list()
+
+    def _call_upload(self, batch: list):
+        with self._condition:
+            self.report.calls += 1
+        if len(batch) == 1:
+            task = batch[0]
+            return self.items_repository.upload(
+                local_path=task.local_path,
+                remote_path=task.remote_path,
+                remote_name=task.remote_name,
+                overwrite=self.overwrite,
+                raise_on_error=True
+            )
+
+        import pandas
+        df = pandas.DataFrame([
+            {"local_path": task.local_path, "remote_path": task.remote_path, "remote_name": task.remote_name}
+            for task in batch
+        ])
+        return self.items_repository.upload(local_path=df, overwrite=self.overwrite, raise_on_error=True)
+
+    def _upload_batch(self, batch: list):
+        try:
+            for attempt in range(self.max_retries + 1):
+                for task in batch:
+                    task.attempts += 1
+                start = time.perf_counter()
+                try:
+                    with sdk_call(name="items.upload"):
+                        self._call_upload(batch=batch)
+                except NON_RETRYABLE_EXCEPTIONS:
+                    raise
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        logger.error(msg=f"Upload failed after {attempt + 1} attempts: {e}")
+                        with self._condition:
+                            self.report.failed.extend(batch)
+                        return
+                    with self._condition:
+                        self.report.retries += 1
+                    delay = self.backoff_factor * (2 ** attempt) * (1 + random.random())
+                    logger.warning(msg=f"Upload of {len(batch)} files failed ({e}), retrying in {delay:.1f}s")
+                    # Rewind in-memory sources consumed by the failed attempt
+                    for task in batch:
+                        if isinstance(task.local_path, io.BytesIO):
+                            task.local_path.seek(0)
+                    time.sleep(delay)
+                    continue
+
+                # Files of a multi-file call share the call duration
+                duration = time.perf_counter() - start
+                for task in batch:
+                    task.duration = duration
+                    logger.debug(msg=f"Uploaded '{task.remote_filepath}' ({task.size} bytes) in {duration:.2f}s")
+                with self._condition:
+                    self.report.files.extend(batch)
+                add_bytes(num_bytes=sum(task.size for task in batch))
+                if self.on_uploaded is not None:
+                    self.on_uploaded(batch)
+                return
+        finally:
+            with self._condition:
+                self._inflight_bytes -= sum(task.size for task in batch)
+                self._inflight_files -= len(batch)
+                self._condition.notify_all()
+            if self.on_finished is not None:
+                self.on_finished(batch)
@@ -0,0 +1,559 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+import numba
+
+import dtlpy as dl
+
+logger = logging.getLogger(name='osdar-dataset')
+
+DATA_FORMATS = ["ascii", "binary", "binary_compressed"]
+PCD_TYPES = {('F', 4): 'f4', ('F', 8): 'f8',
+             ('I', 1): 'i1', ('I', 2): 'i2', ('I', 4): 'i4', ('I', 8): 'i8',
+             ('U', 1): 'u1', ('U', 2): 'u2', ('U', 4): 'u4', ('U', 8): 'u8'}
+
+# LZF format limits: 13 bit back-reference offsets, lengths up to 7 + 255 + 2
+LZF_HASH_LOG = 14
+LZF_MAX_OFF = 1 << 13
+LZF_MAX_REF = (1 << 8) + (1 << 3)
+# Output bytes of a 3 bytes back-reference at most, bounds the decompressed size of valid data
+LZF_MAX_RATIO = -(-LZF_MAX_REF // 3)
+
+
+@numba.njit(nogil=True, cache=True)
+def _parse_ascii(data, num_values):
+    """
+    Parse whitespace separated decimal numbers, the values of an ascii PCD body.
+
+    The values are correctly rounded when the significant digits, leading zeros aside, fit a float64 mantissa and
+    the power of ten is exact. The positions of the other tokens are returned, to be parsed by `float`.
+    """
+    values = np.empty(num_values, dtype=np.float64)
+    fallback = np.empty(num_values, dtype=np.int64)
+    fallback_starts = np.empty(num_values, dtype=np.int64)
+    fallback_ends = np.empty(num_values, dtype=np.int64)
+    num_fallback = 0
+    n = len(data)
+    count = 0
+    i = 0
+    while i < n and count < num_values:
+        c = data[i]
+        # Skip separators
+        if c == 32 or c == 9 or c == 10 or c == 13:
+            i += 1
+            continue
+        start = i
+        negative = False
+        if c == 45 or c == 43:
+            negative = c == 45
+            i += 1
+        mantissa = 0
+        exponent = 0
+        # Significant digits, from the first non-zero one
+        digits = 0
+        has_digits = False
+        truncated = False
+        while i < n and data[i] == 48:
+            has_digits = True
+            i += 1
+        while i < n and 48 <= data[i] <= 57:
+            has_digits = True
+            if digits < 18:
+                mantissa = mantissa * 10 + (data[i] - 48)
+                digits += 1
+            else:
+                exponent += 1
+                truncated |= data[i] != 48
+            i += 1
+        if i < n and data[i] == 46:
+            i += 1
+            if digits == 0:
+                while i < n and data[i] == 48:
+                    has_digits = True
+                    exponent -= 1
+                    i += 1
+            while i < n and 48 <= data[i] <= 57:
+                has_digits = True
+                if digits < 18:
+                    mantissa = mantissa * 10 + (data[i] - 48)
+                    digits += 1
+                    exponent -= 1
+                else:
+                    truncated |= data[i] != 48
+                i += 1
+        if i < n and (data[i] == 101 or data[i] == 69):
+            i += 1
+            exponent_negative = False
+            if i < n and (data[i] == 45 or data[i] == 43):
+                exponent_negative = data[i] == 45
+                i += 1
+            e = 0
+            while i < n and 48 <= data[i] <= 57:
+                e = e * 10 + (data[i] - 48)
+                i += 1
+            exponent += -e if exponent_negative else e
+        # "nan", "inf" and the rest of a malformed token
+        while i < n and not (data[i] == 32 or data[i] == 9 or data[i] == 10 or data[i] == 13):
+            has_digits = False
+            i += 1
+        if has_digits and not truncated and mantissa < (1 << 53) and -22 <= exponent <= 22:
+            # Exact mantissa times or over an exact power of ten: correctly rounded
+            if exponent >= 0:
+                value = float(mantissa) * 10.0 ** exponent
+            else:
+                value = float(mantissa) / 10.0 ** (-exponent)
+            values[count] = -value if negative else value
+        else:
+            values[count] = np.nan
+            fallback[num_fallback] = count
+            fallback_starts[num_fallback] = start
+            fallback_ends[num_fallback] = i
+            num_fallback += 1
+        count += 1
+    return (values[:count], fallback[:num_fallback],
+            fallback_starts[:num_fallback], fallback_ends[:num_fallback])
+
+
+@numba.njit(nogil=True, cache=True)
+def _gather_tokens(data, starts, ends):
+    out = np.empty(np.sum(ends - starts) + len(starts), dtype=np.uint8)
+    op = 0
+    for k in range(len(starts)):
+        length = ends[k] - starts[k]
+        out[op:op + length] = data[starts[k]:ends[k]]
+        out[op + length] = 32
+        op += length + 1
+    return out
+
+
+def parse_ascii(body: np.ndarray, num_values: int) -> np.ndarray:
+    values, fallback, starts, ends = _parse_ascii(body, num_values)
+    if len(fallback) > 0:
+        # The remaining tokens go through strtod in a single call
+        tokens = _gather_tokens(body, starts, ends).tobytes()
+        try:
+            parsed = np.fromstring(tokens, dtype=np.float64, sep=' ')
+        except ValueError:
+            parsed = None
+        if parsed is not None and len(parsed) == len(fallback):
+            values[fallback] = parsed
+        else:
+            # A malformed token, one at a time
+            for index, start, end in zip(fallback.tolist(), starts.tolist(), ends.tolist()):
+                try:
+                    values[index] = float(body[start:end].tobytes())
+                except ValueError:
+                    values[index] = np.nan
+    return values
+
+
+@numba.njit(nogil=True, cache=True)
+def _lzf_compress(data):
+    n = len(data)
+    out = np.empty(n + n // 32 + 16, dtype=np.uint8)
+    table = np.full(1 << LZF_HASH_LOG, -1, dtype=np.int64)
+    op = 0
+    ip = 0
+    literal_start = 0
+    while ip < n - 2:
+        h = (np.int64(data[ip]) << 16) | (np.int64(data[ip + 1]) << 8) | np.int64(data[ip + 2])
+        slot = ((h >> (24 - LZF_HASH_LOG)) - h * 5) & ((1 << LZF_HASH_LOG) - 1)
+        ref = table[slot]
+        table[slot] = ip
+        if ref >= 0 and ip - ref - 1 < LZF_MAX_OFF and data[ref] == data[ip] and \
+                data[ref + 1] == data[ip + 1] and data[ref + 2] == data[ip + 2]:
+            # Literal runs of up to 32 bytes before the back-reference
+            while literal_start < ip:
+                run = min(32, ip - literal_start)
+                out[op] = run - 1
+                op += 1
+                out[op:op + run] = data[literal_start:literal_start + run]
+                op += run
+                literal_start += run
+            length = 3
+            max_length = min(LZF_MAX_REF, n - ip)
+            while length < max_length and data[ref + length] == data[ip + length]:
+                length += 1
+            offset = ip - ref - 1
+            encoded_length = length - 2
+            if encoded_length < 7:
+                out[op] = (encoded_length << 5) | (offset >> 8)
+                op += 1
+            else:
+                out[op] = (7 << 5) | (offset >> 8)
+                out[op + 1] = encoded_length - 7
+                op += 2
+            out[op] = offset & 0xff
+            op += 1
+            # Index the positions inside the match for the next references
+            end = ip + length
+            ip += 1
+            while ip < end and ip < n - 2:
+                h = (np.int64(data[ip]) << 16) | (np.int64(data[ip + 1]) << 8) | np.int64(data[ip + 2])
+                table[((h >> (24 - LZF_HASH_LOG)) - h * 5) & ((1 << LZF_HASH_LOG) - 1)] = ip
+                ip += 1
+            ip = end
+            literal_start = ip
+        else:
+            ip += 1
+    while literal_start < n:
+        run = min(32, n - literal_start)
+        out[op] = run - 1
+        op += 1
+        out[op:op + run] = data[literal_start:literal_start + run]
+        op += run
+        literal_start += run
+    return out[:op]
+
+
+@numba.njit(nogil=True, cache=True)
+def _lzf_decompress(data, size):
+    """
+    Every read of `data` and write of the output is checked first, corrupt data returns a short output instead of
+    reading or writing out of bounds.
+    """
+    out = np.empty(size, dtype=np.uint8)
+    ip = 0
+    op = 0
+    n = len(data)
+    while ip < n:
+        ctrl = np.int64(data[ip])
+        ip += 1
+        if ctrl < 32:
+            run = ctrl + 1
+            if op + run > size or ip + run > n:
+                return out[:0]
+            out[op:op + run] = data[ip:ip + run]
+            op += run
+            ip += run
+        else:
+            length = ctrl >> 5
+            ref = op - ((ctrl & 0x1f) << 8) - 1
+            if length == 7:
+                if ip >= n:
+                    return out[:0]
+                length += np.int64(data[ip])
+                ip += 1
+            if ip >= n:
+                return out[:0]
+            ref -= np.int64(data[ip])
+            ip += 1
+            length += 2
+            if ref < 0 or op + length > size:
+                return out[:0]
+            # Byte by byte, references may overlap the output
+            for k in range(length):
+                out[op + k] = out[ref + k]
+            op += length
+    return out[:op]
+
+
+@numba.njit(nogil=True, cache=True)
+def _voxel_keys(x, y, z, voxel_size):
+    n = len(x)
+    keys = np.empty(n, dtype=np.int64)
+    for i in range(n):
+        # 21 bits per axis, +/- 2^20 voxels around the origin
+        vx = np.int64(np.floor(x[i] / voxel_size)) + (1 << 20)
+        vy = np.int64(np.floor(y[i] / voxel_size)) + (1 << 20)
+        vz = np.int64(np.floor(z[i] / voxel_size)) + (1 << 20)
+        keys[i] = ((vx & 0x1fffff) << 42) | ((vy & 0x1fffff) << 21) | (vz & 0x1fffff)
+    return keys
+
+
+@numba.njit(nogil=True, cache=True)
+def _voxel_groups(keys, order):
+    """
+    :return: the index of the first point of every voxel and the voxel of every point
+    """
+    n = len(keys)
+    group_of = np.empty(n, dtype=np.int64)
+    first = np.empty(n, dtype=np.int64)
+    groups = 0
+    for k in range(n):
+        i = order[k]
+        if k == 0 or keys[i] != keys[order[k - 1]]:
+            first[groups] = i
+            groups += 1
+        group_of[i] = groups - 1
+    return first[:groups], group_of
+
+
+def voxel_downsample(x: np.ndarray, y: np.ndarray, z: np.ndarray, voxel_size: float) -> (np.ndarray, np.ndarray):
+    """
+    Keep the first point, in the original order, of every `voxel_size` voxel.
+
+    :return: the sorted original indices of the kept points, and the new index of every original point
+    """
+    keys = _voxel_keys(x, y, z, voxel_size)
+    # A stable sort puts the first point of a voxel first in its group
+    order = np.argsort(keys, kind='stable')
+    first, group_of = _voxel_groups(keys, order)
+    kept = np.sort(first)
+    # Kept points keep their relative order, group ids are renumbered to the kept points order
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    point_map = rank[group_of].astype(np.int32)
+    return kept, point_map
+
+
+class PcdPreprocessor:
+    """
+    Re-encodes the lidar PCD files before the upload: ascii to binary or binary_compressed (LZF),
+    drops unused fields and optionally voxel downsamples the points.
+
+    When points are dropped, `process` also returns the new index of every original point, so the
+    `Seg3d` point ids of the frame can be mapped onto the uploaded cloud.
+
+    :param data_format: output data format, one of `DATA_FORMATS`
+    :param keep_fields: fields to keep, all of them if None
+    :param voxel_size: voxel edge in meters, no downsampling if None
+    :param num_workers: number of files processed at the same time, defaults to the number of cores
+    """
+
+    def __init__(self, data_format: str = "binary_compressed", keep_fields: list = None, voxel_size: float = None,
+                 num_workers: int = None):
+        if data_format not in DATA_FORMATS:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Unsupported PCD data format: '{data_format}'")
+        if voxel_size is not None and voxel_size <= 0:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Invalid voxel size: {voxel_size}")
+        self.data_format = data_format
+        self.keep_fields = list(keep_fields) if keep_fields is not None else None
+        self.voxel_size = voxel_size
+        self.num_workers = max(1, num_workers or os.cpu_count() or 1)
+        self.files = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.input_points = 0
+        self.output_points = 0
+        self.process_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self) -> str:
+        """
+        Identifies the output of the preprocessing options, part of the sync manifest digests.
+        """
+        fields = ",".join(self.keep_fields) if self.keep_fields is not None else "*"
+        return f"pcd:{self.data_format}:{fields}:{self.voxel_size}"
+
+    @staticmethod
+    def read_header(data: bytes) -> (dict, int):
+        """
+        :return: the header entries, lower case keys to lists of values, and the offset of the body
+        """
+        header = dict()
+        offset = 0
+        while True:
+            end = data.find(b'\n', offset)
+            if end == -1:
+                raise dl.exceptions.BadRequest(status_code="400", message="Invalid PCD: missing DATA line")
+            line = data[offset:end].decode('ascii').strip()
+            offset = end + 1
+            if line == '' or line.startswith('#'):
+                continue
+            key, *values = line.split()
+            header[key.lower()] = values
+            if key.upper() == 'DATA':
+                return header, offset
+
+    @staticmethod
+    def header_dtype(header: dict) -> np.dtype:
+        counts = header.get('count', ['1'] * len(header['fields']))
+        fields = list()
+        for name, size, type_, count in zip(header['fields'], header['size'], header['type'], counts):
+            dtype = PCD_TYPES.get((type_.upper(), int(size)))
+            if dtype is None:
+                raise dl.exceptions.BadRequest(status_code="400",
+                                               message=f"Unsupported PCD field type: {type_}{size}")
+            fields.append((name, '<' + dtype) if int(count) == 1 else (name, '<' + dtype, (int(count),)))
+        return np.dtype(fields)
+
+    @classmethod
+    def read(cls, data: bytes) -> (dict, np.ndarray):
+        """
+        :return: the header and a structured array of the points
+        """
+        try:
+            header, offset = cls.read_header(data=data)
+            if len({len(header['fields']), len(header['size']), len(header['type']),
+                    len(header.get('count', header['fields']))}) != 1:
+                raise ValueError("FIELDS, SIZE, TYPE and COUNT lengths differ")
+            dtype = cls.header_dtype(header=header)
+            num_points = int(header['points'][0]) if 'points' in header else \
+                int(header['width'][0]) * int(header['height'][0])
+            data_format = header['data'][0].lower()
+        except (KeyError, IndexError, ValueError) as e:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Invalid PCD header: {e}")
+        if num_points < 0 or any(int(np.prod(dtype[name].shape or (1,))) < 1 for name in dtype.names):
+            raise dl.exceptions.BadRequest(status_code="400", message="Invalid PCD header: negative sizes")
+        body = np.frombuffer(data, dtype=np.uint8, offset=offset)
+
+        if data_format == 'ascii':
+            values_per_point = sum(int(np.prod(dtype[name].shape or (1,))) for name in dtype.names)
+            values = parse_ascii(body=body, num_values=num_points * values_per_point)
+            if len(values) != num_points * values_per_point:
+                raise dl.exceptions.BadRequest(status_code="400",
+                                               message=f"Invalid PCD: {len(values)} values, "
+                                                       f"expected {num_points * values_per_point}")
+            table = values.reshape(num_points, values_per_point)
+            points = np.empty(num_points, dtype=dtype)
+            column = 0
+            for name in dtype.names:
+                width = int(np.prod(dtype[name].shape or (1,)))
+                points[name] = table[:, column:column + width].reshape(points[name].shape)
+                column += width
+            return header, points
+
+        if data_format == 'binary':
+            if len(body) < num_points * dtype.itemsize:
+                raise dl.exceptions.BadRequest(status_code="400",
+                                               message=f"Invalid PCD: {len(body)} bytes of points, "
+                                                       f"expected {num_points * dtype.itemsize}")
+            return header, np.frombuffer(body, dtype=dtype, count=num_points).copy()
+
+        if data_format == 'binary_compressed':
+            if len(body) < 8:
+                raise dl.exceptions.BadRequest(status_code="400", message="Invalid PCD: missing LZF sizes")
+            compressed_size, size = np.frombuffer(body, dtype='<u4', count=2).astype(np.int64)
+            if compressed_size > len(body) - 8 or size != num_points * dtype.itemsize or \
+                    size > compressed_size * LZF_MAX_RATIO:
+                raise dl.exceptions.BadRequest(status_code="400",
+                                               message=f"Invalid PCD: LZF sizes {compressed_size} -> {size} "
+                                                       f"for {len(body) - 8} bytes of {num_points} points")
+            raw = _lzf_decompress(body[8:8 + compressed_size], size)
+            if len(raw) != size:
+                raise dl.exceptions.BadRequest(status_code="400", message="Invalid PCD: corrupted LZF data")
+            # Field-major layout: all the values of the first field, then the second field, ...
+            points = np.empty(num_points, dtype=dtype)
+            position = 0
+            for name in dtype.names:
+                field_bytes = dtype[name].itemsize * num_points
+                points[name] = np.frombuffer(raw[position:position + field_bytes].tobytes(),
+                                             dtype=dtype[name].base,
+                                             count=num_points * int(np.prod(dtype[name].shape or (1,)))
+                                             ).reshape(points[name].shape)
+                position += field_bytes
+            return header, points
+
+        raise dl.exceptions.BadRequest(status_code="400", message=f"Unsupported PCD data format: '{data_format}'")
+
+    @staticmethod
+    def write(points: np.ndarray, data_format: str = "binary_compressed", viewpoint: list = None) -> bytes:
+        dtype = points.dtype
+        sizes, types, counts = list(), list(), list()
+        for name in dtype.names:
+            base = dtype[name].base
+            sizes.append(str(base.itemsize))
+            types.append({'f': 'F', 'i': 'I', 'u': 'U'}[base.kind])
+            counts.append(str(int(np.prod(dtype[name].shape or (1,)))))
+        header = "\n".join([
+            "# .PCD v0.7 - Point Cloud Data file format",
+            "VERSION 0.7",
+            f"FIELDS {' '.join(dtype.names)}",
+            f"SIZE {' '.join(sizes)}",
+            f"TYPE {' '.join(types)}",
+            f"COUNT {' '.join(counts)}",
+            f"WIDTH {len(points)}",
+            "HEIGHT 1",
+            f"VIEWPOINT {' '.join(viewpoint) if viewpoint else '0 0 0 1 0 0 0'}",
+            f"POINTS {len(points)}",
+            f"DATA {data_format}",
+            ""
+        ]).encode('ascii')
+
+        if data_format == "ascii":
+            columns = [points[name].reshape(len(points), int(np.prod(dtype[name].shape or (1,))))
+                       for name in dtype.names]
+            table = np.hstack([column.astype(np.float64) for column in columns]) if columns else np.zeros((0, 0))
+            # Enough digits to read the same float32/float64 values back
+            formats = [({4: '%.9g', 8: '%.17g'}.get(dtype[name].base.itemsize, '%.9g')
+                        if dtype[name].base.kind == 'f' else '%d')
+                       for name in dtype.names for _ in range(int(np.prod(dtype[name].shape or (1,))))]
+            lines = "\n".join(" ".join(fmt % value for fmt, value in zip(formats, row)) for row in table)
+            return header + lines.encode('ascii') + b"\n"
+        if data_format == "binary":
+            packed = np.empty(len(points), dtype=np.dtype([(name, dtype[name]) for name in dtype.names]))
+            for name in dtype.names:
+                packed[name] = points[name]
+            return header + packed.tobytes()
+        raw = np.concatenate([np.ascontiguousarray(points[name]).view(np.uint8).ravel() for name in dtype.names]) \
+            if len(points) > 0 else np.zeros(0, dtype=np.uint8)
+        compressed = _lzf_compress(raw)
+        return header + np.array([len(compressed), len(raw)], dtype='<u4').tobytes() + compressed.tobytes()
+
+    def warmup(self, background: bool = False):
+        """
+        Compile the kernels of these options on a small ascii cloud, like the OSDaR23 lidar files.
+        The kernels are cached on disk, a warm up after the first one only loads them.
+
+        :param background: compile on a daemon thread, the kernel calls meanwhile wait for it
+        :return: the thread if `background`
+        """
+        if background:
+            thread = threading.Thread(target=self.warmup, name="pcd-warmup", daemon=True)
+            thread.start()
+            return thread
+        start = time.perf_counter()
+        points = np.zeros(shape=8, dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4'),
+                                          ('timestamp', '<f8'), ('sensor_index', '<u2')])
+        points['x'] = np.arange(8)
+        # Long timestamps take the fallback path of the ascii parser
+        points['timestamp'] = 1631441453.123456 + np.arange(8) * 1e-6
+        try:
+            self._convert(data=self.write(points=points, data_format="ascii"))
+        except Exception as e:
+            # The warm up is an optimization, the first file compiles whatever failed here
+            logger.warning(msg=f"PCD kernels warm up failed: {e}")
+            return None
+        logger.info(msg=f"PCD kernels ready in {time.perf_counter() - start:.2f}s")
+        return None
+
+    def _convert(self, data: bytes) -> (bytes, np.ndarray, int, int):
+        header, points = self.read(data=data)
+        num_points = len(points)
+        if self.keep_fields is not None:
+            missing = [name for name in self.keep_fields if name not in points.dtype.names]
+            if len(missing) > 0:
+                raise dl.exceptions.BadRequest(status_code="400", message=f"Missing PCD fields: {missing}")
+            points = points[self.keep_fields]
+
+        point_map = None
+        if self.voxel_size is not None:
+            kept, point_map = voxel_downsample(x=np.ascontiguousarray(points['x'], dtype=np.float64),
+                                               y=np.ascontiguousarray(points['y'], dtype=np.float64),
+                                               z=np.ascontiguousarray(points['z'], dtype=np.float64),
+                                               voxel_size=float(self.voxel_size))
+            points = points[kept]
+
+        output = self.write(points=points, data_format=self.data_format, viewpoint=header.get('viewpoint'))
+        return output, point_map, num_points, len(points)
+
+    def process(self, data: bytes) -> (bytes, np.ndarray):
+        """
+        :return: the re-encoded PCD and the new index of every original point, None if no point was dropped
+        """
+        start = time.perf_counter()
+        output, point_map, num_points, num_kept = self._convert(data=data)
+        with self._lock:
+            self.files += 1
+            self.input_bytes += len(data)
+            self.output_bytes += len(output)
+            self.input_points += num_points
+            self.output_points += num_kept
+            self.process_time += time.perf_counter() - start
+        return output, point_map
+
+    def report(self) -> dict:
+        return {
+            "files": self.files,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+            "size_ratio": self.output_bytes / self.input_bytes if self.input_bytes > 0 else 0.0,
+            "input_points": self.input_points,
+            "output_points": self.output_points,
+            "seconds_per_file": self.process_time / self.files if self.files > 0 else 0.0
+        }
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+
+import dtlpy as dl
+
+from pcd_preprocessor import DATA_FORMATS, PcdPreprocessor
+
+# 21 bits per axis fit a 63 bits Morton code
+MAX_DEPTH = 21
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    """
+    Insert two zero bits between the 21 low bits of every value.
+    """
+    v = values.astype(np.uint64) & np.uint64(0x1fffff)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_codes(cells: np.ndarray) -> np.ndarray:
+    """
+    :param cells: (N, 3) integer cell coordinates, up to `MAX_DEPTH` bits each
+    :return: the (N,) uint64 Morton codes, x in the highest bit of every octal digit
+    """
+    return (_spread_bits(cells[:, 0]) << np.uint64(2)) | (_spread_bits(cells[:, 1]) << np.uint64(1)) | \
+        _spread_bits(cells[:, 2])
+
+
+def _runs(keys: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    :return: start and end of every run of equal keys
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return starts, np.append(starts[1:], len(keys))
+
+
+class LodTiler:
+    """
+    Splits a lidar frame into level-of-detail tiles, so a viewer can show a coarse preview of the cloud first and fetch
+    the detail progressively.
+
+    The points are sorted along a Morton (Z-order) curve of an octree over the bounding cube of the frame. Level `l`
+    adds a point to every cell of a `base_resolution * 2^l` grid no coarser level has a point in, and the last level
+    holds all the remaining points: every point is in exactly one level, the levels up to `l` are a subsample of the
+    cloud with a point per occupied cell of the level `l` grid, and all of them are the whole cloud. The points of a
+    level are split into tiles by octree node at depth `min(l, tile_depth)`, each a contiguous run of the sorted points,
+    so the whole build is a sort and a few vectorized passes.
+
+    :param levels: number of levels, the last one is the full resolution remainder
+    :param base_resolution: cells per axis of the level 0 grid, a power of 2
+    :param tile_depth: octree depth of the finest tiles, up to 8^tile_depth tiles per level
+    :param data_format: PCD data format of the tiles, one of `DATA_FORMATS`
+    :param num_workers: number of frames tiled at the same time, defaults to the number of cores
+    """
+
+    def __init__(self, levels: int = 4, base_resolution: int = 64, tile_depth: int = 2,
+                 data_format: str = "binary_compressed", num_workers: int = None):
+        if data_format not in DATA_FORMATS:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Unsupported PCD data format: '{data_format}'")
+        if levels < 1 or base_resolution < 1 or base_resolution & (base_resolution - 1) != 0 or \
+                int(np.log2(base_resolution)) + levels - 1 > MAX_DEPTH:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Invalid LOD levels: {levels} levels from a "
+                                                   f"{base_resolution} cells grid")
+        if tile_depth < 0:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Invalid tile depth: {tile_depth}")
+        self.levels = levels
+        self.base_resolution = base_resolution
+        self.tile_depth = tile_depth
+        self.data_format = data_format
+        self.num_workers = max(1, num_workers or os.cpu_count() or 1)
+        self.depth = int(np.log2(base_resolution)) + levels - 1
+        self.frames = 0
+        self.points = 0
+        self.tiles = 0
+        self.output_bytes = 0
+        self.index_time = 0.0
+        self.process_time = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self) -> str:
+        """
+        Identifies the output of the tiling options, part of the sync manifest digests.
+        """
+        return f"lod:{self.levels}:{self.base_resolution}:{self.tile_depth}:{self.data_format}"
+
+    @staticmethod
+    def index_path(path: str) -> str:
+        """
+        :param path: path of the PCD, e.g. "lidar/0.pcd"
+        :return: path of its LOD index, e.g. "lidar/0.lod.json", the tiles are in the "lidar/0.lod" folder
+        """
+        return f"{os.path.splitext(path)[0]}.lod.json"
+
+    def warmup(self, background: bool = False):
+        """
+        Compile the PCD kernels the tiles are read and written with, see `PcdPreprocessor.warmup`.
+        """
+        return PcdPreprocessor(data_format=self.data_format).warmup(background=background)
+
+    def build(self, xyz: np.ndarray) -> (np.ndarray, list, np.ndarray, float):
+        """
+        :param xyz: (N, 3) positions of the points
+        :return: the order of the points, grouped by tile, the tiles in that order: `(level, node, start, end)`
+        dicts, the node an octal path from the root ("" for the root), and the min corner and edge of the cube
+        """
+        xyz = np.asarray(xyz, dtype=np.float64)
+        finite = np.isfinite(xyz).all(axis=1)
+        if finite.any():
+            low, high = xyz[finite].min(axis=0), xyz[finite].max(axis=0)
+        else:
+            low, high = np.zeros(3), np.zeros(3)
+        edge = max(float((high - low).max()), 1e-6)
+        cells_per_axis = 1 << self.depth
+        # Points with a non finite coordinate go to the first cell and the last level, they are kept but not placed
+        cells = np.where(finite[:, None], (xyz - low) * (cells_per_axis / edge), 0)
+        cells = np.clip(cells, 0, cells_per_axis - 1).astype(np.uint64)
+        codes = morton_codes(cells=cells)
+        # The order of the points of a cell doesn't matter, they share the same code
+        order = np.argsort(codes)
+        codes = codes[order]
+
+        # Level of every sorted point: the middle point of every cell of a level no coarser level has a point in
+        level_of = np.full(len(codes), self.levels - 1, dtype=np.int8)
+        taken = ~finite[order]
+        for level in range(self.levels - 1 if len(codes) > 0 else 0):
+            starts, ends = _runs(keys=codes >> np.uint64(3 * (self.levels - 1 - level)))
+            middle = ((starts + ends - 1) // 2)[~np.logical_or.reduceat(taken, starts)]
+            taken[middle] = True
+            level_of[middle] = level
+
+        # Grouped by level, still in Morton order within a level, then split by octree node
+        by_level = np.argsort(level_of, kind='stable')
+        order, codes, level_of = order[by_level], codes[by_level], level_of[by_level]
+        tiles = list()
+        level_starts, level_ends = _runs(keys=level_of)
+        for level_start, level_end in zip(level_starts.tolist(), level_ends.tolist()):
+            level = int(level_of[level_start])
+            node_depth = min(level, self.tile_depth)
+            nodes = codes[level_start:level_end] >> np.uint64(3 * (self.depth - node_depth))
+            starts, ends = _runs(keys=nodes)
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                node = np.base_repr(int(nodes[start]), base=8).zfill(node_depth) if node_depth > 0 else ""
+                tiles.append({"level": level, "node": node, "start": level_start + start, "end": level_start + end})
+        return order, tiles, low, edge
+
+    def process(self, data: bytes, path: str) -> list:
+        """
+        :param data: the PCD of a frame
+        :param path: path of the PCD, the paths of the index and of the tiles are relative to the same root
+        :return: the `(path, bytes)` of the tiles, then of the index
+        """
+        start = time.perf_counter()
+        header, points = PcdPreprocessor.read(data=data)
+        xyz = np.stack([points['x'], points['y'], points['z']], axis=1)
+        index_start = time.perf_counter()
+        order, tiles, low, edge = self.build(xyz=xyz)
+        index_time = time.perf_counter() - index_start
+
+        # The points of a tile in their scan order, the timestamps and rings compress better than in Morton order
+        for tile in tiles:
+            order[tile['start']:tile['end']].sort()
+        xyz = xyz[order]
+        points = points[order]
+        folder = os.path.splitext(path)[0] + ".lod"
+        outputs = list()
+        levels = [{"level": level, "spacing": None, "points": 0, "tiles": []} for level in range(self.levels)]
+        finite = np.isfinite(xyz).all(axis=1)
+        for tile in tiles:
+            tile_path = f"{folder}/{tile['level']}_{tile['node'] or 'r'}.pcd"
+            outputs.append((tile_path, PcdPreprocessor.write(points=points[tile['start']:tile['end']],
+                                                             data_format=self.data_format,
+                                                             viewpoint=header.get('viewpoint'))))
+            tile_xyz = xyz[tile['start']:tile['end']][finite[tile['start']:tile['end']]]
+            level = levels[tile['level']]
+            level['points'] += tile['end'] - tile['start']
+            level['tiles'].append({
+                "node": tile['node'],
+                "path": tile_path,
+                "points": tile['end'] - tile['start'],
+                "min": tile_xyz.min(axis=0).tolist() if len(tile_xyz) > 0 else None,
+                "max": tile_xyz.max(axis=0).tolist() if len(tile_xyz) > 0 else None
+            })
+
+        for level in levels:
+            level['spacing'] = edge / (self.base_resolution << level['level'])
+        index = {
+            "version": 1,
+            "path": path,
+            "points": len(points),
+            "min": low.tolist(),
+            "edge": edge,
+            "levels": levels
+        }
+        outputs.append((self.index_path(path=path), json.dumps(index).encode()))
+
+        with self._lock:
+            self.frames += 1
+            self.points += len(points)
+            self.tiles += len(tiles)
+            self.output_bytes += sum(len(output) for _, output in outputs)
+            self.index_time += index_time
+            self.process_time += time.perf_counter() - start
+        return outputs
+
+    def report(self) -> dict:
+        return {
+            "frames": self.frames,
+            "points": self.points,
+            "tiles": self.tiles,
+            "output_bytes": self.output_bytes,
+            "index_points_per_sec": self.points / self.index_time if self.index_time > 0 else 0.0,
+            "seconds_per_file": self.process_time / self.frames if self.frames > 0 else 0.0
+        }
@@ -0,0 +1,119 @@
+import zlib
+import json
+import base64
+import numpy as np
+
+# "json": plain list of ids, as RailLabel stores them
+# "delta": the sorted ids, delta-encoded as little-endian int32
+# "ranges": little-endian int32 (start, length) pairs of contiguous ids, duplicates are dropped
+# The int32 payloads are zlib compressed and base64 encoded
+# Only "json" items can be read by the platform viewer, the others need `decode_ref_item`
+ENCODINGS = ["json", "delta", "ranges"]
+
+
+def _to_base64(values: np.ndarray) -> str:
+    return base64.b64encode(zlib.compress(values.astype('<i4').tobytes(), 1)).decode('ascii')
+
+
+def _from_base64(data: str) -> np.ndarray:
+    return np.frombuffer(zlib.decompress(base64.b64decode(data)), dtype='<i4').astype(np.int64)
+
+
+def encode_point_ids(point_ids, encoding: str = "json"):
+    """
+    Encode the point ids of a single frame.
+
+    :param point_ids: iterable of non-negative int point ids
+    :param encoding: one of `ENCODINGS`
+    :return: json serializable encoded ids
+    """
+    if encoding == "json":
+        return list(point_ids)
+
+    ids = np.sort(np.asarray(point_ids, dtype=np.int64))
+    if encoding == "delta":
+        return _to_base64(values=np.diff(ids, prepend=0))
+    if encoding == "ranges":
+        if len(ids) == 0:
+            return _to_base64(values=ids)
+        ids = ids[np.concatenate(([True], np.diff(ids) != 0))]
+        breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+        starts = ids[np.concatenate(([0], breaks))]
+        ends = ids[np.concatenate((breaks - 1, [len(ids) - 1]))]
+        return _to_base64(values=np.stack([starts, ends - starts + 1], axis=1).ravel())
+    raise ValueError(f"Unsupported point ids encoding: '{encoding}', expected one of {ENCODINGS}")
+
+
+def decode_point_ids(data, encoding: str = "json") -> np.ndarray:
+    """
+    Decode the point ids of a single frame, encoded with `encode_point_ids`.
+
+    :return: int64 array of point ids, sorted unless the encoding is "json"
+    """
+    if encoding == "json":
+        return np.asarray(data, dtype=np.int64)
+    if encoding == "delta":
+        return np.cumsum(_from_base64(data=data))
+    if encoding == "ranges":
+        pairs = _from_base64(data=data).reshape(-1, 2)
+        if len(pairs) == 0:
+            return np.zeros(0, dtype=np.int64)
+        starts, lengths = pairs[:, 0], pairs[:, 1]
+        # Every id is its range start plus its offset within the range
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return np.repeat(starts, lengths) + offsets
+    raise ValueError(f"Unsupported point ids encoding: '{encoding}', expected one of {ENCODINGS}")
+
+
+def encode_ref_item(ref_item_json: dict, encoding: str = "json") -> dict:
+    """
+    Encode the frames of a semantic reference item, `{"type": "index", "frames": {frame: point_ids}}`.
+    The "json" encoding leaves the item unchanged, the others add an "encoding" key.
+    """
+    if encoding == "json":
+        return ref_item_json
+    encoded = {key: value for key, value in ref_item_json.items() if key != 'frames'}
+    encoded['encoding'] = encoding
+    encoded['frames'] = {frame: encode_point_ids(point_ids=point_ids, encoding=encoding)
+                         for frame, point_ids in ref_item_json.get('frames', dict()).items()}
+    return encoded
+
+
+def decode_ref_item(ref_item_json: dict) -> dict:
+    encoding = ref_item_json.get('encoding', "json")
+    decoded = {key: value for key, value in ref_item_json.items() if key not in ['frames', 'encoding']}
+    decoded['frames'] = {frame: decode_point_ids(data=data, encoding=encoding).tolist()
+                         for frame, data in ref_item_json.get('frames', dict()).items()}
+    return decoded
+
+
+def dump_ref_item(frames, fp, encoding: str = "json"):
+    """
+    Write a semantic reference item frame by frame, without holding all its frames in memory.
+    The bytes are those of `json.dumps(encode_ref_item(...), sort_keys=True)`, so their sha256 is the
+    `payload_digest` of the item.
+
+    :param frames: iterable of (frame key, point ids), sorted by the frame key as a string
+    :param fp: binary file the item is written to
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported point ids encoding: '{encoding}', expected one of {ENCODINGS}")
+    fp.write(b'{')
+    if encoding != "json":
+        fp.write(f'"encoding": {json.dumps(encoding)}, '.encode())
+    fp.write(b'"frames": {')
+    for i, (frame, point_ids) in enumerate(frames):
+        if encoding == "json":
+            point_ids = np.asarray(point_ids).tolist()
+        data = json.dumps(encode_point_ids(point_ids=point_ids, encoding=encoding))
+        fp.write(f'{", " if i > 0 else ""}{json.dumps(str(frame))}: {data}'.encode())
+    fp.write(b'}, "type": "index"}')
+
+
+def remap_point_ids(point_ids, point_map: np.ndarray) -> np.ndarray:
+    """
+    Map the point ids of the original cloud onto the downsampled one.
+    """
+    if point_map is None:
+        return np.asarray(point_ids, dtype=np.int64)
+    return np.unique(point_map[np.asarray(point_ids, dtype=np.int64)])
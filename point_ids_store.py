@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+
+
+class PointIdsStore:
+    """
+    Append-only, disk-backed point ids of the Seg3d annotations of a sequence.
+
+    The point ids of every (annotation, frame) are appended to a single int32 file as they are converted, and
+    only their offset and count stay in memory. Once the conversion is done, the ids are read back through
+    a memory map, one annotation at a time, so the peak memory of a sequence no longer depends on how many
+    points it segments: the pages of the map are dropped by the OS as needed.
+
+    :param path: folder of the point ids file, a temporary folder if None
+    """
+
+    def __init__(self, path: str = None):
+        if path is None:
+            path = tempfile.mkdtemp(prefix="point_ids_")
+        os.makedirs(name=path, exist_ok=True)
+        self.path = path
+        self.filepath = os.path.join(path, "point_ids.i32")
+        self.num_points = 0
+        # Offset and count of every segment, by annotation uid and frame
+        self._segments = dict()
+        self._file = open(self.filepath, 'wb')
+        self._map = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._segments)
+
+    def __contains__(self, uid: str):
+        return uid in self._segments
+
+    @property
+    def num_bytes(self):
+        return 4 * self.num_points
+
+    def uids(self) -> list:
+        """
+        Annotation uids, in the order they were first appended.
+        """
+        return list(self._segments)
+
+    def append(self, uid: str, frame: int, point_ids):
+        """
+        Append the point ids of an annotation in a frame, replacing the ones appended for the same frame.
+        """
+        values = np.asarray(point_ids, dtype='<i4')
+        with self._lock:
+            if self._map is not None:
+                raise RuntimeError("Point ids can't be appended once read")
+            self._file.write(values.tobytes())
+            self._segments.setdefault(uid, dict())[int(frame)] = (self.num_points, len(values))
+            self.num_points += len(values)
+
+    def frames(self, uid: str) -> list:
+        return sorted(self._segments[uid])
+
+    def read(self, uid: str, sort_key=None):
+        """
+        Yield the (frame, point ids) of an annotation, the ids are a read-only int32 view of the file.
+
+        :param sort_key: order of the frames, by frame number if None
+        """
+        with self._lock:
+            if self._map is None:
+                self._file.close()
+                # An empty file can't be mapped
+                self._map = np.memmap(self.filepath, dtype='<i4', mode='r') if self.num_points > 0 \
+                    else np.zeros(0, dtype='<i4')
+        segments = self._segments[uid]
+        for frame in sorted(segments, key=sort_key):
+            offset, count = segments[frame]
+            yield frame, self._map[offset:offset + count]
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            self._map = None
+            self._segments = dict()
+        shutil.rmtree(path=self.path, ignore_errors=True)
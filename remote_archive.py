@@ -0,0 +1,382 @@
+import dtlpy as dl
+import io
+import os
+import time
+import bisect
+import logging
+import requests
+import threading
+from zipfile import ZipFile
+from concurrent.futures import ThreadPoolExecutor
+
+from scene_archive import SceneArchive
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class _Block:
+    """
+    Byte range of the remote archive fetched by a single Range request, kept until every member overlapping it
+    is consumed.
+    """
+
+    def __init__(self, start: int, end: int, members: set, order: int):
+        self.start = start
+        self.end = end
+        self.members = members
+        self.order = order
+        self.future = None
+        self.dropped = False
+
+    @property
+    def size(self):
+        return self.end - self.start + 1
+
+
+class RangeReader(io.RawIOBase):
+    """
+    Seekable, read-only file over a remote file, served by HTTP Range requests.
+
+    Reads inside a planned block wait for its prefetch, every other read (e.g. the central directory parsed
+    by `ZipFile`) is a Range request of at least `min_read_size` bytes, the last one kept for the next reads.
+    Blocks are fetched on `num_connections` threads in their planned order, with at most `max_buffered_bytes`
+    fetched and not consumed yet. A block that is read before its turn is fetched right away.
+
+    :param url: remote file url
+    :param size: remote file size
+    """
+
+    def __init__(self, url: str, size: int, num_connections: int = 8, max_buffered_bytes: int = 256 * 1024 ** 2,
+                 min_read_size: int = 64 * 1024, max_retries: int = 5, backoff_factor: float = 1.0,
+                 timeout: float = 60):
+        super().__init__()
+        self.url = url
+        self.size = size
+        self.max_buffered_bytes = max_buffered_bytes
+        self.min_read_size = min_read_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.requests = 0
+        self.downloaded_bytes = 0
+        self.peak_buffered_bytes = 0
+        self._position = 0
+        # Last direct read, as (start, data)
+        self._last_read = (0, b'')
+        # Planned blocks sorted by start, the blocks not submitted yet in their planned order
+        self._blocks = list()
+        self._starts = list()
+        self._pending = list()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_connections))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self.size, self._position + size)
+        chunks = list()
+        while self._position < end:
+            chunk = self._read_at(start=self._position, end=end - 1)
+            chunks.append(chunk)
+            self._position += len(chunk)
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def _read_at(self, start: int, end: int) -> bytes:
+        block = self._find_block(position=start)
+        if block is not None:
+            data = self._result(block=block)
+            return data[start - block.start:min(end, block.end) - block.start + 1]
+        last_start, last_data = self._last_read
+        if not last_start <= start < last_start + len(last_data):
+            fetch_end = min(self.size - 1, max(end, start + self.min_read_size - 1))
+            with self._lock:
+                # Stop at the next planned block, it's read from its prefetch
+                index = bisect.bisect_right(self._starts, start)
+                if index < len(self._blocks):
+                    fetch_end = min(fetch_end, self._blocks[index].start - 1)
+            last_start, last_data = start, self._fetch(start=start, end=fetch_end)
+            self._last_read = (last_start, last_data)
+        return last_data[start - last_start:end - last_start + 1]
+
+    def read_tail(self, num_bytes: int):
+        """
+        Fetch the last `num_bytes` of the file in one request, for the end of central directory records and,
+        in small archives, the central directory itself.
+        """
+        start = max(0, self.size - num_bytes)
+        self._last_read = (start, self._fetch(start=start, end=self.size - 1))
+
+    def _find_block(self, position: int):
+        with self._lock:
+            index = bisect.bisect_right(self._starts, position) - 1
+            if index >= 0 and self._blocks[index].end >= position:
+                return self._blocks[index]
+        return None
+
+    def _result(self, block: _Block) -> bytes:
+        with self._lock:
+            if block.future is None:
+                # Read before its turn, e.g. a member outside the planned order
+                self._submit(block=block)
+        return block.future.result()
+
+    def _fetch(self, start: int, end: int) -> bytes:
+        for attempt in range(self.max_retries + 1):
+            try:
+                headers = {'Range': f"bytes={start}-{end}"}
+                with requests.get(self.url, headers=headers, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise dl.exceptions.PlatformException(
+                            error="400", message=f"Server ignored the Range request for '{self.url}'"
+                        )
+                    data = r.content
+                if len(data) != end - start + 1:
+                    raise requests.exceptions.ChunkedEncodingError(f"Range {start}-{end} ended early")
+                with self._lock:
+                    self.requests += 1
+                    self.downloaded_bytes += len(data)
+                return data
+            except requests.exceptions.RequestException as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_factor * (2 ** attempt)
+                logger.warning(msg=f"Range {start}-{end} of '{self.url}' failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def plan(self, blocks: list):
+        """
+        Queue blocks for the prefetch, in the order they are consumed.
+
+        :param blocks: list of `_Block`, not overlapping each other or the planned blocks
+        """
+        with self._lock:
+            for block in blocks:
+                index = bisect.bisect_right(self._starts, block.start)
+                self._starts.insert(index, block.start)
+                self._blocks.insert(index, block)
+            # Next block last, submitted and dropped blocks are skipped when they come up
+            self._pending.extend(blocks)
+            self._pending.sort(key=lambda b: b.order, reverse=True)
+            self._schedule()
+
+    def is_planned(self, start: int, end: int) -> bool:
+        """
+        Whether a planned block overlaps the byte range.
+        """
+        with self._lock:
+            index = bisect.bisect_right(self._starts, end) - 1
+            return index >= 0 and self._blocks[index].end >= start
+
+    def _submit(self, block: _Block):
+        # Called with the lock held
+        self._buffered_bytes += block.size
+        self.peak_buffered_bytes = max(self.peak_buffered_bytes, self._buffered_bytes)
+        block.future = self._executor.submit(self._fetch, block.start, block.end)
+
+    def _schedule(self):
+        # Called with the lock held
+        while len(self._pending) > 0:
+            block = self._pending[-1]
+            if block.future is not None or block.dropped:
+                self._pending.pop()
+                continue
+            if self._buffered_bytes > 0 and self._buffered_bytes + block.size > self.max_buffered_bytes:
+                break
+            self._pending.pop()
+            self._submit(block=block)
+
+    def consumed(self, member: str, blocks: list):
+        """
+        Mark a member as consumed, the blocks without any other member left are dropped.
+        """
+        with self._lock:
+            for block in blocks:
+                block.members.discard(member)
+                if len(block.members) > 0 or block.dropped:
+                    continue
+                block.dropped = True
+                index = bisect.bisect_left(self._starts, block.start)
+                if index < len(self._blocks) and self._blocks[index] is block:
+                    del self._starts[index]
+                    del self._blocks[index]
+                if block.future is not None:
+                    block.future.cancel()
+                    self._buffered_bytes -= block.size
+            self._schedule()
+
+    def close(self):
+        with self._lock:
+            for block in self._blocks:
+                if block.future is not None:
+                    block.future.cancel()
+            self._blocks, self._starts, self._pending = list(), list(), list()
+            self._buffered_bytes = 0
+        self._executor.shutdown(wait=True)
+        super().close()
+
+
+class RemoteSceneArchive(SceneArchive):
+    """
+    `SceneArchive` over a remote zip, read with HTTP Range requests instead of downloading the whole archive.
+
+    The central directory is read from the end of the file, so the members are listed without fetching any
+    of them. `prefetch` plans the byte ranges of the members the import needs: members closer than `max_gap`
+    bytes are coalesced into runs, split into blocks of up to `block_size` bytes that are fetched in parallel
+    ahead of their consumption. Reading a member waits only for its own blocks, so the upload of the first
+    frames starts while the next ones download. The archive can't be checked against a sha256, every member
+    is checked against its CRC-32 as it's read.
+
+    :param url: archive url, the server must support Range requests
+    :param num_connections: parallel Range requests
+    :param block_size: bytes per Range request of the prefetch
+    :param max_gap: bytes of unused members fetched to merge two ranges, instead of sending another request
+    :param max_buffered_bytes: prefetched bytes in memory at the same time
+    :param tail_size: bytes read from the end of the archive for its central directory
+    """
+
+    def __init__(self, url: str, num_connections: int = 8, block_size: int = 16 * 1024 ** 2,
+                 max_gap: int = 256 * 1024, max_buffered_bytes: int = 256 * 1024 ** 2, tail_size: int = 256 * 1024,
+                 timeout: float = 60):
+        self.zip_filepath = url
+        self.url = url
+        self.block_size = block_size
+        self.max_gap = max_gap
+        remote = self._probe(url=url, timeout=timeout)
+        self.reader = RangeReader(url=remote['url'], size=remote['size'], num_connections=num_connections,
+                                  max_buffered_bytes=max_buffered_bytes, timeout=timeout)
+        # The end of central directory records, the central directory too unless it's larger
+        self.reader.read_tail(num_bytes=tail_size)
+        self._zip_object = ZipFile(self.reader, 'r')
+        infos = self._zip_object.infolist()
+        self.members = {info.filename: info for info in infos if not info.is_dir()}
+        # Byte range of every member, local header included: up to the next member or the central directory
+        offsets = sorted(info.header_offset for info in infos) + [self._zip_object.start_dir]
+        self._ranges = dict()
+        for name, info in self.members.items():
+            index = bisect.bisect_right(offsets, info.header_offset)
+            self._ranges[name] = (info.header_offset, offsets[index] - 1)
+        # Blocks of every planned member
+        self._member_blocks = dict()
+        self._order = 0
+        self._plan_lock = threading.Lock()
+        self.extracted_bytes = 0
+        self.streamed_bytes = 0
+
+    @staticmethod
+    def _probe(url: str, timeout: float) -> dict:
+        r = requests.head(url, allow_redirects=True, timeout=timeout)
+        r.raise_for_status()
+        size = r.headers.get('Content-Length')
+        if size is None or r.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            raise dl.exceptions.BadRequest(
+                status_code="400",
+                message=f"'{url}' doesn't support Range requests, download the archive instead"
+            )
+        return {"url": r.url, "size": int(size)}
+
+    def close(self):
+        self._zip_object.close()
+        self.reader.close()
+
+    def prefetch(self, members: list):
+        """
+        Plan the members, in the order they are going to be read. Members already planned are ignored.
+        """
+        with self._plan_lock:
+            members = [member for member in dict.fromkeys(members) if member not in self._member_blocks]
+            if len(members) == 0:
+                return
+            order = {member: self._order + i for i, member in enumerate(members)}
+            self._order += len(members)
+
+            # Coalesce the members that are close in the archive into runs
+            runs = list()
+            for member in sorted(members, key=lambda m: self._ranges[m][0]):
+                start, end = self._ranges[member]
+                if len(runs) > 0 and start - runs[-1][1] - 1 <= self.max_gap and \
+                        not self.reader.is_planned(start=runs[-1][1] + 1, end=start - 1):
+                    runs[-1][1] = max(runs[-1][1], end)
+                    runs[-1][2].append(member)
+                else:
+                    runs.append([start, end, [member]])
+
+            blocks = list()
+            for start, end, run_members in runs:
+                run_blocks = [
+                    _Block(start=block_start, end=min(end, block_start + self.block_size - 1), members=set(), order=0)
+                    for block_start in range(start, end + 1, self.block_size)
+                ]
+                for member in run_members:
+                    member_start, member_end = self._ranges[member]
+                    member_blocks = [block for block in run_blocks
+                                     if block.start <= member_end and block.end >= member_start]
+                    for block in member_blocks:
+                        block.members.add(member)
+                    self._member_blocks[member] = member_blocks
+                # Blocks of the gap between two members only are not fetched
+                run_blocks = [block for block in run_blocks if len(block.members) > 0]
+                for block in run_blocks:
+                    # Fetched when the first of its members is due
+                    block.order = min(order[member] for member in block.members)
+                blocks.extend(run_blocks)
+            self.reader.plan(blocks=blocks)
+
+    def discard(self, member: str):
+        """
+        Drop a planned member that won't be read, e.g. an upload skipped as unchanged.
+        """
+        blocks = self._member_blocks.pop(member, None)
+        if blocks is not None:
+            self.reader.consumed(member=member, blocks=blocks)
+
+    def extract(self, members: list, path: str):
+        self.prefetch(members=members)
+        for member in members:
+            try:
+                super().extract(members=[member], path=path)
+            finally:
+                self.discard(member=member)
+
+    def read_member(self, member: str):
+        self.prefetch(members=[member])
+        try:
+            return super().read_member(member=member)
+        finally:
+            self.discard(member=member)
+
+    def report(self) -> dict:
+        report = super().report()
+        report.update({
+            "archive_bytes": self.reader.size,
+            "downloaded_bytes": self.reader.downloaded_bytes,
+            "requests": self.reader.requests,
+            "peak_buffered_bytes": self.reader.peak_buffered_bytes
+        })
+        return report
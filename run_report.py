@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import logging
+import datetime
+import threading
+import contextlib
+import contextvars
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(name='osdar-dataset')
+
+# Report the SDK calls of the running import go to, see `sdk_call`
+_active_report = None
+# Stage of the running thread, set by `RunReport.stage` and carried to the workers of a `StageExecutor`
+_current_stage = contextvars.ContextVar('run_report_stage', default=None)
+
+
+def _rss_bytes(field: str) -> int:
+    """
+    VmRSS / VmHWM of the process from /proc, 0 where unavailable.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def peak_rss() -> int:
+    value = _rss_bytes(field='VmHWM')
+    if value > 0:
+        return value
+    try:
+        import resource
+        # Kilobytes on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except ImportError:
+        return 0
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the peak RSS to the current RSS, so the peak of a stage can be measured (Linux only).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.bytes = 0
+        self.calls = dict()
+        self.peak_rss = 0
+        self.error = None
+
+    def to_dict(self) -> dict:
+        calls = dict()
+        for name, latencies in sorted(self.calls.items()):
+            latencies = np.asarray(latencies)
+            calls[name] = {
+                "count": len(latencies),
+                "total_time": float(latencies.sum()),
+                "p50": float(np.percentile(latencies, 50)),
+                "p90": float(np.percentile(latencies, 90)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max())
+            }
+        return {
+            "name": self.name,
+            "start": self.start,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "bytes": self.bytes,
+            "bytes_per_sec": self.bytes / self.wall_time if self.wall_time > 0 else 0.0,
+            "sdk_calls": sum(call['count'] for call in calls.values()),
+            "calls": calls,
+            "peak_rss": self.peak_rss,
+            "error": self.error
+        }
+
+
+class RunReport:
+    """
+    Wall time, CPU time, bytes moved, SDK calls with their latency percentiles and peak RSS of every
+    stage of an import, emitted as a json run report.
+
+    Stages may overlap, e.g. when run by a `StageGraph`. `sdk_call` records a call into the stage of its
+    thread, the workers of a `StageExecutor` inherit the stage that submitted them. Calls of other threads
+    go to the open stage while only one is open. The cpu time of a stage is the process cpu time while it
+    ran, so it includes the overlapping stages.
+    """
+
+    def __init__(self, name: str = "import"):
+        self.name = name
+        self.started_at = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+        self.stages = list()
+        self._open = list()
+        self._wall_start = None
+        self._cpu_start = None
+        self._wall_time = 0.0
+        self._cpu_time = 0.0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        global _active_report
+        stats = StageStats(name=name)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        with self._lock:
+            if self._wall_start is None:
+                self._wall_start, self._cpu_start = wall_start, cpu_start
+            # Where the peak can't be reset, the stage reports the peak of the process so far
+            if len(self._open) == 0:
+                reset_peak_rss()
+            stats.start = wall_start - self._wall_start
+            self.stages.append(stats)
+            self._open.append(stats)
+            _active_report = self
+        token = _current_stage.set(stats)
+        try:
+            yield stats
+        except Exception as e:
+            stats.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_stage.reset(token)
+            wall_end, cpu_end = time.perf_counter(), time.process_time()
+            stats.wall_time = wall_end - wall_start
+            stats.cpu_time = cpu_end - cpu_start
+            stats.peak_rss = peak_rss()
+            with self._lock:
+                self._open.remove(stats)
+                self._wall_time = max(self._wall_time, wall_end - self._wall_start)
+                self._cpu_time = max(self._cpu_time, cpu_end - self._cpu_start)
+                if len(self._open) == 0 and _active_report is self:
+                    _active_report = None
+            logger.info(msg=f"Stage '{name}': {stats.wall_time:.2f}s wall, {stats.cpu_time:.2f}s cpu, "
+                            f"{stats.bytes} bytes, {sum(len(v) for v in stats.calls.values())} SDK calls, "
+                            f"peak RSS {stats.peak_rss / 2 ** 20:.0f} MiB")
+
+    def _stage_stats(self) -> StageStats:
+        stats = _current_stage.get()
+        if stats is not None:
+            return stats
+        with self._lock:
+            return self._open[0] if len(self._open) == 1 else None
+
+    def add_bytes(self, num_bytes: int):
+        stats = self._stage_stats()
+        if stats is not None:
+            with self._lock:
+                stats.bytes += num_bytes
+
+    def record_call(self, name: str, latency: float):
+        stats = self._stage_stats()
+        if stats is not None:
+            with self._lock:
+                stats.calls.setdefault(name, list()).append(latency)
+
+    def to_dict(self) -> dict:
+        stages = [stats.to_dict() for stats in self.stages]
+        return {
+            "run": self.name,
+            "started_at": self.started_at,
+            "pid": os.getpid(),
+            "stages": stages,
+            "total": {
+                # From the start of the first stage to the end of the last one, overlaps counted once
+                "wall_time": self._wall_time,
+                "cpu_time": self._cpu_time,
+                "bytes": sum(stage['bytes'] for stage in stages),
+                "sdk_calls": sum(stage['sdk_calls'] for stage in stages),
+                "peak_rss": max([stage['peak_rss'] for stage in stages], default=0)
+            }
+        }
+
+    def save(self, filepath: str):
+        with open(filepath, 'w') as f:
+            json.dump(obj=self.to_dict(), fp=f, indent=2)
+
+
+@contextlib.contextmanager
+def sdk_call(name: str):
+    """
+    Time a Dataloop SDK call into the stage of the running import, if any.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report = _active_report
+        if report is not None:
+            report.record_call(name=name, latency=time.perf_counter() - start)
+
+
+def add_bytes(num_bytes: int):
+    """
+    Count bytes moved by the stage of the running import, if any.
+    """
+    report = _active_report
+    if report is not None:
+        report.add_bytes(num_bytes=num_bytes)
+
+
+class StageExecutor(ThreadPoolExecutor):
+    """
+    `ThreadPoolExecutor` whose tasks run in the run report stage of the submitting thread, so the SDK calls
+    of the workers count into that stage while other stages overlap it.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class RateLimitedLogger:
+    """
+    Emits at most one record per `interval` seconds for each key, the suppressed records are counted
+    into the next one. For per-item messages that would otherwise flood the log on large scenes.
+    """
+
+    def __init__(self, logger_: logging.Logger, interval: float = 5.0):
+        self.logger = logger_
+        self.interval = interval
+        self._last = dict()
+        self._suppressed = dict()
+        self._lock = threading.Lock()
+
+    def log(self, level: int, msg: str, key: str = None):
+        if not self.logger.isEnabledFor(level):
+            return
+        key = key if key is not None else msg
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -self.interval) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed > 0:
+            msg = f"{msg} ({suppressed} similar messages suppressed)"
+        self.logger.log(level, msg)
@@ -0,0 +1,119 @@
+import dtlpy as dl
+import os
+import shutil
+import logging
+from io import BytesIO
+from zipfile import ZipFile
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class SceneArchive:
+    """
+    Member-level access to an OSDaR sequence zip.
+
+    The scene json sits at the root of the archive and the sensor files are referenced by their uri,
+    relative to the root. This allows extracting, or reading straight into memory, only the members
+    of the enabled sensors, and skipping every other stream of the archive.
+    """
+
+    def __init__(self, zip_filepath: str):
+        self.zip_filepath = zip_filepath
+        self._zip_object = ZipFile(zip_filepath, 'r')
+        self.members = {info.filename: info for info in self._zip_object.infolist() if not info.is_dir()}
+        self.extracted_bytes = 0
+        self.streamed_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._zip_object.close()
+
+    @property
+    def total_bytes(self):
+        return sum(info.file_size for info in self.members.values())
+
+    def scene_members(self) -> list:
+        return sorted(name for name in self.members if '/' not in name and name.endswith('.json'))
+
+    @staticmethod
+    def member_name(uri: str) -> str:
+        return uri[1:] if uri.startswith('/') else uri
+
+    def sensor_members(self, scene, sensors: list) -> list:
+        members = list()
+        for frame in scene.frames.values():
+            for sensor in sensors:
+                sensor_reference = frame.sensors.get(sensor, None)
+                if sensor_reference is None or sensor_reference.uri is None:
+                    continue
+                member = self.member_name(uri=sensor_reference.uri)
+                if member not in self.members:
+                    raise dl.exceptions.NotFound(
+                        status_code="404",
+                        message=f"Sensor file '{member}' of '{sensor}' is missing from '{self.zip_filepath}'"
+                    )
+                members.append(member)
+        return members
+
+    @staticmethod
+    def target_path(member: str, path: str) -> str:
+        """
+        :return: the path a member is extracted to under `path`. A member that would land outside of `path`
+        (absolute, a drive or a ".." part) is rejected, like `ZipFile.extractall` drops them
+        """
+        parts = member.replace('\\', '/').split('/')
+        target_filepath = os.path.join(path, *parts)
+        root = os.path.realpath(path)
+        if os.path.isabs(member) or os.path.splitdrive(member)[0] or '..' in parts or \
+                os.path.commonpath([root, os.path.realpath(target_filepath)]) != root:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Unsafe archive member path: '{member}'")
+        return target_filepath
+
+    def extract(self, members: list, path: str):
+        for member in members:
+            info = self.members[member]
+            target_filepath = self.target_path(member=member, path=path)
+            os.makedirs(name=os.path.dirname(target_filepath), exist_ok=True)
+            with self._zip_object.open(info, 'r') as src, open(target_filepath, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
+            self.extracted_bytes += info.file_size
+
+    def prefetch(self, members: list):
+        """
+        Hint the members about to be read, in their order. The members of a local archive are read on demand.
+        """
+
+    def discard(self, member: str):
+        """
+        Hint that a member won't be read, e.g. an upload skipped as unchanged.
+        """
+
+    def member_digest(self, member: str) -> str:
+        """
+        Content digest of a member from its zip header, without reading the member.
+        """
+        info = self.members[member]
+        return f"crc32:{info.CRC:08x}:{info.file_size}"
+
+    def read_member(self, member: str) -> BytesIO:
+        info = self.members[member]
+        buffer = BytesIO(self._zip_object.read(info))
+        buffer.name = os.path.basename(member)
+        self.streamed_bytes += info.file_size
+        return buffer
+
+    def report(self) -> dict:
+        total_bytes = self.total_bytes
+        used_bytes = self.extracted_bytes + self.streamed_bytes
+        return {
+            "total_bytes": total_bytes,
+            "extracted_bytes": self.extracted_bytes,
+            "streamed_bytes": self.streamed_bytes,
+            "skipped_bytes": max(0, total_bytes - used_bytes),
+            "skipped_ratio": (1 - used_bytes / total_bytes) if total_bytes > 0 else 0.0
+        }
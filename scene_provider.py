@@ -0,0 +1,155 @@
+import dtlpy as dl
+import os
+import stat
+import gzip
+import pickle
+import hashlib
+import logging
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class SceneProvider:
+    """
+    Parses the RailLabel scene of an extracted OSDaR sequence once and shares it across all the parser stages.
+
+    With `enable_cache`, parsed scenes are also kept in an on-disk cache keyed by the content hash of the scene
+    json, so re-runs and retries on the same archive skip `raillabel.load` entirely. The cache holds pickles, it
+    is only read from a folder owned by the current user and not writable by anyone else, and the least recently
+    used scenes are evicted beyond `max_cache_bytes`. It is off by default: a service or batch import parses
+    every archive once, the cache only pays off for repeated local runs.
+
+    :param cache_dir: cache folder, `OSDAR_SCENE_CACHE_DIR` or "~/.cache/osdar23/scenes" if None
+    :param enable_cache: read and write the on-disk cache
+    :param max_cache_bytes: bytes of cached scenes kept on disk
+    """
+    hash_chunk_size = 8 * 1024 * 1024
+
+    def __init__(self, cache_dir: str = None, enable_cache: bool = False, max_cache_bytes: int = 2 * 1024 ** 3):
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                'OSDAR_SCENE_CACHE_DIR',
+                os.path.join(os.path.expanduser('~'), '.cache', 'osdar23', 'scenes')
+            )
+        self.cache_dir = cache_dir
+        self.enable_cache = enable_cache
+        self.max_cache_bytes = max_cache_bytes
+        self._scenes = dict()
+
+    @staticmethod
+    def find_scene_jsons(data_path: str) -> list:
+        dir_items = sorted(os.listdir(path=data_path))
+        return [os.path.join(data_path, dir_item) for dir_item in dir_items
+                if dir_item.endswith(".json") and dir_item != "mapping.json"]
+
+    @classmethod
+    def content_hash(cls, filepath: str) -> str:
+        import raillabel
+
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.hash_chunk_size), b''):
+                sha.update(chunk)
+        # Invalidate cached scenes whenever the raillabel data model changes
+        sha.update(str(getattr(raillabel, '__version__', '')).encode())
+        return sha.hexdigest()
+
+    def _cache_filepath(self, scene_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{scene_hash}.pkl.gz")
+
+    @staticmethod
+    def _trusted(path: str) -> bool:
+        """
+        Owned by the current user and not writable by the group or the others, so no one else can plant a pickle.
+        """
+        info = os.stat(path)
+        return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def _load_from_cache(self, scene_hash: str):
+        cache_filepath = self._cache_filepath(scene_hash=scene_hash)
+        if not os.path.isfile(cache_filepath):
+            return None
+        if not (self._trusted(path=self.cache_dir) and self._trusted(path=cache_filepath)):
+            logger.warning(msg=f"Ignoring scene cache file '{cache_filepath}', its folder or the file is writable "
+                               f"by other users")
+            return None
+        try:
+            with gzip.open(cache_filepath, 'rb') as f:
+                scene = pickle.load(f)
+            # Most recently used, for the eviction
+            os.utime(cache_filepath)
+            return scene
+        except Exception as e:
+            logger.warning(msg=f"Ignoring corrupted scene cache file '{cache_filepath}': {e}")
+            return None
+
+    def _save_to_cache(self, scene_hash: str, scene):
+        cache_filepath = self._cache_filepath(scene_hash=scene_hash)
+        tmp_filepath = f"{cache_filepath}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(name=self.cache_dir, mode=0o700, exist_ok=True)
+            with gzip.open(tmp_filepath, 'wb', compresslevel=1) as f:
+                pickle.dump(scene, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.chmod(tmp_filepath, 0o600)
+            os.replace(tmp_filepath, cache_filepath)
+        except Exception as e:
+            logger.warning(msg=f"Failed to write scene cache file '{cache_filepath}': {e}")
+            if os.path.exists(tmp_filepath):
+                os.remove(tmp_filepath)
+            return
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used cache files beyond `max_cache_bytes`.
+        """
+        try:
+            entries = list()
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith(".pkl.gz"):
+                    info = os.stat(os.path.join(self.cache_dir, filename))
+                    entries.append((info.st_mtime, info.st_size, filename))
+            total_bytes = sum(size for _, size, _ in entries)
+            for _, size, filename in sorted(entries):
+                if total_bytes <= self.max_cache_bytes:
+                    break
+                os.remove(os.path.join(self.cache_dir, filename))
+                total_bytes -= size
+                logger.debug(msg=f"Evicted scene cache file '{filename}'")
+        except OSError as e:
+            logger.warning(msg=f"Failed to evict the scene cache: {e}")
+
+    def load_scene(self, scene_filepath: str):
+        import raillabel
+
+        scene_hash = None
+        if self.enable_cache:
+            scene_hash = self.content_hash(filepath=scene_filepath)
+            scene = self._load_from_cache(scene_hash=scene_hash)
+            if scene is not None:
+                logger.info(msg=f"Loaded scene '{scene_filepath}' from cache")
+                return scene
+
+        scene = raillabel.load(scene_filepath)
+        if self.enable_cache:
+            self._save_to_cache(scene_hash=scene_hash, scene=scene)
+        return scene
+
+    def get_scene(self, data_path: str):
+        if data_path not in self._scenes:
+            for scene_filepath in self.find_scene_jsons(data_path=data_path):
+                try:
+                    self._scenes[data_path] = self.load_scene(scene_filepath=scene_filepath)
+                    break
+                except Exception as e:
+                    logger.debug(msg=f"Skipping '{scene_filepath}', not a supported 'raillabel' json: {e}")
+                    continue
+            else:
+                raise dl.exceptions.NotFound(status_code="404", message="Couldn't find supported json for 'raillabel'")
+        return self._scenes[data_path]
+
+    def release(self, data_path: str = None):
+        if data_path is None:
+            self._scenes.clear()
+        else:
+            self._scenes.pop(data_path, None)
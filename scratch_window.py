@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+import threading
+
+from scene_archive import SceneArchive
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class ScratchWindow:
+    """
+    Sliding window of sensor files extracted from a `SceneArchive` into a scratch folder, within a byte budget.
+
+    `materialize` extracts a member once the bytes on disk plus the member fit in `budget_bytes`, and blocks
+    otherwise until earlier files are released. Every extracted file is released once by its consumer and
+    deleted right away. The frames are materialized in order, so the folder holds a window of consecutive
+    frames and its peak size depends on the budget, not on the sequence length.
+    A single member larger than the budget is let through once the window is empty.
+
+    :param archive: the opened sequence archive
+    :param path: scratch folder the members are extracted to
+    :param budget_bytes: bytes of extracted members on disk at the same time
+    """
+
+    def __init__(self, archive: SceneArchive, path: str, budget_bytes: int):
+        self.archive = archive
+        self.path = path
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.peak_bytes = 0
+        self.files = 0
+        self.wait_time = 0.0
+        # Size of every extracted file not released yet, by filepath
+        self._sizes = dict()
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _fits(self, num_bytes: int) -> bool:
+        return self.used_bytes == 0 or self.used_bytes + num_bytes <= self.budget_bytes
+
+    def materialize(self, member: str, flush=None) -> str:
+        """
+        Extract `member` to the scratch folder.
+
+        :param flush: called once before waiting for the budget, to hand over the files held by the caller
+        (e.g. the pending batch of a `MediaUploader`), otherwise their release could wait for this call
+        :return: filepath of the extracted member, to `release` once consumed
+        """
+        num_bytes = self.archive.members[member].file_size
+        # Rejected before any of the budget is reserved
+        filepath = SceneArchive.target_path(member=member, path=self.path)
+        with self._condition:
+            fits = self._fits(num_bytes=num_bytes)
+        if not fits and flush is not None:
+            flush()
+        with self._condition:
+            start = time.perf_counter()
+            while not self._fits(num_bytes=num_bytes):
+                self._condition.wait()
+            self.wait_time += time.perf_counter() - start
+            self.used_bytes += num_bytes
+            self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+            self.files += 1
+        try:
+            self.archive.extract(members=[member], path=self.path)
+        except Exception:
+            self._free(filepath=filepath, num_bytes=num_bytes)
+            raise
+        with self._condition:
+            self._sizes[filepath] = num_bytes
+        return filepath
+
+    def release(self, filepath: str):
+        """
+        Delete an extracted file and free its bytes. Paths that are not in the window are ignored.
+        """
+        with self._condition:
+            num_bytes = self._sizes.pop(filepath, None)
+        if num_bytes is not None:
+            self._free(filepath=filepath, num_bytes=num_bytes)
+
+    def _free(self, filepath: str, num_bytes: int):
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+        with self._condition:
+            self.used_bytes -= num_bytes
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Delete the files that were never released, e.g. after a failed upload.
+        """
+        with self._condition:
+            filepaths = list(self._sizes)
+        for filepath in filepaths:
+            self.release(filepath=filepath)
+
+    def report(self) -> dict:
+        return {
+            "budget_bytes": self.budget_bytes,
+            "peak_bytes": self.peak_bytes,
+            "files": self.files,
+            "wait_time": self.wait_time
+        }
@@ -0,0 +1,179 @@
+import os
+import time
+import queue
+import logging
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import dtlpy as dl
+
+logger = logging.getLogger(name='osdar-dataset')
+
+# Cores of a `SequenceScheduler` worker process, None outside of the workers
+_worker_cpu_count = None
+
+
+def sequence_name(source: str) -> str:
+    """
+    Name of a sequence from its archive path or URL, e.g. ".../1_calibration_1.2.zip" -> "1_calibration_1.2".
+    """
+    basename = os.path.basename(urlparse(source).path if '://' in source else source)
+    return os.path.splitext(basename)[0]
+
+
+def cpu_share() -> int:
+    """
+    Cores the process pools of the current process should use: the cores of the machine, or its share of them
+    in a `SequenceScheduler` worker, so the pools of the sequences running side by side don't multiply.
+    """
+    return _worker_cpu_count or os.cpu_count() or 1
+
+
+def _init_worker(cpu_count: int):
+    global _worker_cpu_count
+    _worker_cpu_count = cpu_count
+
+
+class ResourceLimits:
+    """
+    Limits shared by all the worker processes of a `SequenceScheduler`.
+
+    :param manager: `multiprocessing.Manager` owning the shared primitives
+    :param max_downloads: number of archives downloaded at the same time
+    :param max_disk_bytes: bytes of extracted sequence data on disk at the same time
+    """
+
+    def __init__(self, manager, max_downloads: int = 2, max_disk_bytes: int = 100 * 1024 ** 3):
+        self.max_disk_bytes = max_disk_bytes
+        self._downloads = manager.BoundedSemaphore(max_downloads)
+        self._disk_condition = manager.Condition()
+        self._disk_used = manager.Value('q', 0)
+
+    @contextlib.contextmanager
+    def network(self):
+        with self._downloads:
+            yield
+
+    @contextlib.contextmanager
+    def disk(self, num_bytes: int):
+        """
+        Reserve `num_bytes` of the disk budget. A single reservation larger than the budget is granted once
+        nothing else is reserved, so an oversized sequence does not block forever.
+        """
+        with self._disk_condition:
+            while self._disk_used.value > 0 and self._disk_used.value + num_bytes > self.max_disk_bytes:
+                self._disk_condition.wait()
+            self._disk_used.value += num_bytes
+        try:
+            yield
+        finally:
+            with self._disk_condition:
+                self._disk_used.value -= num_bytes
+                self._disk_condition.notify_all()
+
+
+class SequenceProgress:
+    """
+    Stand-in for `dl.Progress` inside a worker process, forwards the updates of one sequence to the scheduler.
+    """
+
+    def __init__(self, updates, name: str):
+        self.updates = updates
+        self.name = name
+
+    def update(self, progress: int = None, message: str = None, **kwargs):
+        self.updates.put((self.name, progress, message))
+
+
+class SequenceScheduler:
+    """
+    Runs the ingestion of several sequences on a process pool.
+
+    `target(source, limits, progress)` must be a picklable module level callable (or a `functools.partial`
+    of one). It runs in a worker process, uses `limits` around its downloads and extractions and reports
+    its 0-100 progress to `progress`. The per-sequence progress is averaged into the single `dl.Progress`.
+
+    :param num_workers: number of worker processes, defaults to the number of cores
+    :param max_downloads: number of archives downloaded at the same time
+    :param max_disk_bytes: bytes of extracted sequence data on disk at the same time
+    """
+
+    def __init__(self, num_workers: int = None, max_downloads: int = 2, max_disk_bytes: int = 100 * 1024 ** 3):
+        self.num_workers = max(1, num_workers or os.cpu_count() or 1)
+        self.max_downloads = max(1, max_downloads)
+        self.max_disk_bytes = max_disk_bytes
+
+    @staticmethod
+    def _report_progress(updates, names: list, progress: dl.Progress, stop: threading.Event):
+        sequences_progress = {name: 0 for name in names}
+        reported = -1
+        while not stop.is_set() or not updates.empty():
+            try:
+                name, value, message = updates.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if value is None:
+                continue
+            sequences_progress[name] = value
+            total = int(sum(sequences_progress.values()) / len(sequences_progress))
+            if progress is not None and total != reported:
+                reported = total
+                progress.update(progress=total, message=f"{name}: {message}")
+
+    def run(self, sources: list, target, progress: dl.Progress = None) -> dict:
+        """
+        :param sources: archive paths or URLs, one per sequence
+        :return: dict of sequence name to the `target` result
+        """
+        names = [sequence_name(source=source) for source in sources]
+        if len(set(names)) != len(names):
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Duplicated sequence names: {names}")
+
+        context = multiprocessing.get_context("spawn")
+        results = dict()
+        errors = dict()
+        start = time.perf_counter()
+        with context.Manager() as manager:
+            limits = ResourceLimits(manager=manager,
+                                    max_downloads=self.max_downloads,
+                                    max_disk_bytes=self.max_disk_bytes)
+            updates = manager.Queue()
+            stop = threading.Event()
+            reporter = threading.Thread(target=self._report_progress,
+                                        kwargs=dict(updates=updates, names=names, progress=progress, stop=stop),
+                                        daemon=True)
+            reporter.start()
+            try:
+                num_workers = min(self.num_workers, len(sources))
+                with ProcessPoolExecutor(max_workers=num_workers,
+                                         mp_context=context,
+                                         initializer=_init_worker,
+                                         initargs=(max(1, (os.cpu_count() or 1) // num_workers),)) as executor:
+                    futures = {
+                        executor.submit(target, source, limits, SequenceProgress(updates=updates, name=name)): name
+                        for source, name in zip(sources, names)
+                    }
+                    for future in as_completed(futures):
+                        name = futures[future]
+                        try:
+                            results[name] = future.result()
+                            updates.put((name, 100, "Done"))
+                            logger.info(msg=f"Sequence '{name}' done")
+                        except Exception as e:
+                            logger.error(msg=f"Sequence '{name}' failed: {e}")
+                            errors[name] = e
+            finally:
+                stop.set()
+                reporter.join()
+
+        logger.info(msg=f"Ingested {len(results)}/{len(sources)} sequences in {time.perf_counter() - start:.1f}s")
+        if len(errors) > 0:
+            raise dl.exceptions.PlatformException(
+                error="400",
+                message=f"Failed to ingest {len(errors)} sequences: "
+                        f"{ {name: str(e) for name, e in errors.items()} }"
+            )
+        return results
@@ -0,0 +1,87 @@
+import logging
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import dtlpy as dl
+
+from run_report import RunReport, StageExecutor
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+class Stage:
+    def __init__(self, name: str, fn, dependencies: list):
+        self.name = name
+        self.fn = fn
+        self.dependencies = dependencies
+
+
+class StageGraph:
+    """
+    The stages of an import as a dependency graph.
+
+    Every stage starts on its own thread as soon as all its dependencies are done, so the CPU-bound
+    conversions overlap the network-bound uploads and the wall time tends to the longest path of the graph
+    instead of the sum of the stages. `fn(results)` of a stage gets the results of the finished stages by name.
+    Once a stage fails no other stage starts, the running ones are waited for and the first error is raised.
+
+    :param run_report: each stage is timed as a stage of this report, if given
+    :param max_workers: stages running at the same time, 1 runs them one after the other in the order added
+    """
+
+    def __init__(self, run_report: RunReport = None, max_workers: int = None):
+        self.run_report = run_report
+        self.max_workers = max_workers
+        self.stages = dict()
+
+    def add(self, name: str, fn, dependencies: list = None):
+        """
+        Add a stage. Its dependencies must be added first, so the graph can't have cycles.
+        """
+        dependencies = list(dependencies) if dependencies is not None else list()
+        if name in self.stages:
+            raise dl.exceptions.BadRequest(status_code="400", message=f"Duplicated stage: '{name}'")
+        missing = [dependency for dependency in dependencies if dependency not in self.stages]
+        if len(missing) > 0:
+            raise dl.exceptions.BadRequest(status_code="400",
+                                           message=f"Stage '{name}' depends on unknown stages: {missing}")
+        self.stages[name] = Stage(name=name, fn=fn, dependencies=dependencies)
+
+    def _run_stage(self, stage: Stage, results: dict):
+        if self.run_report is None:
+            return stage.fn(results)
+        with self.run_report.stage(name=stage.name):
+            return stage.fn(results)
+
+    def run(self) -> dict:
+        """
+        :return: dict of stage name to the result of its `fn`
+        """
+        results = dict()
+        pending = dict(self.stages)
+        running = dict()
+        error = None
+        max_workers = max(1, self.max_workers if self.max_workers is not None else len(self.stages))
+        with StageExecutor(max_workers=max_workers) as executor:
+            while True:
+                if error is None:
+                    for name, stage in list(pending.items()):
+                        if len(running) >= max_workers:
+                            break
+                        if all(dependency in results for dependency in stage.dependencies):
+                            running[executor.submit(self._run_stage, stage, dict(results))] = name
+                            del pending[name]
+                if len(running) == 0:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.error(msg=f"Stage '{name}' failed: {e}")
+                        error = error if error is not None else e
+        if error is not None:
+            if len(pending) > 0:
+                logger.warning(msg=f"Stages not started after the failure: {list(pending)}")
+            raise error
+        return results
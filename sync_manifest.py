@@ -0,0 +1,173 @@
+import json
+import time
+import posixpath
+import hashlib
+import logging
+import threading
+from io import BytesIO
+
+import dtlpy as dl
+
+from run_report import sdk_call
+
+logger = logging.getLogger(name='osdar-dataset')
+
+
+def payload_digest(payload) -> (str, int):
+    """
+    Digest of a json serializable payload (mapping, annotations, ref items), independent of the dict order.
+
+    :return: the digest and the size of the serialized payload
+    """
+    data = json.dumps(payload, sort_keys=True, default=str).encode()
+    return f"sha256:{hashlib.sha256(data).hexdigest()}", len(data)
+
+
+class SyncManifest:
+    """
+    Content digests of everything an import uploaded to a dataset, stored as a hidden json item next to
+    the sequence. A re-run compares the digest of each file or payload to the manifest and skips the
+    unchanged ones, so a re-import after a partial failure or a small label fix only uploads what changed.
+
+    Entries are keyed by the remote filepath for media files and by a payload key
+    (e.g. "annotations/<item id>") for the rest, `{"digest": ..., "bytes": ..., "item_id": ...}`.
+    The entries of files deleted from the dataset since are dropped on `load`, so they're uploaded again.
+
+    An interrupted import resumes file by file from the last checkpoint, not from the last completed frame:
+    the frames are uploaded out of order by the worker pools, so there is no single completed frame to resume from.
+
+    :param dataset: dl.Dataset the sequence is imported to
+    :param remote_root: remote folder of the sequence
+    :param checkpoint_interval: minimum seconds between two saves of the manifest during the import
+    """
+
+    def __init__(self, dataset: dl.Dataset, remote_root: str = "", checkpoint_interval: float = 30.0):
+        self.dataset = dataset
+        self.remote_path = f"{remote_root.rstrip('/')}/.dataloop/sync"
+        self.remote_name = "manifest.json"
+        self.checkpoint_interval = checkpoint_interval
+        self.entries = dict()
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.skipped_calls = 0
+        self.recorded_files = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def remote_filepath(self):
+        return f"{self.remote_path}/{self.remote_name}"
+
+    def load(self):
+        try:
+            with sdk_call(name="items.get"):
+                item = self.dataset.items.get(filepath=self.remote_filepath)
+        except dl.exceptions.NotFound:
+            logger.info(msg=f"No sync manifest at '{self.remote_filepath}', importing everything")
+            return self
+        with sdk_call(name="item.download"):
+            buffer = item.download(save_locally=False)
+        self.entries = json.load(buffer).get('entries', dict())
+        logger.info(msg=f"Loaded sync manifest with {len(self.entries)} entries")
+        self.verify()
+        return self
+
+    def verify(self, chunk_size: int = 100):
+        """
+        Drop the entries of the remote files that are no longer in the dataset. The files are listed by folder,
+        `chunk_size` folders per `items.list` query, instead of one call per file.
+        """
+        folders = dict()
+        for key in self.entries:
+            if key.startswith('/'):
+                folders.setdefault(posixpath.dirname(key), list()).append(key)
+
+        filepaths = set()
+        names = list(folders)
+        for i in range(0, len(names), chunk_size):
+            filters = dl.Filters(field='dir', values=names[i:i + chunk_size], operator=dl.FiltersOperations.IN,
+                                 use_defaults=False)
+            filters.add(field='type', values='file')
+            with sdk_call(name="items.list"):
+                pages = self.dataset.items.list(filters=filters)
+            filepaths.update(item.filename for item in pages.all())
+
+        missing = [key for keys in folders.values() for key in keys if key not in filepaths]
+        if len(missing) > 0:
+            logger.warning(msg=f"{len(missing)} files of the sync manifest were deleted from the dataset, "
+                               f"uploading them again, e.g. '{missing[0]}'")
+            with self._lock:
+                for key in missing:
+                    del self.entries[key]
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            buffer = BytesIO(json.dumps({"entries": self.entries}).encode())
+            self._dirty = False
+            self._last_save = time.monotonic()
+        buffer.name = self.remote_name
+        with sdk_call(name="items.upload"):
+            self.dataset.items.upload(local_path=buffer, remote_path=self.remote_path, overwrite=True)
+
+    def checkpoint(self):
+        """
+        Save the manifest if `checkpoint_interval` passed since the last save, so an interrupted import
+        resumes from the last uploaded files.
+        """
+        if time.monotonic() - self._last_save >= self.checkpoint_interval:
+            self.save()
+
+    def get(self, key: str, digest: str) -> dict:
+        """
+        :return: the entry of `key` if it was uploaded with the same `digest`, None otherwise
+        """
+        entry = self.entries.get(key, None)
+        if entry is None or entry.get('digest') != digest:
+            return None
+        return entry
+
+    def skip(self, key: str, digest: str, calls: float = 1) -> bool:
+        """
+        Whether the upload of `key` can be skipped, counts the skipped bytes and calls if so.
+        """
+        entry = self.get(key=key, digest=digest)
+        if entry is None:
+            return False
+        with self._lock:
+            self.skipped_files += 1
+            self.skipped_bytes += entry.get('bytes', 0)
+            self.skipped_calls += calls
+        return True
+
+    def record(self, key: str, digest: str, num_bytes: int = 0, item_id: str = None):
+        entry = {"digest": digest, "bytes": num_bytes}
+        if item_id is not None:
+            entry['item_id'] = item_id
+        with self._lock:
+            self.entries[key] = entry
+            self.recorded_files += 1
+            self._dirty = True
+
+    def discard(self, prefix: str):
+        """
+        Remove the entries of the keys starting with `prefix`.
+        """
+        with self._lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                del self.entries[key]
+            if len(keys) > 0:
+                self._dirty = True
+
+    def report(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "recorded": self.recorded_files,
+            "skipped_files": self.skipped_files,
+            "skipped_bytes": self.skipped_bytes,
+            "skipped_calls": int(round(self.skipped_calls))
+        }